@@ -0,0 +1,284 @@
+import copy
+import io
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pytz
+import requests
+from requests.adapters import HTTPAdapter
+
+import grocery_shopping.llm_backends as llm_backends
+
+
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(__file__), "fixtures")
+VARIANTS = ["bio", "mały", "duży", "light", "premium", "eko", "rodzinny", "świeży"]
+BRANDS = ["Frisco Fresh", "Mlekovita", "Łowicz", "Sokołów", "Tymbark", "Pudliszki", "Kupiec", "Bakalland"]
+HOSTS = ["www.frisco.pl", "commerce.frisco.pl", "api.notion.com", "api.todoist.com", "hook.eu1.make.com"]
+WEBHOOK_URL = "https://hook.eu1.make.com/benchmark"
+CHOICE_DATABASE_ID = "00000000-0000-0000-0000-000000000003"
+
+
+def load_fixture(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIRECTORY, name), encoding="utf-8") as file:
+        return json.load(file)
+
+
+def synthetic_grocery_names(size: int) -> List[str]:
+    names = load_fixture("grocery_names.json")
+    return [
+        names[index % len(names)] if index < len(names) else f"{names[index % len(names)]} {VARIANTS[(index // len(names) - 1) % len(VARIANTS)]}"
+        for index in range(size)
+    ]
+
+
+def product_ids(query: str, count: int) -> List[str]:
+    seed = zlib.crc32(query.encode("utf-8")) % 1000000
+    return [f"{seed}{index:02d}" for index in range(count)]
+
+
+class ReplayServices(HTTPAdapter):
+    def __init__(self, grocery_names: List[str], latency: float = 0.0, results_per_search: int = 12, history: float = 0.0):
+        super().__init__()
+        self.grocery_names = grocery_names
+        self.latency = latency
+        self.results_per_search = results_per_search
+        self.lock = threading.Lock()
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.task_ids = itertools.count(1)
+        self.cart: Dict[str, int] = {}
+        self.reservations: List[Dict[str, Any]] = []
+        self.search_product = load_fixture("frisco_search_product.json")
+        self.delivery_window = load_fixture("frisco_delivery_window.json")
+        self.ingredients = [self._ingredient(index, name) for index, name in enumerate(grocery_names)]
+        # a share of the items was bought before, always as the first search result
+        self.choices = [self._choice(name) for name in grocery_names[:int(len(grocery_names) * history)]]
+        self.feed_body = self._feed_body()
+        self.routes: List[Tuple[str, str, Callable[..., Tuple[int, Any]]]] = [
+            ("POST", r"/app/commerce/connect/token$", self._token),
+            ("GET", r"/app/commerce/api/v1/users/\w+/addresses/shipping-addresses$", self._shipping_addresses),
+            ("POST", r"/app/commerce/api/v2/users/\w+/calendar/Van/(\d+)/(\d+)/(\d+)$", self._calendar),
+            ("POST", r"/app/commerce/api/v2/users/\w+/cart/reservation$", self._reservation),
+            ("GET", r"/app/commerce/api/v1/users/\w+/offer/products/query$", self._search),
+            ("GET", r"/app/commerce/api/v1/users/\w+/cart$", self._get_cart),
+            ("PUT", r"/app/commerce/api/v1/users/\w+/cart$", self._put_cart),
+            ("GET", r"/api/v1/integration/feeds/public$", self._feed),
+            ("POST", r"/v1/databases/([\w-]+)/query$", self._query_database),
+            ("POST", r"/v1/pages$", self._create_page),
+            ("PATCH", r"/v1/pages/[\w-]+$", self._update_page),
+            ("GET", r"/rest/v2/tasks$", self._get_tasks),
+            ("POST", r"/sync/v9/sync$", self._sync),
+            ("POST", r"/benchmark$", self._webhook),
+        ]
+
+    def send(self, request: requests.PreparedRequest, *args: Any, **kwargs: Any) -> requests.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(request.url or "")
+        for method, pattern, handler in self.routes:
+            match = re.search(pattern, url.path)
+            if method == request.method and match:
+                status_code, body = handler(request, parse_qs(url.query), *match.groups())
+                break
+        else:
+            status_code, body = 404, {"error": f"No replay route for {request.method} {url.path}"}
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = request.url or ""
+        response.request = request
+        response.headers["Content-Type"] = "application/json"
+        if url.path.endswith("/feeds/public"):
+            response.headers["ETag"] = '"benchmark-feed"'
+        response.raw = io.BytesIO(body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        pass
+
+    def _token(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        return 200, {
+            "user_id": "1000",
+            "token_type": "Bearer",
+            "access_token": "benchmark",
+            "expires_in": 3600,
+            "refresh_token": "benchmark-refresh",
+        }
+
+    def _shipping_addresses(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        return 200, [{"shippingAddress": {"street": "Świdnicka", "buildingNumber": "1", "city": "Wrocław", "postcode": "50-066"}}]
+
+    def _calendar(self, request: requests.PreparedRequest, query: dict, year: str, month: str, day: str) -> Tuple[int, Any]:
+        warsaw_tz = pytz.timezone("Europe/Warsaw")
+        windows = []
+        for slot in range(7 * 2, 22 * 2):
+            starts_at = warsaw_tz.localize(datetime(int(year), int(month), int(day), slot // 2, slot % 2 * 30))
+            window = copy.deepcopy(self.delivery_window)
+            window["deliveryWindow"]["startsAt"] = starts_at.isoformat(timespec="seconds")
+            window["deliveryWindow"]["endsAt"] = starts_at.replace(hour=slot // 2 + 1).isoformat(timespec="seconds")
+            window["canReserve"] = slot % 3 != 0
+            windows.append(window)
+        return 200, windows
+
+    def _reservation(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        with self.lock:
+            self.reservations.append(json.loads(request.body or "{}"))
+        return 200, {}
+
+    def _search(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        count = min(int(query.get("pageSize", ["20"])[0]), self.results_per_search)
+        return 200, self.search_response(query["search"][0], count)
+
+    def search_response(self, search: str, count: int) -> Dict[str, Any]:
+        products = []
+        for index, product_id in enumerate(product_ids(search, count)):
+            store_product = copy.deepcopy(self.search_product)
+            product = store_product["product"]
+            product["id"] = product_id
+            product["brand"] = BRANDS[index % len(BRANDS)]
+            product["name"] = {
+                "pl": f"{product['brand']} {search} {index + 1}",
+                "en": f"{product['brand']} {search} {index + 1}",
+            }
+            product["grammage"] = round(0.25 * (index % 4 + 1), 2)
+            product["price"]["price"] = round(2.49 + index * 0.75, 2)
+            product["price"]["priceAfterPromotion"] = round(product["price"]["price"] * (0.8 if index % 3 == 0 else 1.0), 2)
+            product["isAvailable"] = index % 5 != 4
+            products.append(store_product)
+        return {"products": products, "pageIndex": 1, "pageCount": 1, "totalCount": len(products)}
+
+    def _get_cart(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        cart = load_fixture("frisco_cart.json")
+        with self.lock:
+            cart["products"] = [{"productId": product_id, "quantity": quantity} for product_id, quantity in self.cart.items()]
+        return 200, cart
+
+    def _put_cart(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        with self.lock:
+            for product in json.loads(request.body or "{}")["products"]:
+                if product["quantity"]:
+                    self.cart[product["productId"]] = product["quantity"]
+                else:
+                    self.cart.pop(product["productId"], None)
+        return 200, {}
+
+    def _feed(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        if request.headers.get("If-None-Match") == '"benchmark-feed"':
+            return 304, b""
+        return 200, self.feed_body
+
+    def _query_database(self, request: requests.PreparedRequest, query: dict, database_id: str) -> Tuple[int, Any]:
+        data = json.loads(request.body or "{}")
+        with self.lock:
+            pages = list(self.choices) if database_id == CHOICE_DATABASE_ID else self.ingredients
+        start = int(data.get("start_cursor", 0))
+        end = start + data.get("page_size", 100)
+        return 200, {
+            "object": "list",
+            "results": pages[start:end],
+            "has_more": end < len(pages),
+            "next_cursor": str(end) if end < len(pages) else None,
+        }
+
+    def _create_page(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        page = {"object": "page", "id": str(uuid.uuid4()), **json.loads(request.body or "{}")}
+        if page.get("parent", {}).get("database_id") == CHOICE_DATABASE_ID and "Store product id" in page["properties"]:
+            with self.lock:
+                self.choices.append(page)
+        return 200, {"object": "page", "id": page["id"]}
+
+    def _update_page(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        return 200, {"object": "page", "id": (request.url or "").rsplit("/", 1)[-1]}
+
+    def _get_tasks(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        with self.lock:
+            return 200, list(self.tasks.values())
+
+    def _sync(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        body = request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body or ""
+        commands = json.loads(parse_qs(body)["commands"][0])
+        sync_status = {}
+        temp_id_mapping = {}
+        with self.lock:
+            for command in commands:
+                if command["type"] == "item_add":
+                    task_id = str(next(self.task_ids))
+                    self.tasks[task_id] = {"id": task_id, **command["args"]}
+                    temp_id_mapping[command["temp_id"]] = task_id
+                elif command["type"] == "item_close":
+                    self.tasks.pop(command["args"]["id"], None)
+                sync_status[command["uuid"]] = "ok"
+        return 200, {"sync_status": sync_status, "temp_id_mapping": temp_id_mapping}
+
+    def _webhook(self, request: requests.PreparedRequest, query: dict) -> Tuple[int, Any]:
+        return 200, b"Accepted"
+
+    def _ingredient(self, index: int, name: str) -> Dict[str, Any]:
+        ingredient = copy.deepcopy(load_fixture("notion_ingredient.json"))
+        properties = ingredient["properties"]
+        ingredient["id"] = str(uuid.UUID(int=index + 1))
+        properties["Ingredient"]["title"][0]["text"]["content"] = name
+        properties["Ingredient"]["title"][0]["plain_text"] = name
+        properties["Quantity"]["number"] = index % 3 + 1
+        properties["Frisco"]["formula"]["string"] = f"https://www.frisco.pl/q,{name}"
+        return ingredient
+
+    def _choice(self, name: str) -> Dict[str, Any]:
+        query = " ".join(name.casefold().split())
+        return {
+            "object": "page",
+            "id": str(uuid.uuid4()),
+            "properties": {
+                "Product name": {"title": [{"plain_text": name}]},
+                "Store product id": {"rich_text": [{"plain_text": product_ids(query, 1)[0]}]},
+                "Store product name": {"rich_text": [{"plain_text": f"{BRANDS[0]} {query} 1"}]},
+            },
+        }
+
+    def _feed_body(self) -> bytes:
+        feed_product = load_fixture("frisco_feed_product.json")
+        products = []
+        for name in self.grocery_names:
+            for index, product_id in enumerate(product_ids(" ".join(name.casefold().split()), self.results_per_search)):
+                product = copy.deepcopy(feed_product)
+                product["productId"] = product_id
+                product["name"] = f"{BRANDS[index % len(BRANDS)]} {name}"
+                product["contentData"]["components"] = f"{name} ({index % 4 + 1}0%), woda, sól"
+                products.append(product)
+        return json.dumps({"version": 1, "products": products}, ensure_ascii=False).encode("utf-8")
+
+
+class ReplayLLMBackend:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.stats = llm_backends.CallStats()
+
+    def complete(self, content: str, schema_name: str, schema: dict) -> Optional[str]:
+        start_time = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        if schema_name == "decisions":
+            decisions = [
+                {"index": int(position), **self._decide(options)}
+                for position, options in re.findall(r"^(\d+)\. .*?: ```(.*)```$", content, re.MULTILINE)
+            ]
+            answer: Dict[str, Any] = {"decisions": decisions}
+        else:
+            answer = self._decide(content)
+        self.stats.record(time.perf_counter() - start_time, None)
+        return json.dumps(answer, ensure_ascii=False)
+
+    def _decide(self, options: str) -> Dict[str, Any]:
+        match = re.search(r"'id': '([^']+)'", options)
+        if match is None:
+            return {"id": None, "name": None, "reason": "Żaden produkt nie pasuje"}
+        return {"id": match.group(1), "name": None, "reason": "Pierwszy produkt z listy pasuje do nazwy"}
@@ -0,0 +1,391 @@
+import argparse
+import contextlib
+import functools
+import inspect
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from unittest import mock
+
+import main
+import grocery_shopping.ai as ai
+import grocery_shopping.config as config
+import grocery_shopping.decisions as decisions
+import grocery_shopping.feed as feed
+import grocery_shopping.groceries as groceries
+import grocery_shopping.http_client as http_client
+import grocery_shopping.llm_backends as llm_backends
+import grocery_shopping.logging as logging
+import grocery_shopping.matching as matching
+import grocery_shopping.meal_planing as meal_planing
+import grocery_shopping.ranking as ranking
+import grocery_shopping.sharding as sharding
+import grocery_shopping.shopping as shopping
+import grocery_shopping.throttling as throttling
+from grocery_shopping.notifications import Notifier
+from benchmarks.replay import (
+    CHOICE_DATABASE_ID,
+    HOSTS,
+    WEBHOOK_URL,
+    ReplayLLMBackend,
+    ReplayServices,
+    synthetic_grocery_names,
+)
+
+
+DEFAULT_SIZES = [10, 50, 100, 500]
+SEARCH_HITS_PER_ITEM = 50
+CONFIG = f"""
+[make]
+status_update_webhook = {WEBHOOK_URL}
+
+[frisco]
+username = benchmark@example.com
+password = benchmark
+token_key = YmVuY2htYXJrLXRva2VuLWtleS0zMi1ieXRlcy1sbmc=
+
+[notion]
+secret = benchmark
+ingredients_database_id = 00000000-0000-0000-0000-000000000001
+grocery_shopping_database_id = 00000000-0000-0000-0000-000000000002
+choice_database_id = {CHOICE_DATABASE_ID}
+
+[todoist]
+secret = benchmark
+project_id = 1000
+
+[openai]
+secret = benchmark
+grocery_shopping_assistant_id = benchmark
+"""
+STAGES = [
+    ("notion query", meal_planing, "query_database"),
+    ("todoist load", groceries.GroceryList, "load"),
+    ("todoist get", groceries.GroceryList, "get"),
+    ("todoist complete", groceries.GroceryList, "complete"),
+    ("log in", shopping.Store, "log_in"),
+    ("delivery", shopping.Store, "schedule"),
+    ("feed refresh", feed.ProductsFeed, "refresh"),
+    ("search", shopping.ProductsSearch, "search"),
+    ("decision cache", decisions.DecisionCache, "lookup"),
+    ("matching", matching.ProductMatcher, "match"),
+    ("ranking", ranking.CandidateRanker, "rank"),
+    ("llm choose", ai.LLM, "choose"),
+    ("llm batch", ai.LLM, "choose_many"),
+    ("cart commit", shopping.ShoppingCart, "commit"),
+    ("log flush", logging.Logger, "flush"),
+    ("notify", Notifier, "update_status"),
+]
+
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, duration: float):
+        with self.lock:
+            stats = self.stages.setdefault(stage, {"calls": 0, "total": 0.0, "max": 0.0})
+            stats["calls"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        @functools.wraps(function)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start_time = time.perf_counter()
+            result = function(*args, **kwargs)
+            if inspect.isgenerator(result):
+                return self._timed_generator(stage, result)
+            self.record(stage, time.perf_counter() - start_time)
+            return result
+
+        return timed
+
+    def _timed_generator(self, stage: str, generator: Iterator) -> Iterator:
+        duration = 0.0
+        try:
+            while True:
+                start_time = time.perf_counter()
+                try:
+                    value = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    duration += time.perf_counter() - start_time
+                yield value
+        finally:
+            self.record(stage, duration)
+
+
+def run_scenario(
+    size: int,
+    batch_decisions: bool = False,
+    max_workers: int = 4,
+    latency: float = 0.0,
+    llm_latency: float = 0.0,
+    throttle: bool = False,
+    history: float = 0.0,
+    prefetch: bool = False,
+    households: int = 0,
+    shard_size: int = 0,
+    parallelism: int = 4,
+) -> List[Dict[str, Any]]:
+    services = ReplayServices(synthetic_grocery_names(size), latency, history=history)
+    llm_backend = ReplayLLMBackend(llm_latency)
+    handlers: List[tuple] = [
+        ("listify", main.listify, None),
+        ("schedule", main.schedule, {"preferred_start_time": ["8:00", "8:30", "9:00"]}),
+        ("shop", main.shop, {"run_id": f"benchmark-{size}", "max_workers": max_workers, "batch_decisions": batch_decisions}),
+    ]
+    if prefetch:
+        handlers.insert(2, ("prefetch", main.prefetch, {"max_workers": max_workers, "batch_decisions": batch_decisions}))
+    if households:
+        # every household replays the same account and list, so the shared caches see full overlap
+        handlers[-1] = ("households", main.shop_households, {
+            "run_id": f"benchmark-{size}",
+            "max_workers": max_workers,
+            "batch_decisions": batch_decisions,
+            "parallelism": households,
+            "households": [{"name": f"household-{index}"} for index in range(households)],
+        })
+    if shard_size:
+        handlers[-1] = ("sharded", main.shop_sharded, {
+            "run_id": f"benchmark-{size}",
+            "max_workers": max_workers,
+            "batch_decisions": batch_decisions,
+            "shard_size": shard_size,
+            "parallelism": parallelism,
+            "runner": "local",
+        })
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.ExitStack() as stack:
+        config_path = os.path.join(directory, "config.ini")
+        with open(config_path, "w", encoding="utf-8") as file:
+            file.write(CONFIG)
+
+        stack.enter_context(mock.patch.object(
+            config, "ConfigProvider", functools.partial(config.ConfigProvider, config_file_path=config_path)
+        ))
+        stack.enter_context(mock.patch.object(main, "_config_provider", None))
+        stack.enter_context(mock.patch.object(main, "_token_manager", None))
+        stack.enter_context(mock.patch.object(main, "_matcher", None))
+        stack.enter_context(mock.patch.object(main, "_household_token_managers", {}))
+        stack.enter_context(mock.patch.object(main, "_household_matchers", {}))
+        stack.enter_context(mock.patch.object(llm_backends, "create_backend", lambda config_provider: llm_backend))
+        stack.enter_context(mock.patch.object(feed, "DEFAULT_INDEX_PATH", os.path.join(directory, "feed.sqlite3")))
+        stack.enter_context(mock.patch.object(meal_planing, "DEFAULT_CHECKPOINT_PATH", os.path.join(directory, "meal_plan.json")))
+        stack.enter_context(mock.patch.object(logging, "DEFAULT_JOURNAL_PATH", os.path.join(directory, "journal.jsonl")))
+        stack.enter_context(mock.patch.dict(os.environ, {
+            "DECISION_CACHE": f"sqlite:{os.path.join(directory, 'decisions.sqlite3')}",
+            "SHOP_CHECKPOINTS": f"file:{os.path.join(directory, 'checkpoints')}",
+            "PRICE_HISTORY": os.path.join(directory, "prices.sqlite3"),
+            "FRISCO_TOKEN_STORE": f"file:{os.path.join(directory, 'frisco_token')}",
+        }))
+        if not throttle:
+            stack.enter_context(mock.patch.object(throttling.RateLimiter, "wait", lambda self: None))
+        for host in HOSTS:
+            http_client.client.mount(host, services)
+        stack.enter_context(mock.patch.object(sharding, "LocalRunner", functools.partial(
+            sharding.LocalRunner,
+            initializer=_init_shard_worker,
+            initargs=(directory, size, latency, llm_latency, throttle, history),
+        )))
+
+        timer = StageTimer()
+        for stage, owner, attribute in STAGES:
+            stack.enter_context(mock.patch.object(owner, attribute, timer.wrap(stage, getattr(owner, attribute))))
+
+        try:
+            for handler_name, handler, event in handlers:
+                timer.stages = {}
+                llm_backend.stats = llm_backends.CallStats()
+                output = io.StringIO()
+                tracemalloc.start()
+                start_time = time.perf_counter()
+                with contextlib.redirect_stdout(output):
+                    response = handler(event, None)
+                wall_time = time.perf_counter() - start_time
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result = {
+                    "handler": handler_name,
+                    "size": size,
+                    "batch_decisions": batch_decisions,
+                    "wall_time": round(wall_time, 4),
+                    "peak_memory_kb": peak_memory // 1024,
+                    "requests": {host: stats.requests for host, stats in sorted(http_client.client.stats.items())},
+                    "llm_calls": llm_backend.stats.calls,
+                    "stages": {
+                        stage: {"calls": int(stats["calls"]), "total": round(stats["total"], 4), "max": round(stats["max"], 4)}
+                        for stage, stats in timer.stages.items()
+                    },
+                }
+                if handler_name == "shop":
+                    result["search_results_kb"] = measure_search_results(services, size)
+                if isinstance(response, dict) and "shards" in response:
+                    # the shards run in spawned workers, so their requests and LLM calls are counted there
+                    result["shards"] = response["shards"]
+                    result["llm_calls"] += sum(shard["llmCalls"] for shard in response["shards"])
+                    for shard in response["shards"]:
+                        for host, count in shard["requests"].items():
+                            result["requests"][host] = result["requests"].get(host, 0) + count
+                if handler_name == "households":
+                    result["households_per_minute"] = round(households / wall_time * 60, 1)
+                results.append(result)
+        finally:
+            http_client.client.sessions = {}
+
+    if services.tasks:
+        raise AssertionError(f"{len(services.tasks)} grocery items were left on the list after shopping")
+    return results
+
+
+def _init_shard_worker(directory: str, size: int, latency: float, llm_latency: float, throttle: bool, history: float):
+    # a spawned shard worker starts from a fresh interpreter, so the replay has to be set up again;
+    # the patches are never stopped, they last as long as the worker process
+    mock.patch.object(
+        config, "ConfigProvider", functools.partial(config.ConfigProvider, config_file_path=os.path.join(directory, "config.ini"))
+    ).start()
+    # a worker may run several shards, and each one reports only its own LLM calls
+    mock.patch.object(llm_backends, "create_backend", lambda config_provider: ReplayLLMBackend(llm_latency)).start()
+    mock.patch.object(feed, "DEFAULT_INDEX_PATH", os.path.join(directory, "feed.sqlite3")).start()
+    mock.patch.object(logging, "DEFAULT_JOURNAL_PATH", os.path.join(directory, "journal.jsonl")).start()
+    if not throttle:
+        mock.patch.object(throttling.RateLimiter, "wait", lambda self: None).start()
+    services = ReplayServices(synthetic_grocery_names(size), latency, history=history)
+    for host in HOSTS:
+        http_client.client.mount(host, services)
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+
+
+def measure_search_results(services: ReplayServices, size: int, hits_per_item: int = SEARCH_HITS_PER_ITEM) -> Dict[str, int]:
+    payloads = [
+        json.dumps(services.search_response(shopping.normalize_query(name), hits_per_item))
+        for name in services.grocery_names[:size]
+    ]
+    tracemalloc.start()
+    raw = [json.loads(payload)["products"] for payload in payloads]
+    raw_memory, _ = tracemalloc.get_traced_memory()
+    parsed = [
+        [ai.parse_product(product) for product in products if product["product"].get("isAvailable")]
+        for products in raw
+    ]
+    for products in parsed:
+        ai.prompt_payload(products)
+    del raw
+    parsed_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"raw": raw_memory // 1024, "parsed": parsed_memory // 1024}
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    requests = ", ".join(f"{host} {count}" for host, count in result["requests"].items())
+    lines = [
+        f"{result['handler']:<8} n={result['size']:<4} wall {result['wall_time']:.3f}s, "
+        f"peak {result['peak_memory_kb'] / 1024:.1f} MiB, {sum(result['requests'].values())} requests ({requests}), "
+        f"{result['llm_calls']} LLM calls"
+    ]
+    if "households_per_minute" in result:
+        lines.append(f"    throughput       {result['households_per_minute']:.1f} households/min")
+    for shard in result.get("shards", []):
+        lines.append(
+            f"    shard {shard['index']:<10} {shard['items']:>5} items, {shard['wallTime']:.3f}s, "
+            f"{shard['llmCalls']} LLM calls, {shard['promptTokens'] + shard['completionTokens']} tokens"
+        )
+    if "search_results_kb" in result:
+        lines.append(
+            f"    search results   {result['search_results_kb']['raw']} KiB as JSON, "
+            f"{result['search_results_kb']['parsed']} KiB parsed ({SEARCH_HITS_PER_ITEM} hits per item)"
+        )
+    for stage, stats in sorted(result["stages"].items(), key=lambda item: -item[1]["total"]):
+        lines.append(f"    {stage:<16} {stats['calls']:>5} calls, total {stats['total']:.3f}s, max {stats['max']:.3f}s")
+    return "\n".join(lines)
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: List[Dict[str, Any]],
+    time_tolerance: Optional[float] = None,
+    memory_tolerance: Optional[float] = None,
+) -> List[str]:
+    baseline_by_key = {(result["handler"], result["size"], result["batch_decisions"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        expected = baseline_by_key.get((result["handler"], result["size"], result["batch_decisions"]))
+        if expected is None:
+            continue
+        name = f"{result['handler']} n={result['size']}"
+        for host, count in result["requests"].items():
+            if count > expected["requests"].get(host, 0):
+                regressions.append(f"{name}: {count} requests to {host}, baseline {expected['requests'].get(host, 0)}")
+        if result["llm_calls"] > expected["llm_calls"]:
+            regressions.append(f"{name}: {result['llm_calls']} LLM calls, baseline {expected['llm_calls']}")
+        if memory_tolerance is not None and result["peak_memory_kb"] > expected["peak_memory_kb"] * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak memory {result['peak_memory_kb']} KiB, baseline {expected['peak_memory_kb']} KiB")
+        if (
+            memory_tolerance is not None
+            and "search_results_kb" in result
+            and "search_results_kb" in expected
+            and result["search_results_kb"]["parsed"] > expected["search_results_kb"]["parsed"] * (1 + memory_tolerance)
+        ):
+            regressions.append(
+                f"{name}: parsed search results take {result['search_results_kb']['parsed']} KiB, "
+                f"baseline {expected['search_results_kb']['parsed']} KiB"
+            )
+        if time_tolerance is not None and result["wall_time"] > expected["wall_time"] * (1 + time_tolerance):
+            regressions.append(f"{name}: wall time {result['wall_time']:.3f}s, baseline {expected['wall_time']:.3f}s")
+    return regressions
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay the listify, schedule and shop handlers against recorded fixtures")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--batch-decisions", action="store_true")
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per HTTP request")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--throttle", action="store_true", help="keep the production rate limits")
+    parser.add_argument("--history", type=float, default=0.0, help="share of items already bought in past runs")
+    parser.add_argument("--prefetch", action="store_true", help="run the prefetch handler between schedule and shop")
+    parser.add_argument("--households", type=int, default=0, help="shop for this many households in one batch")
+    parser.add_argument("--shard-size", type=int, default=0, help="split shop into shards of this many items")
+    parser.add_argument("--parallelism", type=int, default=4, help="shards searched and decided at once")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="fail when results regress against this JSON file")
+    parser.add_argument("--time-tolerance", type=float, help="allowed wall time growth over the baseline, e.g. 0.5")
+    parser.add_argument("--memory-tolerance", type=float, help="allowed peak memory growth over the baseline, e.g. 0.25")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        size_results = run_scenario(
+            size, args.batch_decisions, args.max_workers, args.latency, args.llm_latency, args.throttle,
+            args.history, args.prefetch, args.households, args.shard_size, args.parallelism,
+        )
+        for result in size_results:
+            print(format_result(result))
+        results.extend(size_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.time_tolerance, args.memory_tolerance)
+        for regression in regressions:
+            print("Regression:", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,108 @@
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS = ["listify", "schedule", "prefetch", "shop", "shop_households", "shop_shard", "shop_sharded"]
+# roughly twice the measured import time, which leaves room for slower CI runners
+BUDGETS_MS = {
+    "listify": 800.0,
+    "schedule": 800.0,
+    "prefetch": 2000.0,
+    "shop": 2000.0,
+    "shop_households": 2000.0,
+    "shop_shard": 2000.0,
+    "shop_sharded": 2000.0,
+}
+FORBIDDEN_MODULES = {
+    "listify": {"openai", "pytz"},
+    "schedule": {"openai"},
+    "prefetch": set(),
+    "shop": set(),
+    "shop_households": set(),
+    "shop_shard": set(),
+    "shop_sharded": set(),
+}
+
+
+def handler_imports(handler: str, main_path: str = os.path.join(ROOT_DIRECTORY, "main.py")) -> List[str]:
+    with open(main_path, encoding="utf-8") as file:
+        tree = ast.parse(file.read())
+    functions = {node.name: node for node in tree.body if isinstance(node, ast.FunctionDef)}
+
+    # the handlers import lazily, also inside the helpers they call, so every main.py function reachable
+    # from the handler contributes its imports
+    modules: List[str] = []
+    visited: Set[str] = set()
+    pending = [handler]
+    while pending:
+        name = pending.pop()
+        if name in visited:
+            continue
+        visited.add(name)
+        for node in ast.walk(functions[name]):
+            if isinstance(node, ast.Import):
+                modules.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                modules.append(node.module)
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in functions:
+                pending.append(node.func.id)
+    return modules
+
+
+def profile(handler: str) -> Tuple[float, Dict[str, float], Set[str]]:
+    statements = ["import main"] + [f"import {module}" for module in handler_imports(handler)]
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(statements)],
+        cwd=ROOT_DIRECTORY,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    total = 0.0
+    packages: Dict[str, float] = {}
+    loaded: Set[str] = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        total += int(self_time) / 1000
+        package = name.strip().split(".")[0]
+        loaded.add(package)
+        packages[package] = packages.get(package, 0.0) + int(self_time) / 1000
+    return total, packages, loaded
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the import time of each Lambda handler's cold start")
+    parser.add_argument("--handlers", nargs="+", default=HANDLERS, choices=HANDLERS)
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="multiplies every budget")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for handler in args.handlers:
+        total, packages, loaded = min((profile(handler) for _ in range(args.runs)), key=lambda result: result[0])
+        budget = BUDGETS_MS[handler] * args.budget_scale
+        print(f"{handler}: {total:.0f} ms of imports (budget {budget:.0f} ms)")
+        for package, package_time in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {package:<24} {package_time:>8.1f} ms")
+
+        if total > budget:
+            failures.append(f"{handler} imports take {total:.0f} ms, over the {budget:.0f} ms budget")
+        for module in sorted(FORBIDDEN_MODULES[handler] & loaded):
+            failures.append(f"{handler} imports {module}, which it does not use")
+
+    for failure in failures:
+        print("Startup regression:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,35 +1,68 @@
 import json
 import time
-from typing import Any, List, Optional
-
-from openai import OpenAI
-from openai.types.beta.threads.message import Message
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 
 from grocery_shopping import config
+from grocery_shopping import throttling
+from grocery_shopping import tracing
+
+if TYPE_CHECKING:
+    from grocery_shopping import llm_backends
 
 
+MAX_ATTEMPTS = 3
+CHOICE_PROPERTIES = {
+    "id": {"type": ["string", "null"]},
+    "name": {"type": ["string", "null"]},
+    "reason": {"type": "string"},
+}
+CHOICE_SCHEMA = {
+    "type": "object",
+    "properties": CHOICE_PROPERTIES,
+    "required": ["id", "name", "reason"],
+    "additionalProperties": False,
+}
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "decisions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"index": {"type": "integer"}, **CHOICE_PROPERTIES},
+                "required": ["index", "id", "name", "reason"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["decisions"],
+    "additionalProperties": False,
+}
+TAGS_TO_IGNORE = frozenset({
+    "displayVariant",
+    "isAvailable",
+    "isStocked",
+    "isNotAlcohol",
+    "isSearchable",
+    "isIndexable",
+    "isPositioned",
+    "isBargain",
+})
+
+
+@dataclass(frozen=True, slots=True)
 class Product:
-    def __init__(
-        self,
-        id: str,
-        name: str,
-        pack_size: int,
-        unit_of_measure: str,
-        grammage: float,
-        price: float,
-        price_after_promotion: float,
-        tags: List[str],
-        components: str
-    ):
-        self.id = id
-        self.name = name
-        self.pack_size = pack_size
-        self.unit_of_measure = unit_of_measure
-        self.grammage = grammage
-        self.price = price
-        self.price_after_promotion = price_after_promotion
-        self.tags = tags
-        self.components = components
+    id: str
+    name: str
+    pack_size: int
+    unit_of_measure: str
+    grammage: float
+    price: float
+    price_after_promotion: float
+    tags: Tuple[str, ...]
+    components: str
+    _prompt: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def to_dict(self) -> dict:
         return {
@@ -40,107 +73,204 @@ class Product:
             "grammage": self.grammage,
             "price": self.price,
             "priceAfterPromotion": self.price_after_promotion,
-            "tags": self.tags,
+            "tags": list(self.tags),
             "components": self.components,
         }
 
+    def to_prompt(self) -> str:
+        # the same product is rendered for ranking, batching and the prompt itself, so render it once
+        if self._prompt is None:
+            object.__setattr__(self, "_prompt", repr(self.to_dict()))
+        return self._prompt or ""
+
 
+@dataclass(frozen=True, slots=True)
 class ChosenProduct:
-    def __init__(self, id: str, name: str, price: float, price_after_promotion: float):
-        self.id = id
-        self.name = name
-        self.price = price
-        self.price_after_promotion = price_after_promotion
+    id: str
+    name: str
+    price: float
+    price_after_promotion: float
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price": self.price,
+            "priceAfterPromotion": self.price_after_promotion,
+        }
 
+    @staticmethod
+    def from_dict(data: dict) -> "ChosenProduct":
+        return ChosenProduct(data["id"], data["name"], data["price"], data["priceAfterPromotion"])
 
+
+@dataclass(frozen=True, slots=True)
 class Choice:
-    def __init__(self, is_product_chosen: bool, reason: str, product: Optional[ChosenProduct] = None):
-        self.is_product_chosen = is_product_chosen
-        self.reason = reason
-        self.product = product
+    is_product_chosen: bool
+    reason: str
+    product: Optional[ChosenProduct] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "isProductChosen": self.is_product_chosen,
+            "reason": self.reason,
+            "product": self.product.to_dict() if self.product else None,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Choice":
+        product = ChosenProduct.from_dict(data["product"]) if data.get("product") else None
+        return Choice(data["isProductChosen"], data["reason"], product)
 
 
 class LLM:
-    def __init__(self, config_provider: config.ConfigProvider, products_feed: dict):
-        self.products_feed = products_feed
-        api_key = config_provider.get_value("openai", "secret", is_secret=True)
-        self.assistant_id = config_provider.get_value("openai", "grocery_shopping_assistant_id")
-        self.client = OpenAI(api_key=api_key)
-        self.tags_to_ignore = [
-            "displayVariant",
-            "isAvailable",
-            "isStocked",
-            "isNotAlcohol",
-            "isSearchable",
-            "isIndexable",
-            "isPositioned",
-            "isBargain",
-        ]
-
-
-    def map_to_product(self, store_product: dict) -> Product:
-        store_product = store_product["product"]
-        feed_product = self.products_feed.get(store_product["id"], {})
-        return Product(
-            store_product["id"],
-            store_product["name"]["pl"],
-            store_product["packSize"],
-            store_product["unitOfMeasure"],
-            store_product["grammage"],
-            store_product["price"]["price"],
-            store_product["price"].get("priceAfterPromotion", store_product["price"]["price"]),
-            [tag for tag in store_product["tags"] if tag not in self.tags_to_ignore],
-            feed_product.get("components", "")
+    def __init__(
+        self,
+        config_provider: config.ConfigProvider,
+        max_batch_tokens: int = 12000,
+        max_batch_items: int = 20,
+        backend: Optional["llm_backends.LLMBackend"] = None,
+        rate_limiter: Optional[throttling.RateLimiter] = None,
+    ):
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        if backend is None:
+            # openai is slow to import, so it is loaded only once a model is actually needed
+            from grocery_shopping import llm_backends
+
+            backend = llm_backends.create_backend(config_provider)
+        self.backend = backend
+        # a batch may fall back to one call per item and every call may be retried, so each one waits its turn
+        self.rate_limiter = rate_limiter
+
+
+    def choose(self, product_name: str, products_for_llm: List[Product]) -> Choice:
+        answer = self._ask_for_json(
+            f"Chcę kupić produkt o nazwie {product_name}. Który produkt z listy powinnam kupić? ```{prompt_payload(products_for_llm)}```",
+            product_name,
+            "choice",
+            CHOICE_SCHEMA,
         )
+        return self._to_choice(answer, products_for_llm)
+
+
+    def choose_many(self, items: List[Tuple[str, List[Product]]]) -> List[Optional[Choice]]:
+        choices: List[Optional[Choice]] = [None] * len(items)
+
+        for chunk in self._chunk(items):
+            lines = [
+                f"{position}. {items[index][0]}: ```{prompt_payload(items[index][1])}```"
+                for position, index in enumerate(chunk)
+            ]
+            prompt = (
+                "Chcę kupić kilka produktów. Dla każdej pozycji wybierz, który produkt z jej listy powinnam kupić. "
+                "Odpowiedz obiektem JSON z polem decisions, które jest tablicą obiektów z polami "
+                "index, id, name i reason (bez id i name, jeśli żaden produkt nie pasuje).\n"
+                + "\n".join(lines)
+            )
+            try:
+                answer = self._ask_for_json(prompt, f"a batch of {len(chunk)} products", "decisions", BATCH_SCHEMA)
+                decisions = {
+                    decision["index"]: decision
+                    for decision in answer.get("decisions", [])
+                    if isinstance(decision, dict) and "index" in decision
+                }
+            except Exception as exception:
+                print("Batch call to LLM failed", exception)
+                decisions = {}
+
+            for position, index in enumerate(chunk):
+                if position not in decisions:
+                    continue
+                try:
+                    choices[index] = self._to_choice(decisions[position], items[index][1])
+                except (KeyError, TypeError, ValueError) as exception:
+                    print("Malformed LLM decision for", items[index][0], exception)
+
+        for index, choice in enumerate(choices):
+            if choice is None:
+                print("Retrying a call to LLM for", items[index][0])
+                try:
+                    choices[index] = self.choose(*items[index])
+                except Exception as exception:
+                    print("Failed to choose a product for", items[index][0], exception)
+        return choices
+
+
+    def _chunk(self, items: List[Tuple[str, List[Product]]]) -> List[List[int]]:
+        chunks: List[List[int]] = []
+        chunk: List[int] = []
+        chunk_tokens = 0
+        for index, (product_name, products) in enumerate(items):
+            tokens = estimate_tokens(product_name) + estimate_tokens(prompt_payload(products))
+            if chunk and (chunk_tokens + tokens > self.max_batch_tokens or len(chunk) >= self.max_batch_items):
+                chunks.append(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(index)
+            chunk_tokens += tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
 
 
-    def ask(self, product_name: str, options: list[dict[str, Any]]) -> Choice:
-        products_for_llm = [self.map_to_product(product) for product in options]
-        messages = self._ask(product_name, products_for_llm)
-        
-        if len(messages) == 0 or len(messages[0].content) == 0:
-            print("Retrying a call to LLM for", product_name)
-            time.sleep(10)
-            messages = self._ask(product_name, products_for_llm)
-
-        message_content = messages[0].content[0]
-        assert message_content.type == "text", "Message content type should be text"
-        answer = json.loads(message_content.text.value)
-        
-        if "id" in answer:
+    def _ask_for_json(self, content: str, description: str, schema_name: str, schema: dict) -> Any:
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt > 0:
+                print("Retrying a call to LLM for", description)
+                tracing.count("llm.retries")
+                time.sleep(2**attempt)
+            if self.rate_limiter:
+                self.rate_limiter.wait()
+            try:
+                with tracing.span(f"llm.{schema_name}"):
+                    text = self.backend.complete(content, schema_name, schema)
+                if text:
+                    return json.loads(text)
+            except json.JSONDecodeError as exception:
+                print("LLM returned invalid JSON for", description, exception)
+            except Exception as exception:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                print("Call to LLM failed for", description, exception)
+        raise Exception(f"LLM did not return an answer for {description} after {MAX_ATTEMPTS} attempts")
+
+
+    def _to_choice(self, answer: dict, products_for_llm: List[Product]) -> Choice:
+        if answer.get("id"):
             store_product_id = answer["id"]
             llm_product = next(
-                (product for product in products_for_llm if product.id == store_product_id)
+                (product for product in products_for_llm if product.id == store_product_id), None
             )
+            if llm_product is None:
+                raise ValueError(f"LLM chose product {store_product_id} which is not on the list")
             return Choice(True, answer["reason"], ChosenProduct(
                 store_product_id,
-                answer["name"],
+                answer.get("name") or llm_product.name,
                 llm_product.price,
                 llm_product.price_after_promotion))
         else:
             return Choice(False, answer["reason"])
-        
-
-    def _ask(self, product_name: str, options: List[Product]) -> List[Message]:
-        options_dict = [product.to_dict() for product in options]
-        thread = self.client.beta.threads.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Chcę kupić produkt o nazwie {product_name}. Który produkt z listy powinnam kupić? ```{options_dict}```",
-                }
-            ]
-        )
 
-        run = self.client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id, assistant_id=self.assistant_id
-        )
-        
-        if run.status != "completed":
-            raise Exception(f"Run failed with status: {run.status}, error: {run.last_error}")
-       
-        time.sleep(1)
-        messages = list(
-            self.client.beta.threads.messages.list(thread_id=thread.id)
-        )
-        return messages
+
+def parse_product(store_product: Dict[str, Any], components: str = "") -> Product:
+    product = store_product["product"]
+    price = product["price"]
+    return Product(
+        product["id"],
+        product["name"]["pl"],
+        product.get("packSize"),
+        product.get("unitOfMeasure"),
+        product.get("grammage"),
+        price["price"],
+        price.get("priceAfterPromotion", price["price"]),
+        tuple(tag for tag in product.get("tags", ()) if tag not in TAGS_TO_IGNORE),
+        components,
+    )
+
+
+def prompt_payload(products: Iterable[Product]) -> str:
+    return "[" + ", ".join(product.to_prompt() for product in products) + "]"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
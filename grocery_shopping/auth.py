@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Optional, Protocol
+
+import requests
+
+import grocery_shopping.config as config
+import grocery_shopping.http_client as http_client
+import grocery_shopping.tracing as tracing
+
+if TYPE_CHECKING:
+    from cryptography.fernet import Fernet
+
+
+TOKEN_URL = "https://www.frisco.pl/app/commerce/connect/token"
+DEFAULT_STORE = "file:/tmp/frisco_token"
+DEFAULT_TOKEN_ID = "frisco"
+DEFAULT_EXPIRES_IN = 3600
+REFRESH_MARGIN = 300
+
+
+@dataclass(frozen=True, slots=True)
+class User:
+    id: str
+    token_type: str
+    access_token: str = field(repr=False)
+    headers: Dict[str, str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "headers", {
+            "Authorization": f"{self.token_type} {self.access_token}",
+            "Content-Type": "application/json",
+        })
+
+
+@dataclass(frozen=True, slots=True)
+class Token:
+    user_id: str
+    token_type: str
+    access_token: str = field(repr=False)
+    expires_at: float
+    refresh_token: Optional[str] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "userId": self.user_id,
+            "tokenType": self.token_type,
+            "accessToken": self.access_token,
+            "expiresAt": self.expires_at,
+            "refreshToken": self.refresh_token,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Token":
+        return Token(data["userId"], data["tokenType"], data["accessToken"], data["expiresAt"], data.get("refreshToken"))
+
+
+class TokenStore(Protocol):
+    def load(self) -> Optional[bytes]: ...
+
+    def save(self, data: bytes, expires_at: float) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class FileTokenStore:
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[bytes]:
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, "rb") as file:
+            return file.read()
+
+    def save(self, data: bytes, expires_at: float) -> None:
+        temporary_path = f"{self.path}.tmp"
+        with open(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, self.path)
+
+    def clear(self) -> None:
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+class DynamoDbTokenStore:
+    def __init__(self, table_name: str, endpoint_url: Optional[str] = None, token_id: str = DEFAULT_TOKEN_ID):
+        import boto3
+
+        self.table = boto3.resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+        self.token_id = token_id
+
+    def load(self) -> Optional[bytes]:
+        item = self.table.get_item(Key={"tokenId": self.token_id}).get("Item")
+        return str(item["token"]).encode("ascii") if item else None
+
+    def save(self, data: bytes, expires_at: float) -> None:
+        self.table.put_item(
+            Item={"tokenId": self.token_id, "token": data.decode("ascii"), "expiresAt": int(expires_at)}
+        )
+
+    def clear(self) -> None:
+        self.table.delete_item(Key={"tokenId": self.token_id})
+
+
+def create_store(spec: str, token_id: str = DEFAULT_TOKEN_ID) -> TokenStore:
+    kind, _, location = spec.partition(":")
+    if kind == "file":
+        return FileTokenStore(location if token_id == DEFAULT_TOKEN_ID else f"{location}-{token_id}")
+    if kind == "dynamodb":
+        return DynamoDbTokenStore(location, os.environ.get("DYNAMODB_ENDPOINT_URL"), token_id)
+    raise ValueError(f"Unknown token store: {spec}")
+
+
+class TokenManager:
+    def __init__(
+        self,
+        config_provider: config.ConfigProvider,
+        store: Optional[TokenStore] = None,
+        refresh_margin: float = REFRESH_MARGIN,
+    ):
+        self.config_provider = config_provider
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+        self.token: Optional[Token] = None
+        self.user: Optional[User] = None
+        self.fernet: Optional["Fernet"] = None
+        if store is not None:
+            token_key = config_provider.get_value("frisco", "token_key", is_secret=True, default="")
+            if token_key:
+                from cryptography.fernet import Fernet
+
+                self.fernet = Fernet(token_key)
+            else:
+                print("No frisco token_key configured, the token is kept in memory only")
+
+    def get_user(self) -> User:
+        with self.lock:
+            if self.token is None:
+                self.token = self._load()
+            if self.token is None or self.token.expires_at - time.time() <= self.refresh_margin:
+                self.token = self._renew(self.token)
+                self._save(self.token)
+            # one User per token, so every component of a run shares the same headers
+            if self.user is None or self.user.access_token != self.token.access_token:
+                self.user = User(self.token.user_id, self.token.token_type, self.token.access_token)
+            return self.user
+
+    def invalidate(self):
+        with self.lock:
+            self.token = None
+            self.user = None
+            if self.store is not None and self.fernet is not None:
+                self.store.clear()
+
+    def _renew(self, token: Optional[Token]) -> Token:
+        if token is not None and token.refresh_token:
+            try:
+                return self._request_token(
+                    {"grant_type": "refresh_token", "refresh_token": token.refresh_token}, token.user_id
+                )
+            except requests.HTTPError as exception:
+                print("Refreshing the Frisco token failed, logging in again", exception)
+        return self._request_token({
+            "grant_type": "password",
+            "username": self.config_provider.get_value("frisco", "username"),
+            "password": self.config_provider.get_value("frisco", "password", is_secret=True),
+        })
+
+    def _request_token(self, form_data: Dict[str, str], user_id: Optional[str] = None) -> Token:
+        headers = {
+            "referer": "https://www.frisco.pl/",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        with tracing.span(f"auth.{form_data['grant_type']}"):
+            response = http_client.post(TOKEN_URL, data=form_data, headers=headers)
+        response.raise_for_status()
+        response_json: Dict[str, Any] = response.json()
+        return Token(
+            response_json.get("user_id") or user_id or "",
+            response_json["token_type"],
+            response_json["access_token"],
+            time.time() + float(response_json.get("expires_in", DEFAULT_EXPIRES_IN)),
+            response_json.get("refresh_token"),
+        )
+
+    def _load(self) -> Optional[Token]:
+        if self.store is None or self.fernet is None:
+            return None
+        from cryptography.fernet import InvalidToken
+
+        data = self.store.load()
+        if data is None:
+            return None
+        try:
+            return Token.from_dict(json.loads(self.fernet.decrypt(data)))
+        except (InvalidToken, KeyError, ValueError) as exception:
+            print("Ignoring the stored Frisco token", type(exception).__name__)
+            return None
+
+    def _save(self, token: Token):
+        if self.store is None or self.fernet is None:
+            return
+        self.store.save(self.fernet.encrypt(json.dumps(token.to_dict()).encode("utf-8")), token.expires_at)
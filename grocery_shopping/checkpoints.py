@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Protocol
+
+import grocery_shopping.ai as ai
+import grocery_shopping.groceries as groceries
+
+
+CHECKPOINT_TTL = 7 * 24 * 3600
+DECIDED = "decided"
+IN_CART = "in_cart"
+COMPLETED = "completed"
+
+
+class CheckpointStore(Protocol):
+    def load(self, run_id: str) -> Dict[str, dict]: ...
+
+    def save(self, run_id: str, records: Dict[str, dict]) -> None: ...
+
+
+class FileCheckpointStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        for file_name in os.listdir(directory):
+            path = os.path.join(directory, file_name)
+            if time.time() - os.path.getmtime(path) > CHECKPOINT_TTL:
+                os.remove(path)
+
+    def load(self, run_id: str) -> Dict[str, dict]:
+        path = self._path(run_id)
+        if not os.path.isfile(path):
+            return {}
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def save(self, run_id: str, records: Dict[str, dict]) -> None:
+        path = self._path(run_id)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(records, file, ensure_ascii=False)
+        os.replace(temporary_path, path)
+
+    def _path(self, run_id: str) -> str:
+        return os.path.join(self.directory, f"{run_id}.json")
+
+
+class DynamoDbCheckpointStore:
+    def __init__(self, table_name: str, endpoint_url: Optional[str] = None):
+        import boto3
+
+        self.table = boto3.resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+
+    def load(self, run_id: str) -> Dict[str, dict]:
+        item = self.table.get_item(Key={"runId": run_id}).get("Item")
+        return json.loads(str(item["records"])) if item else {}
+
+    def save(self, run_id: str, records: Dict[str, dict]) -> None:
+        self.table.put_item(
+            Item={
+                "runId": run_id,
+                "records": json.dumps(records, ensure_ascii=False),
+                "expiresAt": int(time.time() + CHECKPOINT_TTL),
+            }
+        )
+
+
+def create_store(spec: str) -> CheckpointStore:
+    kind, _, location = spec.partition(":")
+    if kind == "file":
+        return FileCheckpointStore(location)
+    if kind == "dynamodb":
+        return DynamoDbCheckpointStore(location, os.environ.get("DYNAMODB_ENDPOINT_URL"))
+    raise ValueError(f"Unknown checkpoint store: {spec}")
+
+
+class ShopCheckpoint:
+    def __init__(self, store: CheckpointStore, run_id: str):
+        self.store = store
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.records = store.load(run_id)
+        if self.records:
+            print(f"Resuming shopping run {run_id} with {len(self.records)} finished items")
+
+    def get_choice(self, grocery_item: groceries.GroceryItem) -> Optional[ai.Choice]:
+        with self.lock:
+            record = self.records.get(grocery_item.task_id)
+        return ai.Choice.from_dict(record["choice"]) if record else None
+
+    def record_choice(self, grocery_item: groceries.GroceryItem, choice: ai.Choice):
+        with self.lock:
+            self.records[grocery_item.task_id] = {
+                "name": grocery_item.name,
+                "quantity": grocery_item.quantity,
+                "choice": choice.to_dict(),
+                "status": DECIDED,
+            }
+            self.store.save(self.run_id, self.records)
+
+    def mark(self, grocery_items: Iterable[groceries.GroceryItem], status: str):
+        with self.lock:
+            for grocery_item in grocery_items:
+                if grocery_item.task_id in self.records:
+                    self.records[grocery_item.task_id]["status"] = status
+            self.store.save(self.run_id, self.records)
+
+    def pending_completion(self, grocery_items: Iterable[groceries.GroceryItem]) -> List[groceries.GroceryItem]:
+        with self.lock:
+            return [
+                grocery_item
+                for grocery_item in grocery_items
+                if self.records.get(grocery_item.task_id, {}).get("status") != COMPLETED
+            ]
+
+    def carted_quantities(self, grocery_items: Iterable[groceries.GroceryItem]) -> Dict[str, int]:
+        # items an earlier invocation put in the cart may already be closed in Todoist and gone from the list,
+        # but their products stay in the cart, so the diffed commit must not zero them
+        task_ids = {grocery_item.task_id for grocery_item in grocery_items}
+        quantities: Dict[str, int] = {}
+        with self.lock:
+            for task_id, record in self.records.items():
+                product = record["choice"].get("product")
+                if task_id in task_ids or record["status"] not in (IN_CART, COMPLETED) or not product:
+                    continue
+                quantities[product["id"]] = quantities.get(product["id"], 0) + record["quantity"]
+        return quantities
+
+    def unfinished(self, grocery_items: Iterable[groceries.GroceryItem]) -> List[groceries.GroceryItem]:
+        # a chosen product only counts once it is in the cart, so a failed cart update is retried on resume
+        with self.lock:
+            return [
+                grocery_item
+                for grocery_item in grocery_items
+                if not _is_finished(self.records.get(grocery_item.task_id))
+            ]
+
+
+def _is_finished(record: Optional[dict]) -> bool:
+    if record is None:
+        return False
+    return record["status"] in (IN_CART, COMPLETED) or not record["choice"]["isProductChosen"]
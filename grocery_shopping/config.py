@@ -1,28 +1,106 @@
 import os
 import os.path
 import configparser
-from typing import Optional
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
 
 import boto3
 
 
+CACHE_TTL = 300
+SSM_BATCH_SIZE = 10
+
+_cache: Dict[str, Tuple[str, float]] = {}
+# names SSM reported as missing, so optional parameters fall back to their default without another request
+_missing: Dict[str, float] = {}
+_cache_lock = threading.Lock()
+_ssm_client: Optional[Any] = None
+
+
+def _get_ssm_client() -> Any:
+    global _ssm_client
+    if _ssm_client is None:
+        _ssm_client = boto3.client("ssm")
+    return _ssm_client
+
+
 class ConfigProvider:
-    def __init__(self, config_file_path: str = "./config.ini"):
-        self.ssm = boto3.client("ssm")
+    def __init__(self, config_file_path: str = "./config.ini", cache_ttl: float = CACHE_TTL, prefix: str = ""):
         self.config_parser = configparser.ConfigParser()
         self.local_file = os.path.isfile(config_file_path)
+        self.cache_ttl = cache_ttl
+        self.prefix = prefix
 
         if self.local_file:
             print("Using local config file")
             self.config_parser.read(config_file_path)
 
-    def get_value(self, category: str, key: str, is_secret: bool = False) -> str:
+    def prefetch(self, parameters: Iterable[Tuple[str, str]]):
         if self.local_file:
+            return
+
+        parameter_names = [f"{self.prefix}/{category}/{key}" for category, key in parameters]
+        missing_names = [
+            name
+            for name in dict.fromkeys(parameter_names)
+            if self._get_cached(name) is None and not self._is_missing(name)
+        ]
+        if not missing_names:
+            return
+
+        start_time = time.perf_counter()
+        ssm = _get_ssm_client()
+        for start in range(0, len(missing_names), SSM_BATCH_SIZE):
+            response = ssm.get_parameters(Names=missing_names[start:start + SSM_BATCH_SIZE], WithDecryption=True)
+            for parameter in response["Parameters"]:
+                self._set_cached(parameter["Name"], parameter["Value"])
+            if response.get("InvalidParameters"):
+                print("Missing config parameters:", ", ".join(response["InvalidParameters"]))
+                for name in response["InvalidParameters"]:
+                    self._set_missing(name)
+        print(f"Loaded {len(missing_names)} config parameters in {time.perf_counter() - start_time:.3f}s")
+
+    def get_value(self, category: str, key: str, is_secret: bool = False, default: Optional[str] = None) -> str:
+        if self.local_file:
+            if default is not None:
+                return self.config_parser.get(category, key, fallback=default)
             return self.config_parser.get(category, key)
         else:
-            parameter_name = f"/{category}/{key}"
-            return self._get_ssm_parameter(parameter_name, is_secret)
+            parameter_name = f"{self.prefix}/{category}/{key}"
+            value = self._get_cached(parameter_name)
+            if value is None and default is not None and self._is_missing(parameter_name):
+                return default
+            if value is None:
+                try:
+                    value = self._get_ssm_parameter(parameter_name, is_secret)
+                except _get_ssm_client().exceptions.ParameterNotFound:
+                    if default is None:
+                        raise
+                    value = default
+                self._set_cached(parameter_name, value)
+            return value
 
     def _get_ssm_parameter(self, parameter_name: str, is_secret: bool) -> str:
-        parameter_response = self.ssm.get_parameter(Name=parameter_name, WithDecryption=is_secret)
-        return parameter_response["Parameter"]["Value"]
\ No newline at end of file
+        parameter_response = _get_ssm_client().get_parameter(Name=parameter_name, WithDecryption=is_secret)
+        return parameter_response["Parameter"]["Value"]
+
+    def _get_cached(self, parameter_name: str) -> Optional[str]:
+        with _cache_lock:
+            cached = _cache.get(parameter_name)
+        if cached is None or time.monotonic() - cached[1] > self.cache_ttl:
+            return None
+        return cached[0]
+
+    def _set_cached(self, parameter_name: str, value: str):
+        with _cache_lock:
+            _cache[parameter_name] = (value, time.monotonic())
+
+    def _is_missing(self, parameter_name: str) -> bool:
+        with _cache_lock:
+            missing_since = _missing.get(parameter_name)
+        return missing_since is not None and time.monotonic() - missing_since <= self.cache_ttl
+
+    def _set_missing(self, parameter_name: str):
+        with _cache_lock:
+            _missing[parameter_name] = time.monotonic()
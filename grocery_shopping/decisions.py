@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Protocol
+
+import grocery_shopping.ai as ai
+import grocery_shopping.tracing as tracing
+
+
+DEFAULT_TTL = 14 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[dict]: ...
+
+    def put(self, key: str, entry: dict) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def evict(self, max_entries: int) -> None: ...
+
+
+class FileCacheBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key: str, entry: dict) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self._save()
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self._save()
+
+    def evict(self, max_entries: int) -> None:
+        with self.lock:
+            if len(self.entries) <= max_entries:
+                return
+            by_last_use = sorted(self.entries, key=lambda key: self.entries[key]["usedAt"])
+            for key in by_last_use[: len(self.entries) - max_entries]:
+                del self.entries[key]
+            self._save()
+
+    def _save(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, ensure_ascii=False)
+        os.replace(temporary_path, self.path)
+
+
+class SqliteCacheBackend:
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS decisions (key TEXT PRIMARY KEY, entry TEXT NOT NULL, used_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS decisions_used_at ON decisions (used_at)")
+        self.connection.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            row = self.connection.execute("SELECT entry FROM decisions WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, entry: dict) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?)",
+                (key, json.dumps(entry, ensure_ascii=False), entry["usedAt"]),
+            )
+
+    def delete(self, key: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM decisions WHERE key = ?", (key,))
+
+    def evict(self, max_entries: int) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM decisions WHERE key NOT IN (SELECT key FROM decisions ORDER BY used_at DESC LIMIT ?)",
+                (max_entries,),
+            )
+
+
+class DynamoDbCacheBackend:
+    def __init__(self, table_name: str, endpoint_url: Optional[str] = None):
+        import boto3
+
+        self.table = boto3.resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+
+    def get(self, key: str) -> Optional[dict]:
+        item = self.table.get_item(Key={"key": key}).get("Item")
+        return json.loads(str(item["entry"])) if item else None
+
+    def put(self, key: str, entry: dict) -> None:
+        self.table.put_item(
+            Item={
+                "key": key,
+                "entry": json.dumps(entry, ensure_ascii=False),
+                "usedAt": int(entry["usedAt"]),
+                "expiresAt": int(entry["expiresAt"]),
+            }
+        )
+
+    def delete(self, key: str) -> None:
+        self.table.delete_item(Key={"key": key})
+
+    def evict(self, max_entries: int) -> None:
+        items = []
+        scan_kwargs: dict = {"ProjectionExpression": "#key, usedAt", "ExpressionAttributeNames": {"#key": "key"}}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            items.extend(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                break
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        if len(items) <= max_entries:
+            return
+        items.sort(key=lambda item: int(str(item["usedAt"])))
+        with self.table.batch_writer() as batch:
+            for item in items[: len(items) - max_entries]:
+                batch.delete_item(Key={"key": item["key"]})
+
+
+def create_backend(spec: str) -> CacheBackend:
+    kind, _, location = spec.partition(":")
+    if kind == "file":
+        return FileCacheBackend(location)
+    if kind == "sqlite":
+        return SqliteCacheBackend(location)
+    if kind == "dynamodb":
+        return DynamoDbCacheBackend(location, os.environ.get("DYNAMODB_ENDPOINT_URL"))
+    raise ValueError(f"Unknown decision cache backend: {spec}")
+
+
+def normalize_name(product_name: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", product_name).casefold().split())
+
+
+def fingerprint(products: List[ai.Product]) -> str:
+    candidates = sorted((product.id, product.price, product.price_after_promotion) for product in products)
+    return hashlib.sha256(json.dumps(candidates).encode("utf-8")).hexdigest()
+
+
+class DecisionCache:
+    def __init__(self, backend: CacheBackend, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def lookup(self, product_name: str, products: List[ai.Product]) -> Optional[ai.Choice]:
+        key = normalize_name(product_name)
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry["storedAt"] > self.ttl:
+            self.backend.delete(key)
+            entry = None
+        choice = self._reuse(entry, products) if entry is not None else None
+
+        with self.lock:
+            if choice is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        tracing.count("decision_cache.misses" if choice is None else "decision_cache.hits")
+
+        if entry is not None and choice is not None:
+            entry["usedAt"] = time.time()
+            self.backend.put(key, entry)
+        return choice
+
+    def store(self, product_name: str, products: List[ai.Product], choice: ai.Choice) -> dict:
+        now = time.time()
+        entry = {
+            "fingerprint": fingerprint(products),
+            "choice": choice.to_dict(),
+            "storedAt": now,
+            "usedAt": now,
+            "expiresAt": now + self.ttl,
+        }
+        self.backend.put(normalize_name(product_name), entry)
+        return entry
+
+    def decide(self, product_name: str, products: List[ai.Product], choose: Callable[[], ai.Choice]) -> ai.Choice:
+        key = normalize_name(product_name)
+        with self.lock:
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if future is None:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not is_owner:
+            # another list is asking about the same item right now, so its answer is reused if it fits these products
+            tracing.count("decision_cache.coalesced")
+            try:
+                choice = self._reuse(future.result(), products)
+            except Exception:
+                choice = None
+            if choice is not None:
+                return choice
+            choice = choose()
+            self.store(product_name, products, choice)
+            return choice
+
+        try:
+            # the list that asked just before may have stored its answer after this one's lookup missed
+            entry = self.backend.get(key)
+            fresh = entry is not None and time.time() - entry["storedAt"] <= self.ttl
+            choice = self._reuse(entry, products) if entry is not None and fresh else None
+            if choice is not None:
+                with self.lock:
+                    self.coalesced += 1
+                future.set_result(entry)
+                return choice
+            choice = choose()
+            future.set_result(self.store(product_name, products, choice))
+            return choice
+        except Exception as exception:
+            future.set_exception(exception)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def peek_product_id(self, product_name: str) -> Optional[str]:
+        entry = self.backend.get(normalize_name(product_name))
+        if entry is None or time.time() - entry["storedAt"] > self.ttl:
+            return None
+        product = entry["choice"].get("product")
+        return product["id"] if product else None
+
+    def compact(self):
+        self.backend.evict(self.max_entries)
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+
+    def report(self) -> str:
+        return f"Decision cache: {self.hits} hits, {self.coalesced} coalesced, {self.misses} misses"
+
+    def _reuse(self, entry: dict, products: List[ai.Product]) -> Optional[ai.Choice]:
+        choice = ai.Choice.from_dict(entry["choice"])
+        if entry["fingerprint"] == fingerprint(products):
+            return choice
+        if not choice.is_product_chosen or choice.product is None:
+            return None
+
+        product = next((product for product in products if product.id == choice.product.id), None)
+        if product is None:
+            return None
+        return ai.Choice(
+            True,
+            choice.reason,
+            ai.ChosenProduct(product.id, choice.product.name, product.price, product.price_after_promotion),
+        )
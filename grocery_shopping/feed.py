@@ -0,0 +1,173 @@
+import codecs
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Iterator, Optional
+
+import grocery_shopping.http_client as http_client
+import grocery_shopping.tracing as tracing
+
+
+FEED_URL = "https://commerce.frisco.pl/api/v1/integration/feeds/public?language=pl"
+DEFAULT_INDEX_PATH = "/tmp/products_feed.sqlite3"
+CHUNK_SIZE = 64 * 1024
+INSERT_BATCH_SIZE = 1000
+
+
+class ProductsFeed:
+    def __init__(self, index_path: Optional[str] = None, max_age: float = 3600):
+        self.index_path = index_path or DEFAULT_INDEX_PATH
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS components (product_id TEXT PRIMARY KEY, components TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.connection.commit()
+
+    def refresh(self) -> "ProductsFeed":
+        refreshed_at = self._get_meta("refreshed_at")
+        if refreshed_at is not None and time.time() - float(refreshed_at) < self.max_age:
+            return self
+
+        headers = {}
+        etag = self._get_meta("etag")
+        last_modified = self._get_meta("last_modified")
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+        start_time = time.perf_counter()
+        with tracing.span("feed.refresh"), http_client.get(FEED_URL, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                print("Products feed not modified")
+                self._set_meta({"refreshed_at": str(time.time())})
+                return self
+            response.raise_for_status()
+            count = self._rebuild(_iter_products(_iter_text(response.iter_content(CHUNK_SIZE))))
+            meta = {"refreshed_at": str(time.time())}
+            if "ETag" in response.headers:
+                meta["etag"] = response.headers["ETag"]
+            if "Last-Modified" in response.headers:
+                meta["last_modified"] = response.headers["Last-Modified"]
+            self._set_meta(meta)
+        print(f"Products feed indexed {count} products in {time.perf_counter() - start_time:.2f}s")
+        return self
+
+    def get_components(self, product_id: str) -> str:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT components FROM components WHERE product_id = ?", (product_id,)
+            ).fetchone()
+        return row[0] if row else ""
+
+    def close(self):
+        self.connection.close()
+
+    def _rebuild(self, products: Iterator[dict]) -> int:
+        count = 0
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM components")
+            batch = []
+            for product in products:
+                components = (product.get("contentData") or {}).get("components", "")
+                count += 1
+                if not components:
+                    continue
+                batch.append((product["productId"], components))
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    self.connection.executemany("INSERT OR REPLACE INTO components VALUES (?, ?)", batch)
+                    batch = []
+            self.connection.executemany("INSERT OR REPLACE INTO components VALUES (?, ?)", batch)
+        return count
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, values: dict):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", values.items())
+
+
+def _iter_text(chunks: Iterable[bytes]) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _iter_products(chunks: Iterable[str]) -> Iterator[dict]:
+    # the feed is parsed key by key rather than searched, so a "products" string inside another value cannot
+    # start the array, and a feed cut short raises instead of leaving a partial index
+    reader = _JsonReader(chunks)
+    reader.expect("{")
+    while reader.peek() != "}":
+        key = reader.decode()
+        reader.expect(":")
+        if key == "products":
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.decode()
+                if reader.peek() == ",":
+                    reader.expect(",")
+            return
+        reader.decode()
+        if reader.peek() == ",":
+            reader.expect(",")
+    raise ValueError("Products feed has no products")
+
+
+class _JsonReader:
+    def __init__(self, chunks: Iterable[str]):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read():
+                raise ValueError("Products feed ended unexpectedly")
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise ValueError(f"Products feed is malformed, expected {character!r} but found {self.buffer[self.position]!r}")
+        self.position += 1
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                end = -1
+            # a value that ends with the buffer may be a number or literal cut by the chunk boundary
+            if 0 <= end < len(self.buffer):
+                self.position = end
+                return value
+            if not self._read():
+                if end < 0:
+                    raise ValueError("Products feed ended unexpectedly")
+                self.position = end
+                return value
+
+    def _read(self) -> bool:
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
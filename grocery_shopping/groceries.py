@@ -1,37 +1,54 @@
+import json
 import re
+import uuid
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List
-
-import requests
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import grocery_shopping.config as config
+import grocery_shopping.http_client as http_client
 import grocery_shopping.meal_planing as meal_planing
+import grocery_shopping.tracing as tracing
 
 
 TASKS_BASE_URL = "https://api.todoist.com/rest/v2/tasks"
+SYNC_URL = "https://api.todoist.com/sync/v9/sync"
+SYNC_BATCH_SIZE = 100
 
 
+@dataclass(frozen=True, slots=True)
 class GroceryItem:
-    def __init__(self, name: str, quantity: int, task_id: str):
-        self.name = name
-        self.quantity = quantity
-        self.task_id = task_id
+    name: str
+    quantity: int
+    task_id: str
 
     def __str__(self) -> str:
         return f"{self.quantity}x {self.name}"
 
+    def to_dict(self) -> dict:
+        return {"name": self.name, "quantity": self.quantity, "taskId": self.task_id}
+
+    @staticmethod
+    def from_dict(data: dict) -> "GroceryItem":
+        return GroceryItem(data["name"], data["quantity"], data["taskId"])
+
+
+class BatchResult:
+    def __init__(self) -> None:
+        self.succeeded: List[str] = []
+        self.skipped: List[str] = []
+        self.failed: Dict[str, str] = {}
+
 
 class GroceryList:
-    def __init__(self, config_provider: config.ConfigProvider):
+    def __init__(self, config_provider: config.ConfigProvider, sync_url: str = SYNC_URL):
+        self.sync_url = sync_url
         todoist_secret = config_provider.get_value("todoist", "secret", is_secret=True)
         self.todoist_project_id = config_provider.get_value("todoist", "project_id")
         self.headers = {"Authorization": f"Bearer {todoist_secret}"}
 
     def get(self) -> List[GroceryItem]:
-        url = f"{TASKS_BASE_URL}?project_id={self.todoist_project_id}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        tasks = response.json()
+        tasks = self._get_tasks()
         grocery_list = []
 
         for task in tasks:
@@ -53,25 +70,81 @@ class GroceryList:
                 grocery_list.append(GroceryItem(product_name, 1, task["id"]))
         return grocery_list
 
-    def load(self, shopping_list: List[meal_planing.ShoppingListItem]):
+    def load(self, shopping_list: Iterable[meal_planing.ShoppingListItem]) -> BatchResult:
+        existing_contents = {_normalize_content(task["content"]) for task in self._get_tasks()}
+        result = BatchResult()
+        commands = []
+
         for item in shopping_list:
+            args: Dict[str, Any] = {"content": f"{item.quantity}x {item.name}", "project_id": self.todoist_project_id}
+            if item.quantity == 1:
+                args = {"content": item.name, "project_id": self.todoist_project_id, "description": item.store_link}
             if item.needed_for_date:
                 needed_for_date = datetime.fromisoformat(item.needed_for_date)
                 due_date = needed_for_date - timedelta(days=1)
-                self._add_grocery_item(item.name, item.quantity, due_date.strftime("%Y-%m-%d"), item.store_link)
-            else:
-                self._add_grocery_item(item.name, item.quantity, "", item.store_link)
+                args["due"] = {"string": due_date.strftime("%Y-%m-%d")}
+
+            content = _normalize_content(args["content"])
+            if content in existing_contents:
+                result.skipped.append(args["content"])
+                continue
+            existing_contents.add(content)
+            commands.append((args["content"], _command("item_add", args, temp_id=str(uuid.uuid4()))))
+
+        self._sync(commands, result)
+        return result
+
+    def complete(self, grocery_items: List[GroceryItem]) -> BatchResult:
+        result = BatchResult()
+        commands = [
+            (str(grocery_item), _command("item_close", {"id": grocery_item.task_id})) for grocery_item in grocery_items
+        ]
+        self._sync(commands, result)
+        return result
 
-    def _add_grocery_item(self, ingredient_name: str, quantity: int, due_date: str, description: str):
+    def _get_tasks(self) -> List[Dict[str, Any]]:
         url = f"{TASKS_BASE_URL}?project_id={self.todoist_project_id}"
-        data = {"content": f"{quantity}x {ingredient_name}", "due_string": due_date}
-        if quantity == 1:
-            data = {"content": ingredient_name, "due_string": due_date, "description": description}
-        response = requests.post(url, data=data, headers=self.headers)
+        with tracing.span("todoist.tasks"):
+            response = http_client.get(url, headers=self.headers)
         response.raise_for_status()
+        return response.json()
+
+    def _sync(self, commands: List[Tuple[str, Dict[str, Any]]], result: BatchResult):
+        for start in range(0, len(commands), SYNC_BATCH_SIZE):
+            batch = commands[start:start + SYNC_BATCH_SIZE]
+            try:
+                with tracing.span("todoist.sync"):
+                    response = http_client.post(
+                        self.sync_url,
+                        data={"commands": json.dumps([command for _, command in batch])},
+                        headers=self.headers,
+                    )
+                response.raise_for_status()
+                sync_status = response.json().get("sync_status", {})
+            except Exception as exception:
+                for name, _ in batch:
+                    result.failed[name] = str(exception)
+                continue
+
+            for name, command in batch:
+                status = sync_status.get(command["uuid"], "missing from sync_status")
+                if status == "ok":
+                    result.succeeded.append(name)
+                elif isinstance(status, dict):
+                    result.failed[name] = str(status.get("error", status))
+                else:
+                    result.failed[name] = str(status)
+
+        for name, error in result.failed.items():
+            print("Todoist command failed for", name, error)
+
+
+def _command(command_type: str, args: Dict[str, Any], temp_id: Optional[str] = None) -> Dict[str, Any]:
+    command = {"type": command_type, "uuid": str(uuid.uuid4()), "args": args}
+    if temp_id is not None:
+        command["temp_id"] = temp_id
+    return command
+
 
-    def complete(self, grocery_items: List[GroceryItem]):
-        for grocery_item in grocery_items:
-            url = f"{TASKS_BASE_URL}/{grocery_item.task_id}/close"
-            response = requests.post(url, headers=self.headers)
-            response.raise_for_status()
+def _normalize_content(content: str) -> str:
+    return " ".join(content.casefold().split())
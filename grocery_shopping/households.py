@@ -0,0 +1,111 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import grocery_shopping.decisions as decisions
+import grocery_shopping.feed as feed
+import grocery_shopping.prices as prices
+import grocery_shopping.shopping as shopping
+
+
+DEFAULT_MAX_WORKERS = 4
+NAME_PATTERN = re.compile(r"^[a-z0-9_-]+$")
+
+
+@dataclass(frozen=True, slots=True)
+class Household:
+    name: str
+    config_file: Optional[str] = None
+    config_prefix: str = ""
+
+    def path(self, path: str) -> str:
+        root, extension = os.path.splitext(path)
+        return f"{root}-{self.name}{extension}"
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Household":
+        return Household(data["name"], data.get("config_file"), data.get("config_prefix", ""))
+
+
+@dataclass(frozen=True, slots=True)
+class SharedCaches:
+    products_feed: feed.ProductsFeed
+    search_cache: shopping.SearchCache
+    decision_cache: decisions.DecisionCache
+    price_history: prices.PriceHistory
+
+    def reset_stats(self):
+        self.search_cache.reset_stats()
+        self.decision_cache.reset_stats()
+
+    def report(self) -> str:
+        return "\n".join([self.search_cache.report(), self.decision_cache.report()])
+
+
+@dataclass(frozen=True, slots=True)
+class HouseholdResult:
+    name: str
+    wall_time: float
+    error: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class BatchReport:
+    results: List[HouseholdResult]
+    wall_time: float
+
+    @property
+    def succeeded(self) -> List[HouseholdResult]:
+        return [result for result in self.results if result.error is None]
+
+    @property
+    def households_per_minute(self) -> float:
+        return len(self.succeeded) / self.wall_time * 60 if self.wall_time else 0.0
+
+    def summary(self) -> str:
+        lines = [
+            f"Households: {len(self.succeeded)} of {len(self.results)} shopped in {self.wall_time:.1f}s "
+            f"({self.households_per_minute:.1f} households/min)"
+        ]
+        for result in self.results:
+            status = "ok" if result.error is None else f"failed: {result.error}"
+            lines.append(f"  {result.name:<16} {result.wall_time:>7.1f}s  {status}")
+        return "\n".join(lines)
+
+
+def parse_households(data: List[Dict[str, Any]]) -> List[Household]:
+    households = [Household.from_dict(item) for item in data]
+    names = set()
+    for household in households:
+        # the name ends up in token, checkpoint and journal paths, so it has to be unique and path-safe
+        if not NAME_PATTERN.match(household.name):
+            raise ValueError(f"Invalid household name: {household.name!r}")
+        if household.name in names:
+            raise ValueError(f"Duplicate household name: {household.name}")
+        names.add(household.name)
+    return households
+
+
+def run_batch(
+    households: List[Household], shop: Callable[[Household], Any], max_workers: int = DEFAULT_MAX_WORKERS
+) -> BatchReport:
+    start_time = time.perf_counter()
+    # threads rather than processes, so every household hits the same in-memory search cache
+    # and waits for decisions another household is already asking the model about
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(households)))) as executor:
+        results = list(executor.map(lambda household: _run(household, shop), households))
+    return BatchReport(results, time.perf_counter() - start_time)
+
+
+def _run(household: Household, shop: Callable[[Household], Any]) -> HouseholdResult:
+    start_time = time.perf_counter()
+    error = None
+    try:
+        shop(household)
+    except Exception as exception:
+        print("Shopping failed for household", household.name, exception)
+        error = str(exception)
+    return HouseholdResult(household.name, time.perf_counter() - start_time, error)
@@ -0,0 +1,173 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import grocery_shopping.tracing as tracing
+
+
+DEFAULT_TIMEOUT = (5.0, 30.0)
+HOST_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "www.frisco.pl": (5.0, 30.0),
+    "commerce.frisco.pl": (5.0, 120.0),
+    "api.notion.com": (5.0, 30.0),
+    "api.todoist.com": (5.0, 30.0),
+}
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+
+class HttpClient:
+    def __init__(self, pool_size: int = 16):
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, requests.Session] = {}
+        self.stats: Dict[str, HostStats] = {}
+
+    def session(self, host: str) -> requests.Session:
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def mount(self, host: str, adapter: HTTPAdapter):
+        session = self.session(host)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        host = urlsplit(url).hostname or ""
+        session = self.session(host)
+        kwargs.setdefault("timeout", HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT))
+        retryable = method.upper() in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            start_time = time.perf_counter()
+            try:
+                with tracing.span(f"http.{host}"):
+                    response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(host, time.perf_counter() - start_time, error=True)
+                if not retryable or attempt >= MAX_RETRIES:
+                    raise
+                self._backoff(host, attempt, None)
+                attempt += 1
+                continue
+
+            self._record(host, time.perf_counter() - start_time, error=response.status_code >= 500)
+            if (
+                response.status_code not in RETRY_STATUSES
+                or attempt >= MAX_RETRIES
+                or (response.status_code != 429 and not retryable)
+            ):
+                return response
+            retry_after = response.headers.get("Retry-After")
+            response.close()
+            self._backoff(host, attempt, retry_after)
+            attempt += 1
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {}
+
+    def report(self) -> str:
+        with self.lock:
+            lines = [
+                f"{host}: {stats.requests} requests, {stats.retries} retries, {stats.errors} errors, "
+                f"avg {stats.total_latency / stats.requests:.3f}s, max {stats.max_latency:.3f}s"
+                for host, stats in sorted(self.stats.items())
+                if stats.requests
+            ]
+        return "HTTP\n" + "\n".join(lines) if lines else "HTTP: no requests"
+
+    def _record(self, host: str, latency: float, error: bool):
+        with self.lock:
+            stats = self.stats.setdefault(host, HostStats())
+            stats.requests += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if error:
+                stats.errors += 1
+
+    def _backoff(self, host: str, attempt: int, retry_after: Optional[str]):
+        with self.lock:
+            self.stats.setdefault(host, HostStats()).retries += 1
+        tracing.count(f"http.{host}.retries")
+        delay = _parse_retry_after(retry_after)
+        if delay is None:
+            delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * 2**attempt))
+        time.sleep(min(delay, MAX_BACKOFF))
+
+
+def _parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+client = HttpClient()
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return client.get(url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    return client.post(url, **kwargs)
+
+
+def put(url: str, **kwargs: Any) -> requests.Response:
+    return client.put(url, **kwargs)
+
+
+def patch(url: str, **kwargs: Any) -> requests.Response:
+    return client.patch(url, **kwargs)
+
+
+def delete(url: str, **kwargs: Any) -> requests.Response:
+    return client.delete(url, **kwargs)
@@ -0,0 +1,159 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Protocol, Tuple
+
+from openai import OpenAI
+
+from grocery_shopping import config
+
+
+DEFAULT_CHAT_MODEL = "gpt-4o-mini"
+REQUEST_TIMEOUT = 60.0
+
+_clients: Dict[str, OpenAI] = {}
+_assistants: Dict[str, Tuple[Optional[str], Optional[str], float]] = {}
+_lock = threading.Lock()
+
+
+class CallStats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.total_latency = 0.0
+            self.max_latency = 0.0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def record(self, latency: float, usage: Any):
+        with self.lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if usage is not None:
+                self.prompt_tokens += usage.prompt_tokens or 0
+                self.completion_tokens += usage.completion_tokens or 0
+
+    def report(self) -> str:
+        if not self.calls:
+            return "LLM: no calls"
+        return (
+            f"LLM: {self.calls} calls, avg {self.total_latency / self.calls:.2f}s, max {self.max_latency:.2f}s, "
+            f"{self.prompt_tokens} prompt tokens, {self.completion_tokens} completion tokens"
+        )
+
+
+class LLMBackend(Protocol):
+    stats: CallStats
+
+    def complete(self, content: str, schema_name: str, schema: dict) -> Optional[str]: ...
+
+
+class AssistantsBackend:
+    def __init__(
+        self,
+        client: OpenAI,
+        assistant_id: str,
+        poll_interval: float = 0.25,
+        max_poll_interval: float = 2.0,
+        run_timeout: float = 120.0,
+    ):
+        self.client = client
+        self.assistant_id = assistant_id
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.run_timeout = run_timeout
+        self.stats = CallStats()
+
+    def complete(self, content: str, schema_name: str, schema: dict) -> Optional[str]:
+        start_time = time.perf_counter()
+        run = self.client.beta.threads.create_and_run(
+            assistant_id=self.assistant_id,
+            thread={"messages": [{"role": "user", "content": content}]},
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "schema": schema, "strict": True},
+            },
+        )
+
+        poll_interval = self.poll_interval
+        while run.status in ("queued", "in_progress"):
+            if time.perf_counter() - start_time > self.run_timeout:
+                self.client.beta.threads.runs.cancel(run.id, thread_id=run.thread_id)
+                raise TimeoutError(f"Run did not finish within {self.run_timeout}s")
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, self.max_poll_interval)
+            run = self.client.beta.threads.runs.retrieve(run.id, thread_id=run.thread_id)
+
+        self.stats.record(time.perf_counter() - start_time, run.usage)
+        if run.status != "completed":
+            raise Exception(f"Run failed with status: {run.status}, error: {run.last_error}")
+
+        messages = self.client.beta.threads.messages.list(thread_id=run.thread_id, order="desc", limit=1).data
+        if len(messages) == 0 or len(messages[0].content) == 0:
+            return None
+        message_content = messages[0].content[0]
+        assert message_content.type == "text", "Message content type should be text"
+        return message_content.text.value
+
+
+class ChatCompletionsBackend:
+    def __init__(self, client: OpenAI, model: str, instructions: str):
+        self.client = client
+        self.model = model
+        self.instructions = instructions
+        self.stats = CallStats()
+
+    def complete(self, content: str, schema_name: str, schema: dict) -> Optional[str]:
+        start_time = time.perf_counter()
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.instructions},
+                {"role": "user", "content": content},
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "schema": schema, "strict": True},
+            },
+        )
+        self.stats.record(time.perf_counter() - start_time, completion.usage)
+        return completion.choices[0].message.content
+
+
+def create_backend(config_provider: config.ConfigProvider) -> LLMBackend:
+    api_key = config_provider.get_value("openai", "secret", is_secret=True)
+    assistant_id = config_provider.get_value("openai", "grocery_shopping_assistant_id")
+    client = _get_client(api_key)
+    backend = config_provider.get_value("openai", "backend", default="assistants")
+
+    if backend == "assistants":
+        return AssistantsBackend(client, assistant_id)
+    if backend == "chat":
+        # the assistant keeps the shopping preferences, so the chat path reuses its instructions
+        assistant_model, instructions = _get_assistant(client, assistant_id)
+        model = config_provider.get_value("openai", "model", default=assistant_model or DEFAULT_CHAT_MODEL)
+        return ChatCompletionsBackend(client, model, instructions or "")
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+def _get_client(api_key: str) -> OpenAI:
+    with _lock:
+        if api_key not in _clients:
+            _clients.clear()
+            _clients[api_key] = OpenAI(api_key=api_key, timeout=REQUEST_TIMEOUT)
+        return _clients[api_key]
+
+
+def _get_assistant(client: OpenAI, assistant_id: str) -> Tuple[Optional[str], Optional[str]]:
+    with _lock:
+        cached = _assistants.get(assistant_id)
+    if cached is None or time.monotonic() - cached[2] > config.CACHE_TTL:
+        assistant = client.beta.assistants.retrieve(assistant_id)
+        cached = (assistant.model, assistant.instructions, time.monotonic())
+        with _lock:
+            _assistants[assistant_id] = cached
+    return cached[0], cached[1]
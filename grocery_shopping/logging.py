@@ -1,18 +1,39 @@
 import json
+import os
+import queue
+import threading
+import time
 from datetime import datetime
-
-import requests
+from typing import Optional
 
 import grocery_shopping.config as config
+import grocery_shopping.http_client as http_client
+import grocery_shopping.throttling as throttling
+import grocery_shopping.tracing as tracing
 from grocery_shopping.groceries import GroceryItem
 from grocery_shopping.ai import Choice
 
 
 PAGES_BASE_URL = "https://api.notion.com/v1/pages"
+DEFAULT_JOURNAL_PATH = "/tmp/notion_journal.jsonl"
+PAGE_CREATE_TIMEOUT = (5.0, 10.0)
 
 
 class Logger:
-    def __init__(self, config_provider: config.ConfigProvider):
+    def __init__(
+        self,
+        config_provider: config.ConfigProvider,
+        journal_path: Optional[str] = None,
+        requests_per_second: float = 3.0,
+    ):
+        self.journal_path = journal_path or DEFAULT_JOURNAL_PATH
+        self.rate_limiter = throttling.RateLimiter(requests_per_second)
+        self.records: queue.Queue[Optional[dict]] = queue.Queue()
+        self.journal_lock = threading.Lock()
+        # items are logged from the shopping threads, and only one of them may start the worker and replay the journal
+        self.worker_lock = threading.Lock()
+        self.worker: Optional[threading.Thread] = None
+        self.notion_down = False
         notion_secret = config_provider.get_value("notion", "secret", is_secret=True)
         self.grocery_shopping_database_id = config_provider.get_value("notion", "grocery_shopping_database_id")
         self.choice_database_id = config_provider.get_value("notion", "choice_database_id")
@@ -30,22 +51,24 @@ class Logger:
                 "Start time": {"date": {"start": start_time.isoformat(timespec="seconds")}}
             },
         }
-        response = requests.post(PAGES_BASE_URL, data=json.dumps(data), headers=self.headers)
+        response = http_client.post(PAGES_BASE_URL, data=json.dumps(data), headers=self.headers)
         response.raise_for_status()
+        self._start_worker()
         return response.json()["id"]
 
-    def log_shopping_end(self, grocery_shopping_id: str, end_time: datetime) -> str:
+    def log_shopping_end(self, grocery_shopping_id: str, end_time: datetime, deadline: Optional[float] = None) -> str:
+        self.flush(deadline)
         url = f"{PAGES_BASE_URL}/{grocery_shopping_id}"
         data = {
             "properties": {
                 "End time": {"date": {"start": end_time.isoformat(timespec="seconds")}}
             }
         }
-        response = requests.patch(url, data=json.dumps(data), headers=self.headers)
+        response = http_client.patch(url, data=json.dumps(data), headers=self.headers)
         response.raise_for_status()
         return response.json()["id"]
 
-    def log_choice(self, grocery_shopping_id: str, grocery_item: GroceryItem, choice: Choice) -> str:
+    def log_choice(self, grocery_shopping_id: str, grocery_item: GroceryItem, choice: Choice):
         if choice.is_product_chosen:
             assert choice.product is not None, "Product should not be None when is_product_chosen is True"
             data = {
@@ -75,7 +98,79 @@ class Logger:
                     "Reason": {"rich_text": [{"type": "text", "text": {"content": choice.reason}}]},
                 },
             }
-        response = requests.post(PAGES_BASE_URL, data=json.dumps(data), headers=self.headers)
-        response.raise_for_status()
-        return response.json()["id"]
-    
\ No newline at end of file
+        self._start_worker()
+        self.records.put(data)
+
+    def flush(self, deadline: Optional[float] = None):
+        with self.worker_lock:
+            if self.worker is None:
+                return
+            with tracing.span("notion.flush"):
+                self.records.put(None)
+                self.worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                if self.worker.is_alive():
+                    # out of time, so the records still waiting go to the journal and the next run replays them
+                    self.notion_down = True
+                    self._spill_pending()
+            self.worker = None
+
+    def _start_worker(self):
+        with self.worker_lock:
+            if self.worker is not None:
+                return
+            self.notion_down = False
+            for record in self._take_journal():
+                self.records.put(record)
+            self.worker = threading.Thread(target=self._write_records, name="notion-logger", daemon=True)
+            self.worker.start()
+
+    def _write_records(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                return
+            if self.notion_down:
+                self._spill(record)
+                continue
+            self.rate_limiter.wait()
+            try:
+                with tracing.span("notion.log"):
+                    response = http_client.post(
+                        PAGES_BASE_URL, data=json.dumps(record), headers=self.headers, timeout=PAGE_CREATE_TIMEOUT
+                    )
+                    response.raise_for_status()
+            except Exception as exception:
+                print("Notion logging failed, writing to journal", exception)
+                self.notion_down = True
+                self._spill(record)
+
+    def _spill_pending(self):
+        stopped = False
+        while True:
+            try:
+                record = self.records.get_nowait()
+            except queue.Empty:
+                break
+            if record is None:
+                stopped = True
+            else:
+                self._spill(record)
+        if stopped:
+            # the worker is still busy with its last record and has to find the stop marker afterwards
+            self.records.put(None)
+
+    def _spill(self, record: dict):
+        tracing.count("notion.journaled")
+        with self.journal_lock, open(self.journal_path, "a", encoding="utf-8") as journal:
+            journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _take_journal(self) -> list[dict]:
+        with self.journal_lock:
+            if not os.path.isfile(self.journal_path):
+                return []
+            with open(self.journal_path, encoding="utf-8") as journal:
+                records = [json.loads(line) for line in journal if line.strip()]
+            os.remove(self.journal_path)
+        if records:
+            print(f"Replaying {len(records)} journaled Notion log entries")
+        return records
@@ -0,0 +1,156 @@
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+import grocery_shopping.ai as ai
+import grocery_shopping.config as config
+import grocery_shopping.decisions as decisions
+import grocery_shopping.meal_planing as meal_planing
+import grocery_shopping.tracing as tracing
+
+
+NGRAM_SIZE = 3
+DIMENSIONS = 2048
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MARGIN = 0.1
+MATCHED = "matched"
+AMBIGUOUS = "ambiguous"
+UNKNOWN = "unknown"
+
+
+@dataclass(frozen=True, slots=True)
+class Match:
+    product_id: str
+    score: float
+    known_name: str
+
+
+class ProductMatcher:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, margin: float = DEFAULT_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.known: Set[Tuple[str, str]] = set()
+        self.names: List[str] = []
+        self.product_ids: List[str] = []
+        self.product_codes: Dict[str, int] = {}
+        self.row_codes = np.empty(0, dtype=np.int32)
+        self.vectors = np.empty((0, DIMENSIONS), dtype=np.float32)
+        self.synced_at: Optional[datetime] = None
+        self.reset_stats()
+
+    def add(self, pairs: Iterable[Tuple[str, str]]):
+        with self.lock:
+            new_pairs = []
+            for name, product_id in pairs:
+                key = (decisions.normalize_name(name), product_id)
+                if key[0] and key[1] and key not in self.known:
+                    self.known.add(key)
+                    new_pairs.append(key)
+            if not new_pairs:
+                return
+            self.names.extend(name for name, _ in new_pairs)
+            codes = [self.product_codes.setdefault(product_id, len(self.product_codes)) for _, product_id in new_pairs]
+            self.product_ids.extend(product_id for _, product_id in new_pairs)
+            self.row_codes = np.concatenate([self.row_codes, np.array(codes, dtype=np.int32)])
+            self.vectors = np.vstack([self.vectors, np.vstack([vectorize(name) for name, _ in new_pairs])])
+
+    def refresh(self, config_provider: config.ConfigProvider) -> "ProductMatcher":
+        notion_secret = config_provider.get_value("notion", "secret", is_secret=True)
+        choice_database_id = config_provider.get_value("notion", "choice_database_id")
+        headers = {
+            "Authorization": f"Bearer {notion_secret}",
+            "Notion-Version": "2022-06-28",
+            "Content-Type": "application/json",
+        }
+        filters: List[Dict[str, Any]] = [{"property": "Store product id", "rich_text": {"is_not_empty": True}}]
+        if self.synced_at is not None:
+            # Notion rounds last_edited_time down to the minute, so keep a minute of overlap
+            synced_at = (self.synced_at - timedelta(minutes=1)).isoformat(timespec="seconds")
+            filters.append({"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": synced_at}})
+
+        started_at = datetime.now(timezone.utc)
+        pairs = []
+        for page in meal_planing.query_database(choice_database_id, headers, {"and": filters}):
+            properties = page["properties"]
+            product_id = _plain_text(properties["Store product id"]["rich_text"])
+            pairs.append((_plain_text(properties["Product name"]["title"]), product_id))
+            if "Store product name" in properties:
+                pairs.append((_plain_text(properties["Store product name"]["rich_text"]), product_id))
+        self.add(pairs)
+        self.synced_at = started_at
+        print(f"Product matcher knows {len(self.names)} names")
+        return self
+
+    def match(self, product_name: str, products: List[ai.Product]) -> Optional[Match]:
+        start_time = time.perf_counter()
+        status, match = self._match(product_name, products)
+        duration = time.perf_counter() - start_time
+        with self.lock:
+            self.counts[status] += 1
+            self.total_time += duration
+        tracing.count(f"matcher.{status}")
+        return match
+
+    def reset_stats(self):
+        with self.lock:
+            self.counts = {MATCHED: 0, AMBIGUOUS: 0, UNKNOWN: 0}
+            self.total_time = 0.0
+
+    def report(self) -> str:
+        with self.lock:
+            lookups = sum(self.counts.values())
+            matched = self.counts[MATCHED]
+            average = self.total_time / lookups * 1e6 if lookups else 0.0
+            return (
+                f"Product matcher: {matched} of {lookups} items matched ({matched / lookups if lookups else 0.0:.0%}), "
+                f"{self.counts[AMBIGUOUS]} ambiguous, {self.counts[UNKNOWN]} unknown, "
+                f"{matched} LLM calls avoided, avg {average:.0f}µs per item"
+            )
+
+    def _match(self, product_name: str, products: List[ai.Product]) -> Tuple[str, Optional[Match]]:
+        with self.lock:
+            names, product_ids, product_codes = self.names, self.product_ids, self.product_codes
+            row_codes, vectors = self.row_codes, self.vectors
+        if not names or not products:
+            return UNKNOWN, None
+
+        # a name has only a few dozen n-grams, so only those columns take part in the cosine similarity
+        query = vectorize(decisions.normalize_name(product_name))
+        columns = np.flatnonzero(query)
+        scores = vectors[:, columns] @ query[columns]
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return UNKNOWN, None
+
+        is_available = np.zeros(len(product_codes), dtype=bool)
+        is_available[[product_codes[product.id] for product in products if product.id in product_codes]] = True
+        available_scores = np.where(is_available[row_codes], scores, -1.0)
+        chosen = int(np.argmax(available_scores))
+        # the usual product is out of stock, or the name was bought as different products: the model decides
+        if available_scores[chosen] < scores[best] - self.margin:
+            return AMBIGUOUS, None
+        other_scores = scores[row_codes != row_codes[chosen]]
+        if other_scores.size and available_scores[chosen] - other_scores.max() < self.margin:
+            return AMBIGUOUS, None
+        return MATCHED, Match(product_ids[chosen], float(available_scores[chosen]), names[chosen])
+
+
+def vectorize(name: str) -> np.ndarray:
+    padded = f" {name} "
+    indices = [
+        zlib.crc32(padded[start:start + NGRAM_SIZE].encode("utf-8")) % DIMENSIONS
+        for start in range(max(1, len(padded) - NGRAM_SIZE + 1))
+    ]
+    vector = np.bincount(indices, minlength=DIMENSIONS).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _plain_text(rich_text: List[Dict[str, Any]]) -> str:
+    return "".join(part.get("plain_text", part.get("text", {}).get("content", "")) for part in rich_text)
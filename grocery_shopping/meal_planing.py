@@ -1,52 +1,94 @@
 import json
-from typing import List, Optional
-
-import requests
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
 
 import grocery_shopping.config as config
+import grocery_shopping.http_client as http_client
+import grocery_shopping.tracing as tracing
+
 
+DEFAULT_CHECKPOINT_PATH = "/tmp/meal_plan_checkpoint.json"
+PAGE_SIZE = 100
 
+
+@dataclass(frozen=True, slots=True)
 class ShoppingListItem:
-    def __init__(self, name: str, quantity: int, needed_for_date: Optional[str], store_link: str):
-        self.name = name
-        self.quantity = quantity
-        self.needed_for_date = needed_for_date
-        self.store_link = store_link
+    name: str
+    quantity: int
+    needed_for_date: Optional[str]
+    store_link: str
 
 
 class MealPlan:
-    def __init__(self, config_provider: config.ConfigProvider):
+    def __init__(self, config_provider: config.ConfigProvider, checkpoint_path: Optional[str] = None):
         self.notion_secret = config_provider.get_value("notion", "secret", is_secret=True)
         self.notion_database_id = config_provider.get_value("notion", "ingredients_database_id")
+        self.checkpoint_path = checkpoint_path or DEFAULT_CHECKPOINT_PATH
+        self.query_started_at: Optional[datetime] = None
 
     def get_shopping_list(self) -> List[ShoppingListItem]:
-        shopping_list = []
-        url = f"https://api.notion.com/v1/databases/{self.notion_database_id}/query"
+        return list(self.iter_shopping_list())
+
+    def iter_shopping_list(self, incremental: bool = False) -> Iterator[ShoppingListItem]:
+        filters: List[Dict[str, Any]] = [
+            {"property": "Got it", "checkbox": {"equals": False}},
+            {"property": "To buy", "checkbox": {"equals": True}},
+        ]
+        last_run = self._read_checkpoint() if incremental else None
+        if last_run is not None:
+            filters.append({"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": last_run}})
+
+        self.query_started_at = datetime.now(timezone.utc)
         headers = {
             "Authorization": f"Bearer {self.notion_secret}",
             "Notion-Version": "2022-06-28",
             "Content-Type": "application/json",
         }
-        data = {
-            "filter": {
-                "and": [
-                    {"property": "Got it", "checkbox": {"equals": False}},
-                    {"property": "To buy", "checkbox": {"equals": True}},
-                ]
-            }
-        }
-        response = requests.post(url, data=json.dumps(data), headers=headers)
-        response.raise_for_status()
-        response_json = response.json()
-        ingredients = response_json["results"]
-        for ingredient in ingredients:
-            shopping_list.append(
-                ShoppingListItem(
-                    ingredient["properties"]["Ingredient"]["title"][0]["plain_text"],
-                    ingredient["properties"]["Quantity"]["number"] or 1,
-                    ingredient["properties"]["Needed for date"]["formula"]["date"]["start"] if "date" in ingredient["properties"]["Needed for date"]["formula"] else None,
-                    ingredient["properties"]["Frisco"]["formula"]["string"],
-                )
-            )
-        return shopping_list
-    
\ No newline at end of file
+        for ingredient in query_database(self.notion_database_id, headers, {"and": filters}):
+            yield parse_ingredient(ingredient)
+
+    def save_checkpoint(self):
+        if self.query_started_at is None:
+            return
+        # Notion rounds last_edited_time down to the minute, so keep a minute of overlap
+        checkpoint = self.query_started_at - timedelta(minutes=1)
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"lastRun": checkpoint.isoformat(timespec="seconds")}, file)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def _read_checkpoint(self) -> Optional[str]:
+        if not os.path.isfile(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, encoding="utf-8") as file:
+            return json.load(file).get("lastRun")
+
+
+def parse_ingredient(ingredient: Dict[str, Any]) -> ShoppingListItem:
+    properties = ingredient["properties"]
+    needed_for_date = properties["Needed for date"]["formula"].get("date")
+    return ShoppingListItem(
+        properties["Ingredient"]["title"][0]["plain_text"],
+        properties["Quantity"]["number"] or 1,
+        needed_for_date["start"] if needed_for_date else None,
+        properties["Frisco"]["formula"]["string"],
+    )
+
+
+def query_database(database_id: str, headers: Dict[str, str], filter: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    url = f"https://api.notion.com/v1/databases/{database_id}/query"
+    data: Dict[str, Any] = {"page_size": PAGE_SIZE}
+    if filter is not None:
+        data["filter"] = filter
+
+    while True:
+        with tracing.span("notion.query"):
+            response = http_client.post(url, data=json.dumps(data), headers=headers)
+            response.raise_for_status()
+            response_json = response.json()
+        yield from response_json["results"]
+        if not response_json.get("has_more") or not response_json.get("next_cursor"):
+            break
+        data["start_cursor"] = response_json["next_cursor"]
@@ -1,6 +1,5 @@
-import requests
-
 import grocery_shopping.config as config
+import grocery_shopping.http_client as http_client
 
 
 class Notifier:
@@ -9,5 +8,5 @@ class Notifier:
         self.headers = {"Content-Type": "text/plain; charset=utf-8"}
 
     def update_status(self, message: str):
-        response = requests.post(self.url, data=message.encode("utf-8"), headers=self.headers)
+        response = http_client.post(self.url, data=message.encode("utf-8"), headers=self.headers)
         response.raise_for_status()
@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import grocery_shopping.ai as ai
+import grocery_shopping.decisions as decisions
+
+
+DEFAULT_PATH = "/tmp/price_history.sqlite3"
+DEFAULT_WEEKS = 8
+DAY = 24 * 3600
+
+
+class ProductStats:
+    def __init__(self, typical_price: float, times_chosen: int):
+        self.typical_price = typical_price
+        self.times_chosen = times_chosen
+
+
+class PriceHistory:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_PATH
+        self.lock = threading.Lock()
+        self.pending: Dict[Tuple[str, str], Tuple[float, float, float, int]] = {}
+        self.chosen: Set[Tuple[str, str]] = set()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # one row per item, product and day keeps years of history small and every query on the primary key
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS prices ("
+            "item TEXT NOT NULL, product_id TEXT NOT NULL, day INTEGER NOT NULL, "
+            "price REAL NOT NULL, price_after_promotion REAL NOT NULL, unit_price REAL NOT NULL, "
+            "chosen INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (item, product_id, day)) WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    def observe(self, product_name: str, products: List[ai.Product]):
+        item = decisions.normalize_name(product_name)
+        with self.lock:
+            for product in products:
+                chosen = self.pending.get((item, product.id), (0.0, 0.0, 0.0, 0))[3]
+                self.pending[(item, product.id)] = (
+                    product.price, product.price_after_promotion, unit_price(product), chosen
+                )
+
+    def observe_choice(self, product_name: str, product_id: str):
+        key = (decisions.normalize_name(product_name), product_id)
+        with self.lock:
+            if key in self.pending:
+                self.pending[key] = self.pending[key][:3] + (1,)
+            else:
+                # the price was observed by another process, e.g. a shard worker, so only its row is flagged
+                self.chosen.add(key)
+
+    def flush(self):
+        day = int(time.time() // DAY)
+        with self.lock:
+            rows = [(item, product_id, day, *values) for (item, product_id), values in self.pending.items()]
+            chosen = [(item, product_id, day) for item, product_id in self.chosen]
+            self.pending = {}
+            self.chosen = set()
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (item, product_id, day) DO UPDATE SET "
+                    "price = excluded.price, price_after_promotion = excluded.price_after_promotion, "
+                    "unit_price = excluded.unit_price, chosen = MAX(chosen, excluded.chosen)",
+                    rows,
+                )
+                self.connection.executemany(
+                    "UPDATE prices SET chosen = 1 WHERE item = ? AND product_id = ? AND day = ?", chosen
+                )
+        if rows:
+            print(f"Price history: recorded {len(rows)} prices")
+
+    def best_unit_price(self, product_name: str, weeks: int = DEFAULT_WEEKS) -> Optional[float]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT MIN(unit_price) FROM prices WHERE item = ? AND day >= ?",
+                (decisions.normalize_name(product_name), _first_day(weeks)),
+            ).fetchone()
+        return row[0]
+
+    def product_stats(self, product_name: str, product_ids: List[str], weeks: int = DEFAULT_WEEKS) -> Dict[str, ProductStats]:
+        if not product_ids:
+            return {}
+        placeholders = ", ".join("?" * len(product_ids))
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT product_id, AVG(price_after_promotion), SUM(chosen) "
+                f"FROM prices WHERE item = ? AND product_id IN ({placeholders}) AND day >= ? GROUP BY product_id",
+                (decisions.normalize_name(product_name), *product_ids, _first_day(weeks)),
+            ).fetchall()
+        return {row[0]: ProductStats(row[1], row[2]) for row in rows}
+
+    def close(self):
+        self.connection.close()
+
+
+def unit_price(product: ai.Product) -> float:
+    if product.grammage and product.grammage > 0:
+        return product.price_after_promotion / product.grammage
+    return product.price_after_promotion
+
+
+def _first_day(weeks: int) -> int:
+    return int(time.time() // DAY) - weeks * 7
@@ -0,0 +1,166 @@
+import threading
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+import grocery_shopping.ai as ai
+import grocery_shopping.decisions as decisions
+import grocery_shopping.prices as prices
+import grocery_shopping.tracing as tracing
+
+
+NAME_WEIGHT = 0.55
+UNIT_PRICE_WEIGHT = 0.2
+PROMOTION_WEIGHT = 0.05
+PAST_CHOICE_WEIGHT = 0.2
+
+
+class ScoredProduct:
+    def __init__(self, product: ai.Product, score: float, name_similarity: float):
+        self.product = product
+        self.score = score
+        self.name_similarity = name_similarity
+
+
+class Ranking:
+    def __init__(self, candidates: List[ai.Product], winner: Optional[ai.Product], pruned: int, tokens_saved: int):
+        self.candidates = candidates
+        self.winner = winner
+        self.pruned = pruned
+        self.tokens_saved = tokens_saved
+
+
+class CandidateRanker:
+    def __init__(
+        self,
+        top_k: int = 8,
+        clear_win_margin: float = 0.3,
+        min_winner_similarity: float = 0.6,
+        decision_cache: Optional[decisions.DecisionCache] = None,
+        price_history: Optional[prices.PriceHistory] = None,
+        history_weeks: int = prices.DEFAULT_WEEKS,
+    ):
+        self.top_k = top_k
+        self.clear_win_margin = clear_win_margin
+        self.min_winner_similarity = min_winner_similarity
+        self.decision_cache = decision_cache
+        self.price_history = price_history
+        self.history_weeks = history_weeks
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def rank(self, product_name: str, products: List[ai.Product]) -> Ranking:
+        scored = self.score(product_name, products)
+        candidates = [scored_product.product for scored_product in scored[: self.top_k]]
+
+        winner = None
+        if scored and scored[0].name_similarity >= self.min_winner_similarity:
+            if len(scored) > 1:
+                if scored[0].score - scored[1].score >= self.clear_win_margin:
+                    winner = scored[0].product
+            # a lone search hit has nothing to win against, so it is only bought when it names every query word
+            elif _covers_query(product_name, scored[0].product.name):
+                winner = scored[0].product
+
+        tokens_before = _prompt_tokens(products)
+        tokens_after = 0 if winner else _prompt_tokens(candidates)
+        ranking = Ranking(candidates, winner, len(products) - len(candidates), tokens_before - tokens_after)
+
+        with self.lock:
+            self.ranked += 1
+            self.pruned += ranking.pruned
+            self.tokens_saved += ranking.tokens_saved
+            if winner:
+                self.llm_skipped += 1
+        tracing.count("ranking.pruned", ranking.pruned)
+        if winner:
+            tracing.count("ranking.llm_skipped")
+        return ranking
+
+    def score(self, product_name: str, products: List[ai.Product]) -> List[ScoredProduct]:
+        if not products:
+            return []
+
+        unit_prices = [prices.unit_price(product) for product in products]
+        cheapest_unit_price = min(unit_prices)
+        best_unit_price = (
+            self.price_history.best_unit_price(product_name, self.history_weeks) if self.price_history else None
+        )
+        if best_unit_price is not None and best_unit_price > 0:
+            # a product is only as good a deal as it looks against the cheapest per-kg price seen for the item lately
+            cheapest_unit_price = min(cheapest_unit_price, best_unit_price)
+        past_product_id = self.decision_cache.peek_product_id(product_name) if self.decision_cache else None
+        history = (
+            self.price_history.product_stats(product_name, [product.id for product in products], self.history_weeks)
+            if self.price_history
+            else {}
+        )
+
+        scored = []
+        for product, unit_price in zip(products, unit_prices):
+            name_similarity = _name_similarity(product_name, product.name)
+            stats = history.get(product.id)
+            # products bought for this item before are good substitutes when the cached choice is gone
+            past_choice = product.id == past_product_id or (stats is not None and stats.times_chosen > 0)
+            score = (
+                NAME_WEIGHT * name_similarity
+                + UNIT_PRICE_WEIGHT * (cheapest_unit_price / unit_price if unit_price > 0 else 0.0)
+                + PROMOTION_WEIGHT * _saving(product, stats)
+                + PAST_CHOICE_WEIGHT * (1.0 if past_choice else 0.0)
+            )
+            scored.append(ScoredProduct(product, score, name_similarity))
+        scored.sort(key=lambda scored_product: scored_product.score, reverse=True)
+        return scored
+
+    def reset_stats(self):
+        with self.lock:
+            self.ranked = 0
+            self.pruned = 0
+            self.tokens_saved = 0
+            self.llm_skipped = 0
+
+    def report(self) -> str:
+        return (
+            f"Candidate ranking: {self.pruned} candidates pruned across {self.ranked} items, "
+            f"~{self.tokens_saved} prompt tokens saved, {self.llm_skipped} LLM calls skipped"
+        )
+
+
+def _saving(product: ai.Product, stats: Optional[prices.ProductStats]) -> float:
+    # with history a promotion only counts when the price is really below what the product usually costs
+    if stats is not None and stats.typical_price > 0:
+        return max(0.0, (stats.typical_price - product.price_after_promotion) / stats.typical_price)
+    return (product.price - product.price_after_promotion) / product.price if product.price > 0 else 0.0
+
+
+def _name_similarity(product_name: str, store_product_name: str) -> float:
+    query = decisions.normalize_name(product_name)
+    name = decisions.normalize_name(store_product_name)
+    query_tokens = query.split()
+    name_tokens = name.split()
+    if not query_tokens or not name_tokens:
+        return 0.0
+
+    token_similarity = _matched_tokens(query_tokens, name_tokens) / len(query_tokens)
+    prefix_similarity = SequenceMatcher(None, query, name[: len(query) + 5]).ratio()
+    return max(token_similarity, prefix_similarity)
+
+
+def _covers_query(product_name: str, store_product_name: str) -> bool:
+    query_tokens = decisions.normalize_name(product_name).split()
+    name_tokens = decisions.normalize_name(store_product_name).split()
+    return bool(query_tokens) and _matched_tokens(query_tokens, name_tokens) == len(query_tokens)
+
+
+def _matched_tokens(query_tokens: List[str], name_tokens: List[str]) -> int:
+    return sum(
+        1 for query_token in query_tokens if any(_same_stem(query_token, name_token) for name_token in name_tokens)
+    )
+
+
+def _same_stem(query_token: str, name_token: str) -> bool:
+    stem_length = max(3, min(len(query_token), len(name_token)) - 2)
+    return query_token[:stem_length] == name_token[:stem_length]
+
+
+def _prompt_tokens(products: List[ai.Product]) -> int:
+    return ai.estimate_tokens(ai.prompt_payload(products))
@@ -0,0 +1,182 @@
+import functools
+import json
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Protocol
+
+import grocery_shopping.ai as ai
+import grocery_shopping.groceries as groceries
+
+
+DEFAULT_SHARD_SIZE = 25
+DEFAULT_PARALLELISM = 4
+DEFAULT_RUNNER = "local"
+
+
+@dataclass(frozen=True, slots=True)
+class ShardResult:
+    index: int
+    items: int
+    choices: Dict[str, ai.Choice] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    wall_time: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    requests: Dict[str, int] = field(default_factory=dict)
+    gb_seconds: float = 0.0
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "items": self.items,
+            "choices": {task_id: choice.to_dict() for task_id, choice in self.choices.items()},
+            "failed": self.failed,
+            "wallTime": self.wall_time,
+            "llmCalls": self.llm_calls,
+            "promptTokens": self.prompt_tokens,
+            "completionTokens": self.completion_tokens,
+            "requests": self.requests,
+            "gbSeconds": self.gb_seconds,
+            "error": self.error,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "ShardResult":
+        return ShardResult(
+            data["index"],
+            data["items"],
+            {task_id: ai.Choice.from_dict(choice) for task_id, choice in data.get("choices", {}).items()},
+            data.get("failed", {}),
+            data.get("wallTime", 0.0),
+            data.get("llmCalls", 0),
+            data.get("promptTokens", 0),
+            data.get("completionTokens", 0),
+            data.get("requests", {}),
+            data.get("gbSeconds", 0.0),
+            data.get("error"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ShardReport:
+    results: List[ShardResult]
+    wall_time: float
+
+    @property
+    def choices(self) -> Dict[str, ai.Choice]:
+        return {task_id: choice for result in self.results for task_id, choice in result.choices.items()}
+
+    def summary(self) -> str:
+        shard_time = sum(result.wall_time for result in self.results)
+        lines = [
+            f"Shards: {len(self.results)} in {self.wall_time:.1f}s ({shard_time:.1f}s of shard time), "
+            f"{sum(result.llm_calls for result in self.results)} LLM calls, "
+            f"{sum(result.prompt_tokens + result.completion_tokens for result in self.results)} tokens, "
+            f"{sum(result.gb_seconds for result in self.results):.1f} GB-s"
+        ]
+        for result in self.results:
+            status = "ok" if result.error is None else f"failed: {result.error}"
+            lines.append(
+                f"  shard {result.index:<3} {result.items:>4} items {result.wall_time:>7.1f}s "
+                f"{result.llm_calls:>4} LLM calls {result.prompt_tokens + result.completion_tokens:>7} tokens "
+                f"{sum(result.requests.values()):>5} requests {result.gb_seconds:>7.1f} GB-s  {status}"
+            )
+        return "\n".join(lines)
+
+
+class ShardRunner(Protocol):
+    # set when the workers see the coordinator's /tmp, so it can warm the shared files before the fan-out
+    is_local: bool
+
+    def map(self, events: List[dict]) -> List[dict]: ...
+
+
+class LocalRunner:
+    is_local = True
+
+    def __init__(
+        self,
+        worker: Callable[[dict, Any], dict],
+        parallelism: int = DEFAULT_PARALLELISM,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: tuple = (),
+    ):
+        self.worker = worker
+        self.parallelism = parallelism
+        self.initializer = initializer
+        self.initargs = initargs
+
+    def map(self, events: List[dict]) -> List[dict]:
+        # spawned workers start clean like cold Lambda containers, instead of inheriting the coordinator's
+        # sqlite connections and threads, and load the token it saved to FRISCO_TOKEN_STORE
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(max(1, min(self.parallelism, len(events))), self.initializer, self.initargs) as pool:
+            return pool.map(functools.partial(_invoke, self.worker), events)
+
+
+class LambdaRunner:
+    is_local = False
+
+    def __init__(self, function_name: str, parallelism: int = DEFAULT_PARALLELISM):
+        import boto3
+        from botocore.config import Config
+
+        self.function_name = function_name
+        self.parallelism = parallelism
+        # a shard may run for the whole Lambda timeout, so the synchronous invoke has to wait as long
+        self.client = boto3.client("lambda", config=Config(read_timeout=900, retries={"max_attempts": 0}))
+
+    def map(self, events: List[dict]) -> List[dict]:
+        with ThreadPoolExecutor(max_workers=max(1, min(self.parallelism, len(events)))) as executor:
+            return list(executor.map(self._invoke, events))
+
+    def _invoke(self, event: dict) -> dict:
+        try:
+            response = self.client.invoke(
+                FunctionName=self.function_name,
+                InvocationType="RequestResponse",
+                Payload=json.dumps(event).encode("utf-8"),
+            )
+            payload = json.loads(response["Payload"].read())
+        except Exception as exception:
+            return ShardResult(event["shard"], len(event["items"]), error=str(exception)).to_dict()
+        if "FunctionError" in response:
+            return ShardResult(event["shard"], len(event["items"]), error=payload.get("errorMessage")).to_dict()
+        return payload
+
+
+def create_runner(
+    spec: str, worker: Callable[[dict, Any], dict], parallelism: int = DEFAULT_PARALLELISM
+) -> ShardRunner:
+    kind, _, location = spec.partition(":")
+    if kind == "local":
+        return LocalRunner(worker, parallelism)
+    if kind == "lambda":
+        return LambdaRunner(location, parallelism)
+    raise ValueError(f"Unknown shard runner: {spec}")
+
+
+def split(grocery_items: List[groceries.GroceryItem], shard_size: int) -> List[List[groceries.GroceryItem]]:
+    shard_size = max(1, shard_size)
+    return [grocery_items[start:start + shard_size] for start in range(0, len(grocery_items), shard_size)]
+
+
+def run_shards(runner: ShardRunner, shards: List[List[groceries.GroceryItem]], event: Dict[str, Any]) -> ShardReport:
+    start_time = time.perf_counter()
+    events = [
+        {**event, "shard": index, "items": [grocery_item.to_dict() for grocery_item in shard]}
+        for index, shard in enumerate(shards)
+    ]
+    results = [ShardResult.from_dict(result) for result in runner.map(events)] if events else []
+    return ShardReport(results, time.perf_counter() - start_time)
+
+
+def _invoke(worker: Callable[[dict, Any], dict], event: dict) -> dict:
+    try:
+        return worker(event, None)
+    except Exception as exception:
+        return ShardResult(event["shard"], len(event["items"]), error=str(exception)).to_dict()
@@ -1,27 +1,42 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 import json
+import re
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Callable, Optional, Tuple
 
 import pytz
 import requests
 
+import grocery_shopping.auth as auth
 import grocery_shopping.config as config
 import grocery_shopping.groceries as groceries
 import grocery_shopping.ai as ai
+import grocery_shopping.checkpoints as checkpoints
+import grocery_shopping.decisions as decisions
+import grocery_shopping.feed as feed
+import grocery_shopping.http_client as http_client
 import grocery_shopping.logging as logging
+import grocery_shopping.prices as prices
+import grocery_shopping.ranking as ranking
+import grocery_shopping.throttling as throttling
+import grocery_shopping.tracing as tracing
+from grocery_shopping.auth import User
 
-
-STORE_BASE_URL = "https://www.frisco.pl/app/commerce"
+if TYPE_CHECKING:
+    import grocery_shopping.llm_backends as llm_backends
+    import grocery_shopping.matching as matching
 
 
-class User:
-    def __init__(self, user_id: str, token_type: str, access_token: str):
-        self.id = user_id
-        self.headers = {
-            "Authorization": f"{token_type} {access_token}",
-            "Content-Type": "application/json",
-        }
+STORE_BASE_URL = "https://www.frisco.pl/app/commerce"
+SEARCH_PAGE_SIZE = 50
+CART_BATCH_SIZE = 50
+SEARCH_CACHE_TTL = 600
+SEARCH_CACHE_MAX_ENTRIES = 1000
+SCHEDULE_DAYS = 3
+# only a conflict means another customer got the window first, a bad request is a bug in the reservation
+SLOT_TAKEN_STATUS = 409
 
 
 class ShoppingCart:
@@ -30,14 +45,66 @@ class ShoppingCart:
 
     def clear(self):
         url = f"{STORE_BASE_URL}/api/v1/users/{self.user.id}/cart/products"
-        response = requests.delete(url, headers=self.user.headers)
+        response = http_client.delete(url, headers=self.user.headers)
         response.raise_for_status()
     
     def add(self, store_product_id: str, quantity: int):
+        self.update({store_product_id: quantity})
+
+    def get(self) -> Dict[str, int]:
         url = f"{STORE_BASE_URL}/api/v1/users/{self.user.id}/cart"
-        data = {"products": [{"productId": store_product_id, "quantity": quantity}]}
-        response = requests.put(url, data=json.dumps(data), headers=self.user.headers)
+        response = http_client.get(url, headers=self.user.headers)
         response.raise_for_status()
+        return {product["productId"]: product["quantity"] for product in response.json().get("products", [])}
+
+    def update(self, quantities: Dict[str, int]):
+        url = f"{STORE_BASE_URL}/api/v1/users/{self.user.id}/cart"
+        data = {"products": [{"productId": product_id, "quantity": quantity} for product_id, quantity in quantities.items()]}
+        response = http_client.put(url, data=json.dumps(data), headers=self.user.headers)
+        response.raise_for_status()
+
+    def commit(self, quantities: Dict[str, int], batch_size: int = CART_BATCH_SIZE) -> Dict[str, str]:
+        with tracing.span("cart.commit"):
+            return self._commit(quantities, batch_size)
+
+    def _commit(self, quantities: Dict[str, int], batch_size: int) -> Dict[str, str]:
+        current_quantities = self.get()
+        changes = {
+            product_id: quantity
+            for product_id, quantity in quantities.items()
+            if current_quantities.get(product_id) != quantity
+        }
+        changes.update(
+            {product_id: 0 for product_id in current_quantities if product_id not in quantities}
+        )
+        unchanged = sum(1 for product_id in quantities if product_id not in changes)
+        print(f"Cart: {len(changes)} products changed, {unchanged} already in place")
+
+        failed: Dict[str, str] = {}
+        product_ids = list(changes)
+        for start in range(0, len(product_ids), batch_size):
+            batch = {product_id: changes[product_id] for product_id in product_ids[start:start + batch_size]}
+            try:
+                self.update(batch)
+            except Exception:
+                for product_id, quantity in batch.items():
+                    try:
+                        self.update({product_id: quantity})
+                    except Exception as exception:
+                        failed[product_id] = str(exception)
+        for product_id, error in failed.items():
+            print("Failed to update cart for product", product_id, error)
+        return failed
+
+
+class CartBuilder:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.quantities: Dict[str, int] = {}
+
+    def add(self, store_product_id: str, quantity: int):
+        with self.lock:
+            self.quantities[store_product_id] = self.quantities.get(store_product_id, 0) + quantity
 
 
 class Delivery:
@@ -47,7 +114,7 @@ class Delivery:
 
     def get_shipping_address(self) -> Dict[str, Any]:
         url = f"{STORE_BASE_URL}/api/v1/users/{self.user.id}/addresses/shipping-addresses"
-        response = requests.get(url, headers=self.user.headers)
+        response = http_client.get(url, headers=self.user.headers)
         response.raise_for_status()
         response_json = response.json()
         return response_json[0]["shippingAddress"]
@@ -55,22 +122,30 @@ class Delivery:
     def get_delivery_windows(self, shipping_address: Dict[str, Any]) -> List[Dict[str, Any]]:
         url = f"{STORE_BASE_URL}/api/v2/users/{self.user.id}/calendar/Van/{self.date.year}/{self.date.month}/{self.date.day}"
         data = shipping_address
-        response = requests.post(url, data=json.dumps(data), headers=self.user.headers)
+        response = http_client.post(url, data=json.dumps(data), headers=self.user.headers)
         response.raise_for_status()
         return response.json()
 
-    def find_best_delivery_window(self, preferred_start_time: List[str], delivery_windows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    def index_delivery_windows(self, delivery_windows: List[Dict[str, Any]]) -> Dict[datetime, Dict[str, Any]]:
+        return {
+            datetime.fromisoformat(delivery_window["deliveryWindow"]["startsAt"]): delivery_window["deliveryWindow"]
+            for delivery_window in delivery_windows
+            if delivery_window["canReserve"]
+        }
+
+    def preferred_start_dates(self, preferred_start_time: List[str]) -> List[datetime]:
+        start_dates = []
         for start_time in preferred_start_time:
             hour, minute = start_time.split(":")
-            start_date = self.date.replace(
-                hour=int(hour), minute=int(minute), second=0, microsecond=0
-            )
-            for delivery_window in delivery_windows:
-                if delivery_window["canReserve"] and delivery_window["deliveryWindow"][
-                    "startsAt"
-                ] == start_date.isoformat(timespec="seconds"):
-                    return delivery_window["deliveryWindow"]
-        return None    
+            start_dates.append(self.date.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0))
+        return start_dates
+
+    def find_best_delivery_window(self, preferred_start_time: List[str], delivery_windows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        windows = self.index_delivery_windows(delivery_windows)
+        return next(
+            (windows[start_date] for start_date in self.preferred_start_dates(preferred_start_time) if start_date in windows),
+            None,
+        )
 
     def reserve_delivery(self, shipping_address: Dict[str, Any], delivery_window: Dict[str, Any]) -> None:
         url = f"{STORE_BASE_URL}/api/v2/users/{self.user.id}/cart/reservation"
@@ -78,92 +153,535 @@ class Delivery:
             "deliveryWindow": delivery_window,
             "shippingAddress": shipping_address,
         }
-        response = requests.post(url, data=json.dumps(data), headers=self.user.headers)
+        response = http_client.post(url, data=json.dumps(data), headers=self.user.headers)
         response.raise_for_status()
 
 
-class ProductsFeed:
-    @staticmethod
-    def download() -> Dict[str, Dict[str, str]]:
-        url = "https://commerce.frisco.pl/api/v1/integration/feeds/public?language=pl"
-        response = requests.get(url)
-        response.raise_for_status()
-        products = response.json()["products"]
-        result = {}
+class SearchCache:
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.results: Dict[str, Tuple[List[ai.Product], float]] = {}
+        self.in_flight: Dict[str, Future] = {}
+        self.reset_stats()
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], List[ai.Product]]) -> List[ai.Product]:
+        with self.lock:
+            cached = self.results.get(key)
+            if cached is not None and time.monotonic() - cached[1] <= self.ttl:
+                self.hits += 1
+                tracing.count("search_cache.hits")
+                return cached[0]
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if future is None:
+                future = Future()
+                self.in_flight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        tracing.count("search_cache.misses" if is_owner else "search_cache.coalesced")
+
+        if is_owner:
+            try:
+                result = fetch()
+                with self.lock:
+                    # a warm container serves many runs, so the oldest searches make room for new ones
+                    self.results.pop(key, None)
+                    self.results[key] = (result, time.monotonic())
+                    while len(self.results) > self.max_entries:
+                        del self.results[next(iter(self.results))]
+                future.set_result(result)
+            except Exception as exception:
+                future.set_exception(exception)
+            finally:
+                with self.lock:
+                    del self.in_flight[key]
+        return future.result()
 
-        for product in products:
-            result[product["productId"]] = {
-                "components": product.get("contentData", "").get("components", "")
-            }
-        return result
+    def reset_stats(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+
+    def report(self) -> str:
+        return f"Search cache: {self.hits} hits, {self.coalesced} coalesced, {self.misses} misses"
 
 
 class ProductsSearch:
-    def __init__(self, user: User):
+    def __init__(
+        self,
+        user: User,
+        cache: Optional[SearchCache] = None,
+        page_size: int = SEARCH_PAGE_SIZE,
+        products_feed: Optional[feed.ProductsFeed] = None,
+    ):
         self.user = user
+        self.cache = cache or SearchCache()
+        self.page_size = page_size
+        self.products_feed = products_feed
+
+    def search(self, product_name: str) -> List[ai.Product]:
+        query = normalize_query(product_name)
+        return self.cache.get_or_fetch(query, lambda: self._fetch(query))
 
-    def search(self, product_name: str) -> List[Dict[str, Any]]:
-        url = f"{STORE_BASE_URL}/api/v1/users/{self.user.id}/offer/products/query?purpose=Listing&pageIndex=1&search={product_name}&includeFacets=true&deliveryMethod=Van&pageSize=50&language=pl&disableAutocorrect=false"
-        response = requests.get(url, headers=self.user.headers)
+    def _fetch(self, query: str) -> List[ai.Product]:
+        url = f"{STORE_BASE_URL}/api/v1/users/{self.user.id}/offer/products/query"
+        params = {
+            "purpose": "Listing",
+            "pageIndex": 1,
+            "search": query,
+            "includeFacets": "false",
+            "deliveryMethod": "Van",
+            "pageSize": self.page_size,
+            "language": "pl",
+            "disableAutocorrect": "false",
+        }
+        response = http_client.get(url, params=params, headers=self.user.headers)
         response.raise_for_status()
-        return response.json()["products"]
-    
+        # only the fields the ranking and the prompt need are kept, so cached results stay small
+        return [
+            ai.parse_product(product, self._get_components(product["product"]["id"]))
+            for product in response.json()["products"]
+            if product["product"].get("isAvailable")
+        ]
+
+    def _get_components(self, product_id: str) -> str:
+        return self.products_feed.get_components(product_id) if self.products_feed else ""
+
+
+def normalize_query(product_name: str) -> str:
+    return " ".join(re.sub(r"^[0-9]+x ", "", product_name.strip()).casefold().split())
+
 
 class Store:
-    def __init__(self, config_provider: config.ConfigProvider):
+    def __init__(
+        self,
+        config_provider: config.ConfigProvider,
+        max_workers: int = 4,
+        rate_limits: Optional[Dict[str, float]] = None,
+        decision_cache: Optional[decisions.DecisionCache] = None,
+        batch_decisions: bool = False,
+        ranker: Optional[ranking.CandidateRanker] = None,
+        search_cache: Optional[SearchCache] = None,
+        llm_backend: Optional["llm_backends.LLMBackend"] = None,
+        price_history: Optional[prices.PriceHistory] = None,
+        token_manager: Optional[auth.TokenManager] = None,
+        matcher: Optional["matching.ProductMatcher"] = None,
+        products_feed: Optional[feed.ProductsFeed] = None,
+        journal_path: Optional[str] = None,
+        shared_caches: bool = False,
+    ):
         self.config_provider = config_provider
+        self.max_workers = max_workers
+        self.decision_cache = decision_cache
+        self.batch_decisions = batch_decisions
+        self.ranker = ranker
+        self.search_cache = search_cache or SearchCache()
+        self.llm_backend = llm_backend
+        self.price_history = price_history
+        self.token_manager = token_manager or auth.TokenManager(config_provider)
+        self.matcher = matcher
+        self.products_feed = products_feed
+        self.journal_path = journal_path
+        # stores shopping at the same time share the decision and search caches, whose owner resets and reports them
+        self.shared_caches = shared_caches
+        self.rate_limiters = throttling.create_rate_limiters({**throttling.DEFAULT_RATE_LIMITS, **(rate_limits or {})})
 
     def log_in(self) -> User:
-        frisco_username = self.config_provider.get_value("frisco", "username")
-        frisco_password = self.config_provider.get_value("frisco", "password", is_secret=True)
-        url = f"{STORE_BASE_URL}/connect/token"
-        form_data = {
-            "grant_type": "password",
-            "username": frisco_username,
-            "password": frisco_password,
-        }
-        headers = {
-            "referer": "https://www.frisco.pl/",
-            "Content-Type": "application/x-www-form-urlencoded",
-        }
-        response = requests.post(url, data=form_data, headers=headers)
-        response.raise_for_status()
-        response_json = response.json()
-        return User(response_json["user_id"], response_json["token_type"], response_json["access_token"])
+        return self.token_manager.get_user()
 
-    def schedule(self, user: User, preferred_start_time: List[str]) -> Optional[Dict[str, Any]]:
+    def schedule(self, user: User, preferred_start_time: List[str], days: int = SCHEDULE_DAYS) -> Optional[Dict[str, Any]]:
+        with tracing.span("schedule"):
+            return self._schedule(user, preferred_start_time, days)
+
+    def _schedule(self, user: User, preferred_start_time: List[str], days: int) -> Optional[Dict[str, Any]]:
         warsaw_tz = pytz.timezone("Europe/Warsaw")
-        tomorrow = warsaw_tz.localize(datetime.now() + timedelta(days=1))
-        delivery = Delivery(user, tomorrow)
-        shipping_address = delivery.get_shipping_address()
-        delivery_windows = delivery.get_delivery_windows(shipping_address)
-        delivery_window = delivery.find_best_delivery_window(preferred_start_time, delivery_windows)
-        if delivery_window is None:
-            return None
-        delivery.reserve_delivery(shipping_address, delivery_window)
-        return delivery_window
+        now = datetime.now()
+        deliveries = [Delivery(user, warsaw_tz.localize(now + timedelta(days=day))) for day in range(1, max(days, 1) + 1)]
+        shipping_address = deliveries[0].get_shipping_address()
+
+        def fetch_windows(delivery: Delivery) -> Dict[datetime, Dict[str, Any]]:
+            with tracing.span("delivery.calendar"):
+                return delivery.index_delivery_windows(delivery.get_delivery_windows(shipping_address))
+
+        with ThreadPoolExecutor(max_workers=min(len(deliveries), self.max_workers)) as executor:
+            calendars = list(executor.map(fetch_windows, deliveries))
+
+        # the earliest day wins, and within a day the order of the preferred start times
+        options = [
+            (delivery, windows[start_date])
+            for delivery, windows in zip(deliveries, calendars)
+            for start_date in delivery.preferred_start_dates(preferred_start_time)
+            if start_date in windows
+        ]
+        # every preferred window is tried, a window another customer took must not hide the reservable ones after it
+        for delivery, delivery_window in options:
+            try:
+                delivery.reserve_delivery(shipping_address, delivery_window)
+                return delivery_window
+            except requests.HTTPError as exception:
+                if exception.response is None or exception.response.status_code != SLOT_TAKEN_STATUS:
+                    raise
+                print("Delivery window", delivery_window["startsAt"], "was taken, trying the next one")
+                tracing.count("delivery.slot_taken")
+        return None
     
-    def shop(self, user: User, grocery_list: List[groceries.GroceryItem]) -> List[groceries.GroceryItem]:
+    def shop(
+        self,
+        user: User,
+        grocery_list: List[groceries.GroceryItem],
+        checkpoint: Optional[checkpoints.ShopCheckpoint] = None,
+        deadline: Optional[float] = None,
+    ) -> List[groceries.GroceryItem]:
         shopping_cart = ShoppingCart(user)
-        products_search = ProductsSearch(user)
-        model = ai.LLM(self.config_provider, ProductsFeed.download())
-        logger = logging.Logger(self.config_provider)
+        logger = logging.Logger(self.config_provider, self.journal_path)
+        products_feed = self.products_feed or feed.ProductsFeed().refresh()
+        log_shopping_id = logger.log_shopping_start("Frisco", datetime.now())
+        run = ShoppingRun(
+            CartBuilder(),
+            ProductsSearch(user, self.search_cache, products_feed=products_feed),
+            ai.LLM(self.config_provider, backend=self.llm_backend, rate_limiter=self.rate_limiters["openai"]),
+            logger,
+            log_shopping_id,
+            checkpoint,
+            deadline,
+        )
+
+        self._reset_stats(run)
+
+        resumed_choices = {}
+        if checkpoint:
+            for grocery_item in grocery_list:
+                resumed_choice = checkpoint.get_choice(grocery_item)
+                if resumed_choice is not None:
+                    resumed_choices[grocery_item.task_id] = resumed_choice
+        pending_items = [grocery_item for grocery_item in grocery_list if grocery_item.task_id not in resumed_choices]
+        chosen_grocery_items = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if self.batch_decisions:
+                futures = self._shop_in_batch(executor, run, pending_items)
+            else:
+                futures = [executor.submit(self._shop_item, run, grocery_item) for grocery_item in pending_items]
+            pending_futures = dict(zip([grocery_item.task_id for grocery_item in pending_items], futures))
+
+            for grocery_item in grocery_list:
+                if grocery_item.task_id in resumed_choices:
+                    choice = resumed_choices[grocery_item.task_id]
+                    if choice.is_product_chosen and choice.product is not None:
+                        run.cart_builder.add(choice.product.id, grocery_item.quantity)
+                        chosen_grocery_items.append((grocery_item, choice.product.id))
+                    continue
+                try:
+                    product_id = pending_futures[grocery_item.task_id].result()
+                    if product_id:
+                        chosen_grocery_items.append((grocery_item, product_id))
+                except DeadlineExceeded:
+                    print("Deferred to the next run:", grocery_item)
+                except Exception as exception:
+                    print("Failed to shop for", grocery_item, exception)
+
+        if checkpoint:
+            for product_id, quantity in checkpoint.carted_quantities(grocery_list).items():
+                run.cart_builder.add(product_id, quantity)
+        failed_products = shopping_cart.commit(run.cart_builder.quantities)
+        bought_grocery_items = [
+            grocery_item for grocery_item, product_id in chosen_grocery_items if product_id not in failed_products
+        ]
+        if checkpoint:
+            checkpoint.mark(checkpoint.pending_completion(bought_grocery_items), checkpoints.IN_CART)
+
+        logger.log_shopping_end(log_shopping_id, datetime.now(), deadline)
+        self._finish(run)
+        return bought_grocery_items
+
+    def prefetch(
+        self,
+        user: User,
+        grocery_list: List[groceries.GroceryItem],
+        deadline: Optional[float] = None,
+    ) -> List[groceries.GroceryItem]:
+        if self.decision_cache is None:
+            raise ValueError("Prefetching needs a decision cache to keep the choices for shopping")
+        # the choices only land in the decision cache, so shop revalidates their availability and price
+        # with a single search per item and fills the cart without asking the model again
+        choices, _ = self.decide(user, grocery_list, deadline)
+        return [grocery_item for grocery_item in grocery_list if grocery_item.task_id in choices]
+
+    def decide(
+        self,
+        user: User,
+        grocery_list: List[groceries.GroceryItem],
+        deadline: Optional[float] = None,
+    ) -> Tuple[Dict[str, ai.Choice], Dict[str, str]]:
+        products_feed = self.products_feed or feed.ProductsFeed().refresh()
+        run = ShoppingRun(
+            CartBuilder(),
+            ProductsSearch(user, self.search_cache, products_feed=products_feed),
+            ai.LLM(self.config_provider, backend=self.llm_backend, rate_limiter=self.rate_limiters["openai"]),
+            None,
+            None,
+            None,
+            deadline,
+        )
+
+        self._reset_stats(run)
 
-        shopping_cart.clear()
+        choices: Dict[str, ai.Choice] = {}
+        failed: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if self.batch_decisions:
+                futures = self._decide_in_batch(executor, run, grocery_list)
+            else:
+                futures = [executor.submit(self._decide, run, grocery_item) for grocery_item in grocery_list]
+            for grocery_item, future in zip(grocery_list, futures):
+                try:
+                    choices[grocery_item.task_id] = future.result()
+                except DeadlineExceeded:
+                    print("Deferred to the next run:", grocery_item)
+                    failed[grocery_item.task_id] = "deadline exceeded"
+                except Exception as exception:
+                    print("Failed to decide on", grocery_item, exception)
+                    failed[grocery_item.task_id] = str(exception)
+
+        self._finish(run)
+        return choices, failed
+
+    def fill_cart(
+        self,
+        user: User,
+        grocery_list: List[groceries.GroceryItem],
+        choices: Dict[str, ai.Choice],
+        checkpoint: Optional[checkpoints.ShopCheckpoint] = None,
+        deadline: Optional[float] = None,
+    ) -> List[groceries.GroceryItem]:
+        shopping_cart = ShoppingCart(user)
+        logger = logging.Logger(self.config_provider, self.journal_path)
         log_shopping_id = logger.log_shopping_start("Frisco", datetime.now())
-        bought_grocery_items = []
+        cart_builder = CartBuilder()
+        chosen_grocery_items = []
 
         for grocery_item in grocery_list:
-            found_products = products_search.search(grocery_item.name)
-            available_products = [product for product in found_products if product["product"].get("isAvailable")]
-            choice = model.ask(grocery_item.name, available_products)        
-            if choice.is_product_chosen:
-                assert choice.product is not None, "Product should not be None when is_product_chosen is True"
-                shopping_cart.add(choice.product.id, grocery_item.quantity)
-                bought_grocery_items.append(grocery_item)
-            logger.log_choice(log_shopping_id, grocery_item, choice)
-            time.sleep(5)
-
-        logger.log_shopping_end(log_shopping_id, datetime.now())
+            resumed_choice = checkpoint.get_choice(grocery_item) if checkpoint else None
+            choice = resumed_choice or choices.get(grocery_item.task_id)
+            if choice is None:
+                continue
+            if resumed_choice is None:
+                logger.log_choice(log_shopping_id, grocery_item, choice)
+                if checkpoint:
+                    checkpoint.record_choice(grocery_item, choice)
+            if choice.is_product_chosen and choice.product is not None:
+                if resumed_choice is None and self.price_history:
+                    self.price_history.observe_choice(grocery_item.name, choice.product.id)
+                cart_builder.add(choice.product.id, grocery_item.quantity)
+                chosen_grocery_items.append((grocery_item, choice.product.id))
+
+        if checkpoint:
+            for product_id, quantity in checkpoint.carted_quantities(grocery_list).items():
+                cart_builder.add(product_id, quantity)
+        failed_products = shopping_cart.commit(cart_builder.quantities)
+        bought_grocery_items = [
+            grocery_item for grocery_item, product_id in chosen_grocery_items if product_id not in failed_products
+        ]
+        if checkpoint:
+            checkpoint.mark(checkpoint.pending_completion(bought_grocery_items), checkpoints.IN_CART)
+        logger.log_shopping_end(log_shopping_id, datetime.now(), deadline)
+        if self.price_history:
+            self.price_history.flush()
         return bought_grocery_items
-    
\ No newline at end of file
+
+    def _reset_stats(self, run: "ShoppingRun"):
+        if self.decision_cache and not self.shared_caches:
+            self.decision_cache.reset_stats()
+        if self.matcher:
+            self.matcher.reset_stats()
+        if self.ranker:
+            self.ranker.reset_stats()
+        if not self.shared_caches:
+            self.search_cache.reset_stats()
+        run.model.backend.stats.reset()
+
+    def _finish(self, run: "ShoppingRun"):
+        if self.decision_cache and not self.shared_caches:
+            print(self.decision_cache.report())
+            self.decision_cache.compact()
+        if self.price_history:
+            self.price_history.flush()
+        if self.matcher:
+            print(self.matcher.report())
+        if self.ranker:
+            print(self.ranker.report())
+        if not self.shared_caches:
+            print(self.search_cache.report())
+        print(run.model.backend.stats.report())
+
+    def _shop_item(self, run: "ShoppingRun", grocery_item: groceries.GroceryItem) -> Optional[str]:
+        run.check_deadline()
+        with tracing.span("item", grocery_item.name):
+            choice = self._decide(run, grocery_item)
+            return self._fulfil(run, grocery_item, choice)
+
+    def _decide(self, run: "ShoppingRun", grocery_item: groceries.GroceryItem) -> ai.Choice:
+        products = self._find_products(run, grocery_item)
+        with tracing.span("decide", grocery_item.name):
+            choice, candidates = self._preselect(grocery_item, products)
+            if choice is not None:
+                return choice
+
+            def choose() -> ai.Choice:
+                return run.model.choose(grocery_item.name, candidates)
+
+            if self.decision_cache:
+                return self.decision_cache.decide(grocery_item.name, products, choose)
+            return choose()
+
+    def _shop_in_batch(
+        self, executor: ThreadPoolExecutor, run: "ShoppingRun", grocery_list: List[groceries.GroceryItem]
+    ) -> List[Future]:
+        return [
+            future if future.exception() is not None else executor.submit(self._fulfil, run, grocery_item, future.result())
+            for grocery_item, future in zip(grocery_list, self._decide_in_batch(executor, run, grocery_list))
+        ]
+
+    def _decide_in_batch(
+        self, executor: ThreadPoolExecutor, run: "ShoppingRun", grocery_list: List[groceries.GroceryItem]
+    ) -> List[Future]:
+        search_futures = [executor.submit(self._find_products, run, grocery_item) for grocery_item in grocery_list]
+        products_per_item: List[Optional[List[ai.Product]]] = []
+        candidates_per_item: List[List[ai.Product]] = []
+        choices: List[Optional[ai.Choice]] = []
+        errors: Dict[int, Exception] = {}
+        for index, (grocery_item, search_future) in enumerate(zip(grocery_list, search_futures)):
+            try:
+                products = search_future.result()
+            except Exception as exception:
+                errors[index] = exception
+                products_per_item.append(None)
+                candidates_per_item.append([])
+                choices.append(None)
+                continue
+            choice, candidates = self._preselect(grocery_item, products)
+            products_per_item.append(products)
+            candidates_per_item.append(candidates)
+            choices.append(choice)
+
+        pending = [
+            index for index, products in enumerate(products_per_item) if products is not None and choices[index] is None
+        ]
+        if pending:
+            with tracing.span("decide.batch"):
+                batch_choices = run.model.choose_many(
+                    [(grocery_list[index].name, candidates_per_item[index]) for index in pending]
+                )
+            for index, choice in zip(pending, batch_choices):
+                choices[index] = choice
+                if self.decision_cache and choice is not None:
+                    self.decision_cache.store(grocery_list[index].name, products_per_item[index] or [], choice)
+
+        return [
+            _completed_future(choice)
+            if choice is not None
+            else _failed_future(errors.get(index, Exception(f"No product decision for {grocery_item}")))
+            for index, (grocery_item, choice) in enumerate(zip(grocery_list, choices))
+        ]
+
+    def _preselect(
+        self, grocery_item: groceries.GroceryItem, products: List[ai.Product]
+    ) -> Tuple[Optional[ai.Choice], List[ai.Product]]:
+        if not products:
+            return ai.Choice(False, "Brak dostępnych produktów o tej nazwie"), []
+
+        choice = self.decision_cache.lookup(grocery_item.name, products) if self.decision_cache else None
+        if choice is None and self.matcher:
+            match = self.matcher.match(grocery_item.name, products)
+            if match is not None:
+                matched = next(product for product in products if product.id == match.product_id)
+                choice = ai.Choice(
+                    True,
+                    f"Wybrano bez pytania modelu: ten produkt był już kupowany jako {match.known_name}",
+                    ai.ChosenProduct(matched.id, matched.name, matched.price, matched.price_after_promotion),
+                )
+                if self.decision_cache:
+                    self.decision_cache.store(grocery_item.name, products, choice)
+        if choice is not None or self.ranker is None:
+            return choice, products
+
+        product_ranking = self.ranker.rank(grocery_item.name, products)
+        winner = product_ranking.winner
+        if winner is None:
+            return None, product_ranking.candidates
+
+        choice = ai.Choice(
+            True,
+            "Wybrano bez pytania modelu: produkt wyraźnie najlepiej pasuje do nazwy i ceny",
+            ai.ChosenProduct(winner.id, winner.name, winner.price, winner.price_after_promotion),
+        )
+        if self.decision_cache:
+            self.decision_cache.store(grocery_item.name, products, choice)
+        return choice, product_ranking.candidates
+
+    def _find_products(self, run: "ShoppingRun", grocery_item: groceries.GroceryItem) -> List[ai.Product]:
+        run.check_deadline()
+        with tracing.span("search", grocery_item.name):
+            self.rate_limiters["frisco"].wait()
+            products = run.products_search.search(grocery_item.name)
+        if self.price_history:
+            self.price_history.observe(grocery_item.name, products)
+        return products
+
+    def _fulfil(self, run: "ShoppingRun", grocery_item: groceries.GroceryItem, choice: ai.Choice) -> Optional[str]:
+        if run.logger is not None and run.log_shopping_id is not None:
+            run.logger.log_choice(run.log_shopping_id, grocery_item, choice)
+        if run.checkpoint:
+            with tracing.span("checkpoint", grocery_item.name):
+                run.checkpoint.record_choice(grocery_item, choice)
+        if not choice.is_product_chosen:
+            return None
+        assert choice.product is not None, "Product should not be None when is_product_chosen is True"
+        if self.price_history:
+            self.price_history.observe_choice(grocery_item.name, choice.product.id)
+        run.cart_builder.add(choice.product.id, grocery_item.quantity)
+        return choice.product.id
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class ShoppingRun:
+    def __init__(
+        self,
+        cart_builder: CartBuilder,
+        products_search: ProductsSearch,
+        model: ai.LLM,
+        logger: Optional[logging.Logger],
+        log_shopping_id: Optional[str],
+        checkpoint: Optional[checkpoints.ShopCheckpoint],
+        deadline: Optional[float],
+    ):
+        self.cart_builder = cart_builder
+        self.products_search = products_search
+        self.model = model
+        self.logger = logger
+        self.log_shopping_id = log_shopping_id
+        self.checkpoint = checkpoint
+        self.deadline = deadline
+
+    def check_deadline(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DeadlineExceeded()
+
+
+def _completed_future(result: Any) -> Future:
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+
+def _failed_future(exception: Exception) -> Future:
+    future: Future = Future()
+    future.set_exception(exception)
+    return future
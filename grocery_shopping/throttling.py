@@ -0,0 +1,31 @@
+import threading
+import time
+from typing import Dict
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        if self.interval == 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+DEFAULT_RATE_LIMITS = {
+    "frisco": 4.0,
+    "openai": 2.0,
+}
+
+
+def create_rate_limiters(rate_limits: Dict[str, float]) -> Dict[str, RateLimiter]:
+    return {service: RateLimiter(requests_per_second) for service, requests_per_second in rate_limits.items()}
@@ -0,0 +1,126 @@
+import contextlib
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+NAMESPACE = "GroceryShopping"
+SLOW_SPAN_THRESHOLD = 5.0
+SUMMARY_SIZE = 5
+
+
+class SpanStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class Tracer:
+    def __init__(self, slow_span_threshold: float = SLOW_SPAN_THRESHOLD):
+        self.slow_span_threshold = slow_span_threshold
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset("")
+
+    def reset(self, run_name: str):
+        with self.lock:
+            self.run_name = run_name
+            self.started_at = time.perf_counter()
+            self.spans: Dict[str, SpanStats] = {}
+            self.items: Dict[str, float] = {}
+            self.counters: Dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def span(self, name: str, item: Optional[str] = None, **attributes: Any) -> Iterator[None]:
+        stack: Optional[List[Optional[str]]] = getattr(self.local, "items", None)
+        if stack is None:
+            stack = self.local.items = []
+        # items are timed by their outermost span, so nested stages are not counted twice
+        owns_item = item is not None and not any(stack)
+        stack.append(item)
+        start_time = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as exception:
+            error = exception
+            raise
+        finally:
+            duration = time.perf_counter() - start_time
+            stack.pop()
+            with self.lock:
+                stats = self.spans.setdefault(name, SpanStats())
+                stats.count += 1
+                stats.total += duration
+                stats.max = max(stats.max, duration)
+                if error is not None:
+                    stats.errors += 1
+                if owns_item and item is not None:
+                    self.items[item] = self.items.get(item, 0.0) + duration
+            if duration >= self.slow_span_threshold:
+                self._log({"message": "slow span", "span": name, "item": item, "duration": round(duration, 3), **attributes})
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def emit(self, **dimensions: str):
+        with self.lock:
+            metrics: Dict[str, Any] = {f"{name}.duration": round(stats.total * 1000, 1) for name, stats in self.spans.items()}
+            metrics.update({f"{name}.count": stats.count for name, stats in self.spans.items()})
+            metrics.update({f"{name}.errors": stats.errors for name, stats in self.spans.items() if stats.errors})
+            metrics.update(self.counters)
+            metrics["run.duration"] = round((time.perf_counter() - self.started_at) * 1000, 1)
+            run_name = self.run_name
+
+        dimensions = {"Function": run_name, **dimensions}
+        self._log({
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        {"Name": name, "Unit": "Milliseconds" if name.endswith(".duration") else "Count"}
+                        for name in metrics
+                    ],
+                }],
+            },
+            **dimensions,
+            **metrics,
+        })
+
+    def summary(self) -> str:
+        with self.lock:
+            stages = sorted(self.spans.items(), key=lambda span: -span[1].total)[:SUMMARY_SIZE]
+            items = sorted(self.items.items(), key=lambda item: -item[1])[:SUMMARY_SIZE]
+            counters = sorted(self.counters.items())
+            duration = time.perf_counter() - self.started_at
+
+        lines = [f"Run {self.run_name} took {duration:.2f}s"]
+        lines.extend(
+            f"  stage {name}: {stats.count} calls, total {stats.total:.2f}s, max {stats.max:.2f}s"
+            + (f", {stats.errors} errors" if stats.errors else "")
+            for name, stats in stages
+        )
+        lines.extend(f"  item {name}: {item_duration:.2f}s" for name, item_duration in items)
+        if counters:
+            lines.append("  " + ", ".join(f"{name} {value}" for name, value in counters))
+        return "\n".join(lines)
+
+    def _log(self, record: Dict[str, Any]):
+        print(json.dumps(record, ensure_ascii=False, default=str))
+
+
+tracer = Tracer()
+
+
+def span(name: str, item: Optional[str] = None, **attributes: Any) -> contextlib.AbstractContextManager:
+    return tracer.span(name, item, **attributes)
+
+
+def count(name: str, value: int = 1):
+    tracer.count(name, value)
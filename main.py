@@ -1,29 +1,202 @@
 import json
+import os
+import time
 from datetime import datetime
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 import grocery_shopping.config as config
-import grocery_shopping.groceries as groceries
-import grocery_shopping.meal_planing as meal_planing
+import grocery_shopping.http_client as http_client
+import grocery_shopping.tracing as tracing
 from grocery_shopping.notifications import Notifier
-import grocery_shopping.shopping as shopping
+
+if TYPE_CHECKING:
+    import grocery_shopping.auth as auth
+    import grocery_shopping.checkpoints as checkpoints
+    import grocery_shopping.groceries as groceries
+    import grocery_shopping.households as households
+    import grocery_shopping.matching as matching
+    import grocery_shopping.shopping as shopping
+
+# Handlers import the rest of the package lazily, so listify and schedule never load openai
+# and each cold start only pays for the modules its handler uses.
+
+
+SHOP_SHUTDOWN_MARGIN = 120
+DEFAULT_DECISION_CACHE = "sqlite:/tmp/decisions.sqlite3"
+
+LISTIFY_PARAMETERS = [
+    ("make", "status_update_webhook"),
+    ("notion", "secret"),
+    ("notion", "ingredients_database_id"),
+    ("todoist", "secret"),
+    ("todoist", "project_id"),
+]
+# the Frisco username and password are read only when the cached token cannot be refreshed
+SCHEDULE_PARAMETERS = [
+    ("make", "status_update_webhook"),
+    ("frisco", "token_key"),
+]
+SHOP_PARAMETERS = [
+    ("make", "status_update_webhook"),
+    ("frisco", "token_key"),
+    ("notion", "secret"),
+    ("notion", "grocery_shopping_database_id"),
+    ("notion", "choice_database_id"),
+    ("todoist", "secret"),
+    ("todoist", "project_id"),
+    ("openai", "secret"),
+    ("openai", "grocery_shopping_assistant_id"),
+    ("openai", "backend"),
+    ("openai", "model"),
+]
+
+
+_config_provider: Optional[config.ConfigProvider] = None
+_token_manager: Optional["auth.TokenManager"] = None
+_matcher: Optional["matching.ProductMatcher"] = None
+# households shopped in one batch keep their own token and matcher across warm starts
+_household_token_managers: Dict[str, "auth.TokenManager"] = {}
+_household_matchers: Dict[str, "matching.ProductMatcher"] = {}
+
+
+def _get_config_provider() -> config.ConfigProvider:
+    global _config_provider
+    if _config_provider is None:
+        _config_provider = config.ConfigProvider()
+    return _config_provider
+
+
+def _get_token_manager(config_provider: config.ConfigProvider) -> "auth.TokenManager":
+    import grocery_shopping.auth as auth
+
+    global _token_manager
+    if _token_manager is None:
+        _token_manager = auth.TokenManager(
+            config_provider, auth.create_store(os.environ.get("FRISCO_TOKEN_STORE", auth.DEFAULT_STORE))
+        )
+    return _token_manager
+
+
+def _get_matcher(config_provider: config.ConfigProvider) -> "matching.ProductMatcher":
+    import grocery_shopping.matching as matching
+
+    global _matcher
+    if _matcher is None:
+        _matcher = matching.ProductMatcher()
+    # only choices logged since the last run are fetched on a warm start
+    return _matcher.refresh(config_provider)
+
+
+def _create_store(
+    config_provider: config.ConfigProvider,
+    event: Dict[str, Any],
+    token_manager: "auth.TokenManager",
+    matcher: "matching.ProductMatcher",
+    shared: Optional["households.SharedCaches"] = None,
+    journal_path: Optional[str] = None,
+) -> "shopping.Store":
+    import grocery_shopping.decisions as decisions
+    import grocery_shopping.llm_backends as llm_backends
+    import grocery_shopping.prices as prices
+    import grocery_shopping.ranking as ranking
+    import grocery_shopping.shopping as shopping
+
+    if shared is not None:
+        decision_cache = shared.decision_cache
+        price_history = shared.price_history
+    else:
+        decision_cache = decisions.DecisionCache(
+            decisions.create_backend(os.environ.get("DECISION_CACHE", DEFAULT_DECISION_CACHE))
+        )
+        price_history = prices.PriceHistory(os.environ.get("PRICE_HISTORY", prices.DEFAULT_PATH))
+    return shopping.Store(
+        config_provider,
+        max_workers=event.get("max_workers", 4),
+        decision_cache=decision_cache,
+        batch_decisions=event.get("batch_decisions", False),
+        ranker=ranking.CandidateRanker(
+            top_k=event.get("top_k", 8), decision_cache=decision_cache, price_history=price_history
+        ),
+        search_cache=shared.search_cache if shared is not None else None,
+        llm_backend=llm_backends.create_backend(config_provider),
+        price_history=price_history,
+        token_manager=token_manager,
+        matcher=matcher,
+        products_feed=shared.products_feed if shared is not None else None,
+        journal_path=journal_path,
+        shared_caches=shared is not None,
+    )
+
+
+def _get_deadline(context: Any) -> Optional[float]:
+    if context is None:
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - SHOP_SHUTDOWN_MARGIN
+
+
+def _start_prefetch():
+    # decisions prefetched into a container's local cache are gone once the shop run lands on another container
+    if not os.environ.get("DECISION_CACHE", DEFAULT_DECISION_CACHE).startswith("dynamodb:"):
+        print("Prefetch skipped: the decision cache is not shared between invocations")
+        return
+
+    import boto3
+
+    client = boto3.client("lambda")
+    client.invoke(
+        FunctionName=os.environ.get("PREFETCH_FUNCTION", "grocery-shopping-shop"),
+        InvocationType="Event",
+        Payload=json.dumps({"prefetch": True}).encode("utf-8"),
+    )
+
+
+def _forget_rejected_token(exception: Exception, token_manager: Optional["auth.TokenManager"]):
+    response = getattr(exception, "response", None)
+    if (
+        token_manager is not None
+        and response is not None
+        and response.status_code == 401
+        and "frisco.pl" in (response.url or "")
+    ):
+        token_manager.invalidate()
 
 
 def listify(event: Any, context: Any):
-    config_provider = config.ConfigProvider()
+    import grocery_shopping.groceries as groceries
+    import grocery_shopping.meal_planing as meal_planing
+
+    http_client.client.reset_stats()
+    tracing.tracer.reset("listify")
+    config_provider = _get_config_provider()
+    config_provider.prefetch(LISTIFY_PARAMETERS)
     notifier = Notifier(config_provider)
 
     try:
         meal_plan = meal_planing.MealPlan(config_provider)
         grocery_list = groceries.GroceryList(config_provider)
-        shopping_list = meal_plan.get_shopping_list()
-        grocery_list.load(shopping_list)
+        shopping_list = meal_plan.iter_shopping_list(incremental=(event or {}).get("incremental", False))
+        result = grocery_list.load(shopping_list)
+        if result.failed:
+            notifier.update_status(f"⚠️ {len(result.failed)} items were not added: {", ".join(result.failed)}")
+        else:
+            meal_plan.save_checkpoint()
+        if (event or {}).get("prefetch"):
+            _start_prefetch()
     except Exception as exception:
         notifier.update_status(f"💥 error: {str(exception)}")
         raise
+    finally:
+        print(http_client.client.report())
+        print(tracing.tracer.summary())
+        tracing.tracer.emit()
 
 def schedule(event: Dict[str, Any], context: Any):
-    config_provider = config.ConfigProvider()
+    import grocery_shopping.shopping as shopping
+
+    http_client.client.reset_stats()
+    tracing.tracer.reset("schedule")
+    config_provider = _get_config_provider()
+    config_provider.prefetch(SCHEDULE_PARAMETERS)
     notifier = Notifier(config_provider)
 
     try:
@@ -31,11 +204,12 @@ def schedule(event: Dict[str, Any], context: Any):
             raise ValueError("Missing 'preferred_start_time' in event")
         
         preferred_start_time = event["preferred_start_time"]
-        store = shopping.Store(config_provider)
+        store = shopping.Store(config_provider, token_manager=_get_token_manager(config_provider))
         user = store.log_in()
-        delivery_window = store.schedule(user, preferred_start_time)
+        days = event.get("days", shopping.SCHEDULE_DAYS)
+        delivery_window = store.schedule(user, preferred_start_time, days)
         if delivery_window is None:
-            notifier.update_status("❌ no delivery window found")
+            notifier.update_status(f"❌ no delivery window found in the next {days} days")
             return {"statusCode": 200, "body": json.dumps("No delivery window found!")}
 
         start_date = datetime.fromisoformat(delivery_window["startsAt"])
@@ -48,28 +222,307 @@ def schedule(event: Dict[str, Any], context: Any):
             "body": json.dumps("Scheduling completed successfully!"),
         }
     except Exception as exception:
+        _forget_rejected_token(exception, _token_manager)
         notifier.update_status(f"💥 error: {str(exception)}")
         raise
+    finally:
+        print(http_client.client.report())
+        print(tracing.tracer.summary())
+        tracing.tracer.emit()
 
-def shop(event: Any, context: Any):
-    config_provider = config.ConfigProvider()
+def prefetch(event: Any, context: Any):
+    import grocery_shopping.groceries as groceries
+
+    http_client.client.reset_stats()
+    tracing.tracer.reset("prefetch")
+    config_provider = _get_config_provider()
+    config_provider.prefetch(SHOP_PARAMETERS)
     notifier = Notifier(config_provider)
 
     try:
-        grocery_list = groceries.GroceryList(config_provider)
-        store = shopping.Store(config_provider)
+        event = event or {}
+        store = _create_store(
+            config_provider, event, _get_token_manager(config_provider), _get_matcher(config_provider)
+        )
         user = store.log_in()
-        bought_grocery_items = store.shop(user, grocery_list.get())
-        grocery_list.complete(bought_grocery_items)
-        notifier.update_status("✅ items successfully added to your cart")
+        grocery_items = groceries.GroceryList(config_provider).get()
+        prefetched_grocery_items = store.prefetch(user, grocery_items, _get_deadline(context))
+        notifier.update_status(f"🛒 {len(prefetched_grocery_items)} of {len(grocery_items)} items are ready for shopping")
+        return {
+            "statusCode": 200,
+            "body": json.dumps("Prefetching completed successfully!"),
+        }
+    except Exception as exception:
+        _forget_rejected_token(exception, _token_manager)
+        notifier.update_status(f"💥 error: {str(exception)}")
+        raise
+    finally:
+        print(http_client.client.report())
+        print(tracing.tracer.summary())
+        tracing.tracer.emit()
+
+def shop(event: Any, context: Any):
+    # listify starts the prefetch on the shop function, so the warm container keeps its feed index,
+    # decision cache and token in /tmp for the shopping run
+    if (event or {}).get("prefetch"):
+        return prefetch(event, context)
+
+    http_client.client.reset_stats()
+    tracing.tracer.reset("shop")
+    config_provider = _get_config_provider()
+    config_provider.prefetch(SHOP_PARAMETERS)
+    notifier = Notifier(config_provider)
+
+    try:
+        event = event or {}
+        store = _create_store(
+            config_provider, event, _get_token_manager(config_provider), _get_matcher(config_provider)
+        )
+        return _shop(
+            config_provider,
+            notifier,
+            store,
+            event.get("run_id", datetime.now().strftime("%Y-%m-%d")),
+            _get_deadline(context),
+        )
+    except Exception as exception:
+        _forget_rejected_token(exception, _token_manager)
+        notifier.update_status(f"💥 error: {str(exception)}")
+        raise
+    finally:
+        print(http_client.client.report())
+        print(tracing.tracer.summary())
+        tracing.tracer.emit()
+
+def shop_households(event: Any, context: Any):
+    import grocery_shopping.decisions as decisions
+    import grocery_shopping.feed as feed
+    import grocery_shopping.households as households
+    import grocery_shopping.prices as prices
+    import grocery_shopping.shopping as shopping
+
+    http_client.client.reset_stats()
+    tracing.tracer.reset("shop_households")
+    event = event or {}
+
+    try:
+        if "households" not in event:
+            raise ValueError("Missing 'households' in event")
+
+        household_list = households.parse_households(event["households"])
+        shared = households.SharedCaches(
+            feed.ProductsFeed().refresh(),
+            shopping.SearchCache(),
+            decisions.DecisionCache(
+                decisions.create_backend(os.environ.get("DECISION_CACHE", DEFAULT_DECISION_CACHE))
+            ),
+            prices.PriceHistory(os.environ.get("PRICE_HISTORY", prices.DEFAULT_PATH)),
+        )
+        run_id = event.get("run_id", datetime.now().strftime("%Y-%m-%d"))
+        deadline = _get_deadline(context)
+        # the shared caches are reset and reported once for the batch, not by each household's store
+        shared.reset_stats()
+        report = households.run_batch(
+            household_list,
+            lambda household: _shop_household(household, shared, event, run_id, deadline),
+            event.get("parallelism", households.DEFAULT_MAX_WORKERS),
+        )
+        print(report.summary())
+        print(shared.report())
+        shared.decision_cache.compact()
         return {
             "statusCode": 200,
-            "body": json.dumps("Grocery shopping completed successfully!"),
+            "body": json.dumps(f"{len(report.succeeded)} of {len(report.results)} households shopped"),
         }
+    finally:
+        print(http_client.client.report())
+        print(tracing.tracer.summary())
+        tracing.tracer.emit()
+
+def shop_shard(event: Dict[str, Any], context: Any):
+    import grocery_shopping.groceries as groceries
+    import grocery_shopping.sharding as sharding
+
+    http_client.client.reset_stats()
+    tracing.tracer.reset(f"shop_shard.{event['shard']}")
+    config_provider = _get_config_provider()
+    config_provider.prefetch(SHOP_PARAMETERS)
+    start_time = time.perf_counter()
+
+    try:
+        store = _create_store(
+            config_provider, event, _get_token_manager(config_provider), _get_matcher(config_provider)
+        )
+        user = store.log_in()
+        grocery_items = [groceries.GroceryItem.from_dict(item) for item in event["items"]]
+        choices, failed = store.decide(user, grocery_items, _get_deadline(context))
+        wall_time = time.perf_counter() - start_time
+        llm_stats = store.llm_backend.stats if store.llm_backend else None
+        return sharding.ShardResult(
+            event["shard"],
+            len(grocery_items),
+            choices,
+            failed,
+            wall_time,
+            llm_stats.calls if llm_stats else 0,
+            llm_stats.prompt_tokens if llm_stats else 0,
+            llm_stats.completion_tokens if llm_stats else 0,
+            {host: stats.requests for host, stats in http_client.client.stats.items()},
+            wall_time * int(context.memory_limit_in_mb) / 1024 if context is not None else 0.0,
+        ).to_dict()
     except Exception as exception:
+        _forget_rejected_token(exception, _token_manager)
+        raise
+    finally:
+        print(http_client.client.report())
+        print(tracing.tracer.summary())
+        tracing.tracer.emit()
+
+def shop_sharded(event: Any, context: Any):
+    import grocery_shopping.checkpoints as checkpoints
+    import grocery_shopping.feed as feed
+    import grocery_shopping.groceries as groceries
+    import grocery_shopping.sharding as sharding
+
+    http_client.client.reset_stats()
+    tracing.tracer.reset("shop_sharded")
+    config_provider = _get_config_provider()
+    config_provider.prefetch(SHOP_PARAMETERS)
+    notifier = Notifier(config_provider)
+
+    try:
+        event = event or {}
+        store = _create_store(
+            config_provider, event, _get_token_manager(config_provider), _get_matcher(config_provider)
+        )
+        grocery_list = groceries.GroceryList(config_provider)
+        checkpoint = checkpoints.ShopCheckpoint(
+            checkpoints.create_store(os.environ.get("SHOP_CHECKPOINTS", "file:/tmp/shop_checkpoints")),
+            event.get("run_id", datetime.now().strftime("%Y-%m-%d")),
+        )
+        # logging in before the fan-out fails fast on bad credentials and saves a fresh token to the shared
+        # FRISCO_TOKEN_STORE, which the workers load instead of logging in themselves
+        user = store.log_in()
+        grocery_items = grocery_list.get()
+        pending_items = [grocery_item for grocery_item in grocery_items if checkpoint.get_choice(grocery_item) is None]
+
+        parallelism = event.get("parallelism", sharding.DEFAULT_PARALLELISM)
+        runner = sharding.create_runner(
+            event.get("runner", os.environ.get("SHARD_RUNNER", sharding.DEFAULT_RUNNER)), shop_shard, parallelism
+        )
+        if runner.is_local:
+            feed.ProductsFeed().refresh()
+        report = sharding.run_shards(
+            runner,
+            sharding.split(pending_items, event.get("shard_size", sharding.DEFAULT_SHARD_SIZE)),
+            {key: event[key] for key in ("max_workers", "batch_decisions", "top_k") if key in event},
+        )
+        print(report.summary())
+
+        # the reduce step: one cart commit, one shopping log and one pass over the list
+        with tracing.span("reduce"):
+            bought_grocery_items = store.fill_cart(user, grocery_items, report.choices, checkpoint, _get_deadline(context))
+            response = _complete(notifier, grocery_list, grocery_items, bought_grocery_items, checkpoint)
+        response["shards"] = [
+            {key: value for key, value in result.to_dict().items() if key != "choices"} for result in report.results
+        ]
+        return response
+    except Exception as exception:
+        _forget_rejected_token(exception, _token_manager)
+        notifier.update_status(f"💥 error: {str(exception)}")
+        raise
+    finally:
+        print(http_client.client.report())
+        print(tracing.tracer.summary())
+        tracing.tracer.emit()
+
+def _shop_household(
+    household: "households.Household",
+    shared: "households.SharedCaches",
+    event: Dict[str, Any],
+    run_id: str,
+    deadline: Optional[float],
+) -> Dict[str, Any]:
+    import grocery_shopping.auth as auth
+    import grocery_shopping.logging as logging
+    import grocery_shopping.matching as matching
+
+    config_provider = (
+        config.ConfigProvider(household.config_file, prefix=household.config_prefix)
+        if household.config_file
+        else config.ConfigProvider(prefix=household.config_prefix)
+    )
+    config_provider.prefetch(SHOP_PARAMETERS)
+    notifier = Notifier(config_provider)
+    token_manager = _household_token_managers.get(household.name)
+
+    try:
+        if token_manager is None:
+            token_manager = auth.TokenManager(
+                config_provider,
+                auth.create_store(os.environ.get("FRISCO_TOKEN_STORE", auth.DEFAULT_STORE), household.name),
+            )
+            _household_token_managers[household.name] = token_manager
+        matcher = _household_matchers.setdefault(household.name, matching.ProductMatcher()).refresh(config_provider)
+        store = _create_store(
+            config_provider, event, token_manager, matcher, shared, household.path(logging.DEFAULT_JOURNAL_PATH)
+        )
+        return _shop(config_provider, notifier, store, f"{run_id}-{household.name}", deadline)
+    except Exception as exception:
+        _forget_rejected_token(exception, token_manager)
         notifier.update_status(f"💥 error: {str(exception)}")
         raise
 
+def _shop(
+    config_provider: config.ConfigProvider,
+    notifier: Notifier,
+    store: "shopping.Store",
+    run_id: str,
+    deadline: Optional[float],
+) -> Dict[str, Any]:
+    import grocery_shopping.checkpoints as checkpoints
+    import grocery_shopping.groceries as groceries
+
+    grocery_list = groceries.GroceryList(config_provider)
+    checkpoint = checkpoints.ShopCheckpoint(
+        checkpoints.create_store(os.environ.get("SHOP_CHECKPOINTS", "file:/tmp/shop_checkpoints")), run_id
+    )
+    user = store.log_in()
+    grocery_items = grocery_list.get()
+    bought_grocery_items = store.shop(user, grocery_items, checkpoint, deadline)
+    return _complete(notifier, grocery_list, grocery_items, bought_grocery_items, checkpoint)
+
+def _complete(
+    notifier: Notifier,
+    grocery_list: "groceries.GroceryList",
+    grocery_items: List["groceries.GroceryItem"],
+    bought_grocery_items: List["groceries.GroceryItem"],
+    checkpoint: "checkpoints.ShopCheckpoint",
+) -> Dict[str, Any]:
+    import grocery_shopping.checkpoints as checkpoints
+
+    items_to_complete = checkpoint.pending_completion(bought_grocery_items)
+    result = grocery_list.complete(items_to_complete)
+    checkpoint.mark(
+        [grocery_item for grocery_item in items_to_complete if str(grocery_item) not in result.failed],
+        checkpoints.COMPLETED,
+    )
+
+    unfinished_items = checkpoint.unfinished(grocery_items)
+    if unfinished_items:
+        notifier.update_status(
+            f"⏸️ {len(grocery_items) - len(unfinished_items)} of {len(grocery_items)} items processed, run shopping again to continue"
+        )
+        return {
+            "statusCode": 200,
+            "body": json.dumps("Grocery shopping partially completed"),
+        }
+    notifier.update_status("✅ items successfully added to your cart")
+    return {
+        "statusCode": 200,
+        "body": json.dumps("Grocery shopping completed successfully!"),
+    }
+
 if __name__ == "__main__":
     listify(None, None)
     schedule({"preferred_start_time": ["8:00", "8:30", "7:30", "9:00", "7:00", "9:30"]}, None)
@@ -0,0 +1,77 @@
+import json
+import unittest
+from unittest import mock
+
+from benchmarks.replay import load_fixture
+from grocery_shopping.ai import LLM, Product, parse_product, prompt_payload
+
+
+def product(id: str) -> Product:
+    return Product(id, f"Produkt {id}", 1, "Piece", 1.0, 3.0, 3.0, (), "")
+
+
+class TestProduct(unittest.TestCase):
+    def test_parse_product_keeps_only_prompt_fields(self):
+        # arrange
+        store_product = load_fixture("frisco_search_product.json")
+
+        # act
+        product = parse_product(store_product, "mleko")
+
+        # assert
+        self.assertEqual(product.id, "4076")
+        self.assertEqual(product.price_after_promotion, 3.49)
+        self.assertEqual(product.tags, ("Promocja", "Bez glutenu"))
+        self.assertFalse(hasattr(product, "__dict__"))
+        self.assertEqual(prompt_payload([product, product]), str([product.to_dict(), product.to_dict()]))
+
+
+class TestLLM(unittest.TestCase):
+    def setUp(self):
+        self.backend = mock.Mock()
+        self.rate_limiter = mock.Mock()
+        self.llm = LLM(mock.Mock(), max_batch_items=2, backend=self.backend, rate_limiter=self.rate_limiter)
+        self.items = [("Mleko", [product("1")]), ("Jajka", [product("2")]), ("Chleb", [product("3")])]
+
+    def test_choose_many_splits_items_into_batches(self):
+        # arrange
+        self.backend.complete.side_effect = [
+            json.dumps({"decisions": [
+                {"index": 0, "id": "1", "name": None, "reason": "Pasuje"},
+                {"index": 1, "id": "2", "name": None, "reason": "Pasuje"},
+            ]}),
+            json.dumps({"decisions": [{"index": 0, "id": "3", "name": None, "reason": "Pasuje"}]}),
+        ]
+
+        # act
+        choices = self.llm.choose_many(self.items)
+
+        # assert
+        self.assertEqual([choice.product.id for choice in choices], ["1", "2", "3"])
+        self.assertEqual([call.args[1] for call in self.backend.complete.call_args_list], ["decisions", "decisions"])
+        self.assertEqual(self.rate_limiter.wait.call_count, 2)
+
+    def test_choose_many_asks_again_for_entries_missing_from_the_batch(self):
+        # arrange
+        self.backend.complete.side_effect = [
+            json.dumps({"decisions": [{"index": 1, "id": "2", "name": None, "reason": "Pasuje"}]}),
+            json.dumps({"decisions": [{"index": 0, "id": "9", "name": None, "reason": "Spoza listy"}]}),
+            json.dumps({"id": "1", "name": None, "reason": "Pasuje"}),
+            json.dumps({"id": None, "name": None, "reason": "Brak"}),
+        ]
+
+        # act
+        choices = self.llm.choose_many(self.items)
+
+        # assert
+        self.assertEqual(choices[0].product.id, "1")
+        self.assertEqual(choices[1].product.id, "2")
+        self.assertFalse(choices[2].is_product_chosen)
+        self.assertEqual(
+            [call.args[1] for call in self.backend.complete.call_args_list], ["decisions", "decisions", "choice", "choice"]
+        )
+        self.assertEqual(self.rate_limiter.wait.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
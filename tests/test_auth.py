@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from cryptography.fernet import Fernet
+
+from grocery_shopping import auth
+from grocery_shopping.auth import FileTokenStore, TokenManager
+
+
+def token_response(access_token: str, expires_in: int) -> mock.Mock:
+    response = mock.Mock()
+    response.json.return_value = {
+        "user_id": "1",
+        "token_type": "Bearer",
+        "access_token": access_token,
+        "expires_in": expires_in,
+        "refresh_token": f"{access_token}-refresh",
+    }
+    return response
+
+
+class TestTokenManager(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "token")
+        self.config_provider = mock.Mock()
+        self.config_provider.get_value.return_value = Fernet.generate_key().decode("ascii")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_stored_token_is_encrypted_and_reused_by_the_next_process(self):
+        # arrange
+        with mock.patch.object(auth.http_client, "post", return_value=token_response("first", 3600)):
+            TokenManager(self.config_provider, FileTokenStore(self.path)).get_user()
+
+        # act
+        with mock.patch.object(auth.http_client, "post") as post:
+            manager = TokenManager(self.config_provider, FileTokenStore(self.path))
+            user = manager.get_user()
+
+        # assert
+        post.assert_not_called()
+        self.assertIs(manager.get_user(), user)
+        self.assertEqual(user.headers["Authorization"], "Bearer first")
+        with open(self.path, "rb") as file:
+            self.assertNotIn(b"first", file.read())
+
+    def test_token_is_refreshed_ahead_of_expiry(self):
+        # arrange
+        manager = TokenManager(self.config_provider, FileTokenStore(self.path), refresh_margin=300)
+        with mock.patch.object(auth.http_client, "post", return_value=token_response("first", 3600)):
+            manager.get_user()
+
+        # act
+        with mock.patch.object(auth.time, "time", return_value=time.time() + 3400), \
+                mock.patch.object(auth.http_client, "post", return_value=token_response("second", 3600)) as post:
+            user = manager.get_user()
+
+        # assert
+        self.assertEqual(post.call_args.kwargs["data"]["grant_type"], "refresh_token")
+        self.assertEqual(post.call_args.kwargs["data"]["refresh_token"], "first-refresh")
+        self.assertEqual(user.headers["Authorization"], "Bearer second")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from benchmarks.run import compare, run_scenario
+from benchmarks.startup import handler_imports, profile
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_replayed_pipeline_completes_every_item(self):
+        # act
+        results = run_scenario(5)
+
+        # assert
+        self.assertEqual([result["handler"] for result in results], ["listify", "schedule", "shop"])
+        shop_result = results[2]
+        self.assertEqual(shop_result["requests"]["www.frisco.pl"], 7)
+        self.assertEqual(shop_result["llm_calls"], 5)
+        self.assertEqual(compare(results, results, time_tolerance=0.0, memory_tolerance=0.0), [])
+
+    def test_prefetched_choices_are_reused_by_shop(self):
+        # act
+        results = run_scenario(5, prefetch=True)
+
+        # assert
+        self.assertEqual([result["handler"] for result in results], ["listify", "schedule", "prefetch", "shop"])
+        self.assertEqual(results[2]["llm_calls"], 5)
+        self.assertEqual(results[3]["llm_calls"], 0)
+        self.assertNotIn("commerce.frisco.pl", results[3]["requests"])
+
+    def test_households_share_searches_and_decisions(self):
+        # act
+        results = run_scenario(5, households=3)
+
+        # assert
+        households_result = results[2]
+        self.assertEqual(households_result["handler"], "households")
+        self.assertLessEqual(households_result["llm_calls"], 6)
+        self.assertEqual(households_result["requests"]["hook.eu1.make.com"], 3)
+        self.assertGreater(households_result["households_per_minute"], 0)
+
+    def test_sharded_shop_reduces_into_one_cart(self):
+        # act
+        results = run_scenario(5, shard_size=2, parallelism=2)
+
+        # assert
+        sharded_result = results[2]
+        self.assertEqual(sharded_result["handler"], "sharded")
+        self.assertEqual([shard["items"] for shard in sharded_result["shards"]], [2, 2, 1])
+        self.assertTrue(all(shard["error"] is None for shard in sharded_result["shards"]))
+        self.assertEqual(sharded_result["llm_calls"], 5)
+
+    def test_listify_cold_start_skips_openai(self):
+        # act
+        _, _, loaded = profile("listify")
+
+        # assert
+        self.assertIn("grocery_shopping", loaded)
+        self.assertNotIn("openai", loaded)
+
+    def test_shop_cold_start_follows_the_helpers_it_calls(self):
+        # act
+        modules = handler_imports("shop")
+
+        # assert
+        self.assertIn("grocery_shopping.shopping", modules)
+        self.assertIn("grocery_shopping.auth", modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from grocery_shopping.ai import Choice, ChosenProduct
+from grocery_shopping.checkpoints import COMPLETED, IN_CART, FileCheckpointStore, ShopCheckpoint
+from grocery_shopping.groceries import GroceryItem
+from grocery_shopping.shopping import DeadlineExceeded, ShoppingCart, ShoppingRun, Store, User
+
+
+def chosen(product_id: str) -> Choice:
+    return Choice(True, "Pasuje", ChosenProduct(product_id, f"Produkt {product_id}", 3.0, 3.0))
+
+
+class TestShopCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = FileCheckpointStore(self.directory.name)
+        self.grocery_items = [GroceryItem("Mleko", 2, "1"), GroceryItem("Jajka", 1, "2"), GroceryItem("Chleb", 1, "3")]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unfinished_keeps_items_that_did_not_reach_the_cart(self):
+        # arrange
+        checkpoint = ShopCheckpoint(self.store, "run")
+        checkpoint.record_choice(self.grocery_items[0], chosen("mleko"))
+        checkpoint.record_choice(self.grocery_items[1], chosen("jajka"))
+        checkpoint.record_choice(self.grocery_items[2], Choice(False, "Brak"))
+        checkpoint.mark([self.grocery_items[0]], IN_CART)
+
+        # act
+        unfinished_items = ShopCheckpoint(self.store, "run").unfinished(self.grocery_items)
+
+        # assert
+        self.assertEqual(unfinished_items, [self.grocery_items[1]])
+
+    def test_pending_completion_skips_completed_items(self):
+        # arrange
+        checkpoint = ShopCheckpoint(self.store, "run")
+        for grocery_item in self.grocery_items[:2]:
+            checkpoint.record_choice(grocery_item, chosen(grocery_item.task_id))
+        checkpoint.mark([self.grocery_items[0]], COMPLETED)
+
+        # act
+        pending_items = checkpoint.pending_completion(self.grocery_items[:2])
+
+        # assert
+        self.assertEqual(pending_items, [self.grocery_items[1]])
+
+
+class TestStoreResume(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = ShopCheckpoint(FileCheckpointStore(self.directory.name), "run")
+        self.grocery_items = [GroceryItem("Mleko", 2, "1"), GroceryItem("Jajka", 1, "2"), GroceryItem("Chleb", 1, "3")]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def shop(self, shop_item, failed_products: dict) -> tuple:
+        store = Store(mock.Mock())
+        with mock.patch("grocery_shopping.shopping.logging.Logger"), \
+                mock.patch("grocery_shopping.shopping.feed.ProductsFeed"), \
+                mock.patch("grocery_shopping.shopping.ai.LLM"), \
+                mock.patch.object(Store, "_shop_item", autospec=True, side_effect=shop_item) as shop_item_mock, \
+                mock.patch.object(ShoppingCart, "commit", return_value=failed_products) as commit:
+            bought_grocery_items = store.shop(User("1", "Bearer", "token"), self.grocery_items, self.checkpoint)
+        return bought_grocery_items, shop_item_mock, commit
+
+    def test_resume_reuses_recorded_choices_and_defers_items_past_the_deadline(self):
+        # arrange
+        self.checkpoint.record_choice(self.grocery_items[0], chosen("mleko"))
+
+        def shop_item(store: Store, run: ShoppingRun, grocery_item: GroceryItem):
+            if grocery_item.task_id == "2":
+                raise DeadlineExceeded()
+            run.cart_builder.add("chleb", grocery_item.quantity)
+            self.checkpoint.record_choice(grocery_item, chosen("chleb"))
+            return "chleb"
+
+        # act
+        bought_grocery_items, shop_item_mock, commit = self.shop(shop_item, {})
+
+        # assert
+        self.assertEqual([call.args[2].task_id for call in shop_item_mock.call_args_list], ["2", "3"])
+        commit.assert_called_once_with({"mleko": 2, "chleb": 1})
+        self.assertEqual(bought_grocery_items, [self.grocery_items[0], self.grocery_items[2]])
+        self.assertEqual(self.checkpoint.unfinished(self.grocery_items), [self.grocery_items[1]])
+
+    def test_failed_cart_update_is_retried_on_resume(self):
+        # arrange
+        def shop_item(store: Store, run: ShoppingRun, grocery_item: GroceryItem):
+            run.cart_builder.add(grocery_item.name, grocery_item.quantity)
+            self.checkpoint.record_choice(grocery_item, chosen(grocery_item.name))
+            return grocery_item.name
+
+        self.shop(shop_item, {"Jajka": "500 Internal Server Error"})
+
+        # act
+        bought_grocery_items, shop_item_mock, commit = self.shop(shop_item, {})
+
+        # assert
+        shop_item_mock.assert_not_called()
+        commit.assert_called_once_with({"Mleko": 2, "Jajka": 1, "Chleb": 1})
+        self.assertEqual(bought_grocery_items, self.grocery_items)
+        self.assertEqual(self.checkpoint.unfinished(self.grocery_items), [])
+
+    def test_resume_keeps_products_of_items_completed_between_runs(self):
+        # arrange
+        cart: dict = {}
+        deferred = {"2"}
+
+        def shop_item(store: Store, run: ShoppingRun, grocery_item: GroceryItem):
+            if grocery_item.task_id in deferred:
+                raise DeadlineExceeded()
+            run.cart_builder.add(grocery_item.name, grocery_item.quantity)
+            self.checkpoint.record_choice(grocery_item, chosen(grocery_item.name))
+            return grocery_item.name
+
+        def update(quantities: dict):
+            cart.update(quantities)
+            for product_id in [product_id for product_id, quantity in cart.items() if quantity == 0]:
+                del cart[product_id]
+
+        def shop(grocery_items: list) -> list:
+            with mock.patch("grocery_shopping.shopping.logging.Logger"), \
+                    mock.patch("grocery_shopping.shopping.feed.ProductsFeed"), \
+                    mock.patch("grocery_shopping.shopping.ai.LLM"), \
+                    mock.patch.object(Store, "_shop_item", autospec=True, side_effect=shop_item), \
+                    mock.patch.object(ShoppingCart, "get", side_effect=lambda: dict(cart)), \
+                    mock.patch.object(ShoppingCart, "update", side_effect=update):
+                return Store(mock.Mock()).shop(User("1", "Bearer", "token"), grocery_items, self.checkpoint)
+
+        bought_grocery_items = shop(self.grocery_items[:2])
+        # the first run closes the Todoist task of what it bought, so the next run no longer sees it
+        self.checkpoint.mark(bought_grocery_items, COMPLETED)
+        deferred.clear()
+
+        # act
+        shop(self.grocery_items[1:2])
+
+        # assert
+        self.assertEqual(cart, {"Mleko": 2, "Jajka": 1})
+        self.assertEqual(self.checkpoint.unfinished(self.grocery_items[:2]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+
+from grocery_shopping import config
+from grocery_shopping.config import ConfigProvider
+
+
+class TestConfigProvider(unittest.TestCase):
+    def setUp(self):
+        self.ssm = mock.Mock()
+        patches = [
+            mock.patch.object(config, "_ssm_client", self.ssm),
+            mock.patch.dict(config._cache, clear=True),
+            mock.patch.dict(config._missing, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.config_provider = ConfigProvider("missing.ini")
+
+    def test_prefetch_remembers_missing_parameters(self):
+        # arrange
+        self.ssm.get_parameters.return_value = {
+            "Parameters": [{"Name": "/openai/secret", "Value": "secret"}],
+            "InvalidParameters": ["/openai/backend"],
+        }
+
+        # act
+        self.config_provider.prefetch([("openai", "secret"), ("openai", "backend")])
+        self.config_provider.prefetch([("openai", "secret"), ("openai", "backend")])
+        backend = self.config_provider.get_value("openai", "backend", default="assistants")
+
+        # assert
+        self.assertEqual(backend, "assistants")
+        self.assertEqual(self.config_provider.get_value("openai", "secret"), "secret")
+        self.ssm.get_parameters.assert_called_once()
+        self.ssm.get_parameter.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
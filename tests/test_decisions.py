@@ -0,0 +1,135 @@
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from grocery_shopping.ai import Choice, ChosenProduct, Product
+from grocery_shopping.decisions import DecisionCache, FileCacheBackend, SqliteCacheBackend
+
+
+def product(id: str, price: float, price_after_promotion: float) -> Product:
+    return Product(id, f"Produkt {id}", 1, "Piece", 1.0, price, price_after_promotion, (), "")
+
+
+class TestDecisionCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.backend = SqliteCacheBackend(os.path.join(self.directory.name, "decisions.sqlite3"))
+        self.choice = Choice(True, "Najtańsze", ChosenProduct("2", "Mleko 2%", 3.5, 3.0))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup_reuses_choice_for_same_candidates(self):
+        # arrange
+        cache = DecisionCache(self.backend)
+        products = [product("1", 4.0, 4.0), product("2", 3.5, 3.0)]
+        cache.store("Mleko", products, self.choice)
+
+        # act
+        choice = cache.lookup("  mleko ", products)
+
+        # assert
+        assert choice is not None and choice.product is not None
+        self.assertEqual(choice.product.id, "2")
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_lookup_refreshes_price_when_chosen_product_still_available(self):
+        # arrange
+        cache = DecisionCache(self.backend)
+        cache.store("Mleko", [product("1", 4.0, 4.0), product("2", 3.5, 3.0)], self.choice)
+
+        # act
+        choice = cache.lookup("Mleko", [product("2", 3.9, 3.9), product("3", 5.0, 5.0)])
+
+        # assert
+        assert choice is not None and choice.product is not None
+        self.assertEqual(choice.product.price, 3.9)
+
+    def test_lookup_misses_when_chosen_product_is_gone(self):
+        # arrange
+        cache = DecisionCache(self.backend)
+        cache.store("Mleko", [product("1", 4.0, 4.0), product("2", 3.5, 3.0)], self.choice)
+
+        # act
+        choice = cache.lookup("Mleko", [product("1", 4.0, 4.0)])
+
+        # assert
+        self.assertIsNone(choice)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_lookup_misses_expired_entries(self):
+        # arrange
+        cache = DecisionCache(self.backend, ttl=-1)
+        products = [product("2", 3.5, 3.0)]
+        cache.store("Mleko", products, self.choice)
+
+        # act
+        choice = cache.lookup("Mleko", products)
+
+        # assert
+        self.assertIsNone(choice)
+        self.assertIsNone(self.backend.get("mleko"))
+
+    def test_compact_evicts_least_recently_used(self):
+        # arrange
+        cache = DecisionCache(FileCacheBackend(os.path.join(self.directory.name, "decisions.json")), max_entries=2)
+        products = [product("2", 3.5, 3.0)]
+        for name in ["Mleko", "Jajka", "Jogurt"]:
+            cache.store(name, products, self.choice)
+        cache.lookup("Mleko", products)
+
+        # act
+        cache.compact()
+
+        # assert
+        self.assertIsNotNone(cache.backend.get("mleko"))
+        self.assertIsNone(cache.backend.get("jajka"))
+        self.assertIsNotNone(cache.backend.get("jogurt"))
+
+    def test_decide_asks_once_for_concurrent_lists(self):
+        # arrange
+        cache = DecisionCache(self.backend)
+        products = [product("1", 4.0, 4.0), product("2", 3.5, 3.0)]
+        asked = threading.Event()
+        answer = threading.Event()
+        calls = []
+
+        def choose() -> Choice:
+            calls.append("Mleko")
+            asked.set()
+            answer.wait(5)
+            return self.choice
+
+        # act
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(cache.decide, "Mleko", products, choose)
+            asked.wait(5)
+            second = executor.submit(cache.decide, " mleko", products, choose)
+            while cache.coalesced == 0:
+                threading.Event().wait(0.01)
+            answer.set()
+            choices = [first.result(), second.result()]
+
+        # assert
+        self.assertEqual(calls, ["Mleko"])
+        self.assertEqual(choices, [self.choice, self.choice])
+
+    def test_decide_reuses_answer_stored_after_lookup_missed(self):
+        # arrange
+        cache = DecisionCache(self.backend)
+        products = [product("1", 4.0, 4.0), product("2", 3.5, 3.0)]
+        self.assertIsNone(cache.lookup("Mleko", products))
+        cache.store("Mleko", products, self.choice)
+
+        # act
+        choice = cache.decide("Mleko", products, lambda: self.fail("the model was asked again"))
+
+        # assert
+        self.assertEqual(choice, self.choice)
+        self.assertEqual(cache.coalesced, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from grocery_shopping.feed import ProductsFeed
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: bytes = b"", headers: dict = {}):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int):
+        for index in range(0, len(self.body), 7):
+            yield self.body[index:index + 7]
+
+
+class TestProductsFeed(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.directory.name, "feed.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_refresh_indexes_streamed_products(self):
+        # arrange
+        body = json.dumps({
+            "version": 1,
+            "products": [
+                {"productId": "1", "contentData": {"components": "mleko, kultury bakterii"}},
+                {"productId": "2", "contentData": {}},
+                {"productId": "3", "contentData": {"components": "jaja kurze żółte"}},
+            ],
+        }, ensure_ascii=False).encode("utf-8")
+        products_feed = ProductsFeed(self.index_path, max_age=0)
+
+        # act
+        with mock.patch("grocery_shopping.http_client.get", return_value=FakeResponse(200, body, {"ETag": "v1"})):
+            products_feed.refresh()
+
+        # assert
+        self.assertEqual(products_feed.get_components("1"), "mleko, kultury bakterii")
+        self.assertEqual(products_feed.get_components("2"), "")
+        self.assertEqual(products_feed.get_components("3"), "jaja kurze żółte")
+        products_feed.close()
+
+    def test_refresh_keeps_index_when_not_modified(self):
+        # arrange
+        body = json.dumps({"products": [{"productId": "1", "contentData": {"components": "mąka"}}]}).encode("utf-8")
+        products_feed = ProductsFeed(self.index_path, max_age=0)
+        with mock.patch("grocery_shopping.http_client.get", return_value=FakeResponse(200, body, {"ETag": "v1"})):
+            products_feed.refresh()
+
+        # act
+        with mock.patch("grocery_shopping.http_client.get", return_value=FakeResponse(304)) as get:
+            products_feed.refresh()
+
+        # assert
+        self.assertEqual(get.call_args.kwargs["headers"]["If-None-Match"], "v1")
+        self.assertEqual(products_feed.get_components("1"), "mąka")
+        products_feed.close()
+
+    def test_refresh_skips_products_mentioned_in_other_values(self):
+        # arrange
+        body = json.dumps({
+            "description": 'all "products" [of the store]',
+            "products": [{"productId": "1", "contentData": {"components": "mąka"}}],
+        }).encode("utf-8")
+        products_feed = ProductsFeed(self.index_path, max_age=0)
+
+        # act
+        with mock.patch("grocery_shopping.http_client.get", return_value=FakeResponse(200, body)):
+            products_feed.refresh()
+
+        # assert
+        self.assertEqual(products_feed.get_components("1"), "mąka")
+        products_feed.close()
+
+    def test_refresh_keeps_previous_index_when_feed_is_cut_short(self):
+        # arrange
+        body = json.dumps({"products": [{"productId": "1", "contentData": {"components": "mąka"}}]}).encode("utf-8")
+        products_feed = ProductsFeed(self.index_path, max_age=0)
+        with mock.patch("grocery_shopping.http_client.get", return_value=FakeResponse(200, body, {"ETag": "v1"})):
+            products_feed.refresh()
+        truncated_body = json.dumps({"products": [
+            {"productId": "2", "contentData": {"components": "cukier"}},
+            {"productId": "3", "contentData": {"components": "sól"}},
+        ]}).encode("utf-8")[:-30]
+
+        # act
+        with mock.patch("grocery_shopping.http_client.get", return_value=FakeResponse(200, truncated_body)), \
+                self.assertRaises(ValueError):
+            products_feed.refresh()
+
+        # assert
+        self.assertEqual(products_feed.get_components("1"), "mąka")
+        self.assertEqual(products_feed.get_components("2"), "")
+        products_feed.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import unittest
+from unittest import mock
+
+from grocery_shopping.groceries import GroceryItem, GroceryList
+from grocery_shopping.meal_planing import ShoppingListItem
+
+
+class TestGroceryList(unittest.TestCase):
+    def setUp(self):
+        config_provider = mock.Mock()
+        config_provider.get_value.return_value = "value"
+        self.grocery_list = GroceryList(config_provider)
+        self.commands = []
+
+    def sync(self, statuses: dict):
+        def post(url: str, data: dict, headers: dict):
+            commands = json.loads(data["commands"])
+            self.commands.extend(commands)
+            response = mock.Mock()
+            response.json.return_value = {
+                "sync_status": {
+                    command["uuid"]: statuses.get(command["args"].get("content") or command["args"].get("id"), "ok")
+                    for command in commands
+                }
+            }
+            return response
+
+        return mock.patch("grocery_shopping.groceries.http_client.post", side_effect=post)
+
+    def test_load_skips_items_already_on_the_list_or_repeated(self):
+        # arrange
+        tasks = mock.Mock()
+        tasks.json.return_value = [{"id": "1", "content": "2x  Mleko"}]
+        shopping_list = [
+            ShoppingListItem("mleko", 2, None, ""),
+            ShoppingListItem("Jajka", 1, "2024-05-10", "https://www.frisco.pl/jajka"),
+            ShoppingListItem("jajka", 1, None, ""),
+        ]
+
+        # act
+        with mock.patch("grocery_shopping.groceries.http_client.get", return_value=tasks), self.sync({}):
+            result = self.grocery_list.load(shopping_list)
+
+        # assert
+        self.assertEqual(result.succeeded, ["Jajka"])
+        self.assertEqual(result.skipped, ["2x mleko", "jajka"])
+        self.assertEqual(len(self.commands), 1)
+        self.assertEqual(self.commands[0]["args"]["due"], {"string": "2024-05-09"})
+
+    def test_complete_reports_items_that_fail_individually(self):
+        # arrange
+        grocery_items = [GroceryItem("Mleko", 2, "1"), GroceryItem("Jajka", 1, "2")]
+
+        # act
+        with self.sync({"2": {"error": "Item not found"}}):
+            result = self.grocery_list.complete(grocery_items)
+
+        # assert
+        self.assertEqual([command["type"] for command in self.commands], ["item_close", "item_close"])
+        self.assertEqual(result.succeeded, ["2x Mleko"])
+        self.assertEqual(result.failed, {"1x Jajka": "Item not found"})
+
+
+if __name__ == "__main__":
+    unittest.main()
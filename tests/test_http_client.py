@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional
+from unittest import mock
+
+import requests
+
+from grocery_shopping.http_client import MAX_RETRIES, HttpClient, _parse_retry_after
+
+
+URL = "https://www.frisco.pl/app/commerce/api/v1/offer/products"
+
+
+def response(status_code: int, headers: Optional[dict] = None) -> mock.Mock:
+    result = mock.Mock()
+    result.status_code = status_code
+    result.headers = headers or {}
+    return result
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        self.client = HttpClient()
+        self.session = mock.Mock()
+        self.client.sessions["www.frisco.pl"] = self.session
+        self.sleep = mock.patch("grocery_shopping.http_client.time.sleep").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_rate_limited_request_waits_retry_after_seconds(self):
+        # arrange
+        self.session.request.side_effect = [response(429, {"Retry-After": "2"}), response(200)]
+
+        # act
+        result = self.client.get(URL)
+
+        # assert
+        self.assertEqual(result.status_code, 200)
+        self.sleep.assert_called_once_with(2.0)
+
+    def test_retry_after_accepts_an_http_date(self):
+        # arrange
+        retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+
+        # act
+        delay = _parse_retry_after(retry_at)
+
+        # assert
+        assert delay is not None
+        self.assertGreater(delay, 8.0)
+        self.assertLessEqual(delay, 10.0)
+        self.assertEqual(_parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(_parse_retry_after("soon"))
+
+    def test_server_error_is_retried_only_for_idempotent_methods(self):
+        # arrange
+        self.session.request.side_effect = [response(503), response(200), response(503)]
+
+        # act
+        get_result = self.client.get(URL)
+        post_result = self.client.post(URL)
+
+        # assert
+        self.assertEqual((get_result.status_code, post_result.status_code), (200, 503))
+        self.assertEqual(self.session.request.call_count, 3)
+
+    def test_rate_limited_post_is_retried(self):
+        # arrange
+        self.session.request.side_effect = [response(429), response(201)]
+
+        # act
+        result = self.client.post(URL)
+
+        # assert
+        self.assertEqual(result.status_code, 201)
+        self.assertEqual(self.session.request.call_count, 2)
+
+    def test_connection_error_is_retried_until_attempts_run_out(self):
+        # arrange
+        self.session.request.side_effect = requests.ConnectionError("reset")
+
+        # act
+        with self.assertRaises(requests.ConnectionError):
+            self.client.get(URL)
+
+        # assert
+        self.assertEqual(self.session.request.call_count, MAX_RETRIES + 1)
+        self.assertEqual(self.sleep.call_count, MAX_RETRIES)
+
+    def test_stats_count_requests_retries_and_errors_per_host(self):
+        # arrange
+        self.session.request.side_effect = [response(500), response(200), response(404)]
+
+        # act
+        self.client.get(URL)
+        self.client.get(URL)
+
+        # assert
+        stats = self.client.stats["www.frisco.pl"]
+        self.assertEqual((stats.requests, stats.retries, stats.errors), (3, 1, 1))
+        self.assertIn("www.frisco.pl: 3 requests, 1 retries, 1 errors", self.client.report())
+        self.client.reset_stats()
+        self.assertEqual(self.client.report(), "HTTP: no requests")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from grocery_shopping.llm_backends import AssistantsBackend
+
+
+def run(status: str) -> SimpleNamespace:
+    return SimpleNamespace(id="run", thread_id="thread", status=status, usage=None, last_error=None)
+
+
+class TestAssistantsBackend(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.backend = AssistantsBackend(self.client, "assistant", poll_interval=0.1, max_poll_interval=0.2)
+
+    def test_complete_polls_with_growing_interval(self):
+        # arrange
+        self.client.beta.threads.create_and_run.return_value = run("queued")
+        self.client.beta.threads.runs.retrieve.side_effect = [run("in_progress")] * 3 + [run("completed")]
+        message = SimpleNamespace(content=[SimpleNamespace(type="text", text=SimpleNamespace(value='{"id": null}'))])
+        self.client.beta.threads.messages.list.return_value = SimpleNamespace(data=[message])
+
+        # act
+        with mock.patch("grocery_shopping.llm_backends.time.sleep") as sleep:
+            text = self.backend.complete("Mleko", "choice", {})
+
+        # assert
+        self.assertEqual(text, '{"id": null}')
+        self.assertEqual([round(call.args[0], 2) for call in sleep.call_args_list], [0.1, 0.15, 0.2, 0.2])
+        self.assertEqual(self.backend.stats.calls, 1)
+
+    def test_complete_asks_the_run_for_the_json_schema(self):
+        # arrange
+        schema = {"type": "object", "properties": {"id": {"type": ["string", "null"]}}}
+        self.client.beta.threads.create_and_run.return_value = run("completed")
+        self.client.beta.threads.messages.list.return_value = SimpleNamespace(data=[])
+
+        # act
+        self.backend.complete("Mleko", "choice", schema)
+
+        # assert
+        self.assertEqual(
+            self.client.beta.threads.create_and_run.call_args.kwargs["response_format"],
+            {"type": "json_schema", "json_schema": {"name": "choice", "schema": schema, "strict": True}},
+        )
+
+    def test_complete_cancels_a_run_past_the_timeout(self):
+        # arrange
+        self.backend.run_timeout = 0.0
+        self.client.beta.threads.create_and_run.return_value = run("in_progress")
+
+        # act
+        with mock.patch("grocery_shopping.llm_backends.time.sleep"), self.assertRaises(TimeoutError):
+            self.backend.complete("Mleko", "choice", {})
+
+        # assert
+        self.client.beta.threads.runs.cancel.assert_called_once_with("run", thread_id="thread")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from grocery_shopping.ai import Choice
+from grocery_shopping.groceries import GroceryItem
+from grocery_shopping.logging import Logger
+
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.directory.name, "journal.jsonl")
+        config_provider = mock.Mock()
+        config_provider.get_value.return_value = "value"
+        self.logger = Logger(config_provider, self.journal_path, requests_per_second=1000)
+        self.grocery_items = [GroceryItem("Mleko", 2, "1"), GroceryItem("Jajka", 1, "2"), GroceryItem("Chleb", 1, "3")]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_journal(self) -> list:
+        with open(self.journal_path, encoding="utf-8") as journal:
+            return [json.loads(line) for line in journal]
+
+    def product_name(self, record: dict) -> str:
+        return record["properties"]["Product name"]["title"][0]["text"]["content"]
+
+    def test_records_are_journaled_once_notion_fails(self):
+        # arrange
+        with mock.patch("grocery_shopping.logging.http_client.post", side_effect=ConnectionError("down")) as post:
+            # act
+            for grocery_item in self.grocery_items:
+                self.logger.log_choice("shopping", grocery_item, Choice(False, "Brak"))
+            self.logger.flush()
+
+        # assert
+        post.assert_called_once()
+        self.assertEqual([self.product_name(record) for record in self.read_journal()], ["Mleko", "Jajka", "Chleb"])
+
+    def test_journaled_records_are_replayed_by_the_next_run(self):
+        # arrange
+        with mock.patch("grocery_shopping.logging.http_client.post", side_effect=ConnectionError("down")):
+            self.logger.log_choice("shopping", self.grocery_items[0], Choice(False, "Brak"))
+            self.logger.flush()
+
+        # act
+        with mock.patch("grocery_shopping.logging.http_client.post") as post:
+            self.logger.log_choice("shopping", self.grocery_items[1], Choice(False, "Brak"))
+            self.logger.flush()
+
+        # assert
+        posted = [self.product_name(json.loads(call.kwargs["data"])) for call in post.call_args_list]
+        self.assertEqual(posted, ["Mleko", "Jajka"])
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def test_flush_journals_pending_records_at_the_deadline(self):
+        # arrange
+        release = threading.Event()
+
+        def post(*args, **kwargs):
+            release.wait(5)
+            return mock.Mock()
+
+        with mock.patch("grocery_shopping.logging.http_client.post", side_effect=post):
+            for grocery_item in self.grocery_items:
+                self.logger.log_choice("shopping", grocery_item, Choice(False, "Brak"))
+            worker = self.logger.worker
+
+            # act
+            start_time = time.monotonic()
+            self.logger.flush(deadline=start_time + 0.1)
+            flush_time = time.monotonic() - start_time
+            release.set()
+            worker.join(5)
+
+        # assert
+        self.assertLess(flush_time, 1.0)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual([self.product_name(record) for record in self.read_journal()], ["Jajka", "Chleb"])
+
+
+if __name__ == "__main__":
+    unittest.main()
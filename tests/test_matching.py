@@ -0,0 +1,47 @@
+import unittest
+
+from grocery_shopping.ai import Product
+from grocery_shopping.matching import ProductMatcher
+
+
+def product(id: str, name: str) -> Product:
+    return Product(id, name, 1, "Piece", 1.0, 4.0, 4.0, (), "")
+
+
+class TestProductMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = ProductMatcher()
+        self.matcher.add([
+            ("Mleko 2%", "1"),
+            ("Mlekovita Mleko 2% UHT", "1"),
+            ("Jajka z wolnego wybiegu", "7"),
+        ])
+
+    def test_known_item_matches_the_product_bought_before(self):
+        # arrange
+        products = [product("1", "Mlekovita Mleko 2% UHT"), product("2", "Łaciate Mleko 3,2%")]
+
+        # act
+        match = self.matcher.match("mleko 2% UHT", products)
+
+        # assert
+        assert match is not None
+        self.assertEqual(match.product_id, "1")
+        self.assertEqual(self.matcher.counts["matched"], 1)
+
+    def test_item_falls_back_when_the_usual_product_is_unavailable_or_unknown(self):
+        # arrange
+        products = [product("2", "Łaciate Mleko 3,2%"), product("3", "Mleko owsiane")]
+
+        # act
+        usual_product_gone = self.matcher.match("Mleko 2%", products)
+        unknown_item = self.matcher.match("Pietruszka", products)
+
+        # assert
+        self.assertIsNone(usual_product_gone)
+        self.assertIsNone(unknown_item)
+        self.assertEqual((self.matcher.counts["ambiguous"], self.matcher.counts["unknown"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from grocery_shopping.meal_planing import MealPlan
+
+
+def ingredient(name: str) -> dict:
+    return {
+        "properties": {
+            "Ingredient": {"title": [{"plain_text": name}]},
+            "Quantity": {"number": None},
+            "Needed for date": {"formula": {"date": None}},
+            "Frisco": {"formula": {"string": ""}},
+        }
+    }
+
+
+class TestMealPlan(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        config_provider = mock.Mock()
+        config_provider.get_value.return_value = "value"
+        self.meal_plan = MealPlan(config_provider, os.path.join(self.directory.name, "meal_plan.json"))
+        self.queries = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def query(self, pages: list):
+        def post(url: str, data: str, headers: dict):
+            self.queries.append(json.loads(data))
+            response = mock.Mock()
+            response.json.return_value = pages[len(self.queries) - 1]
+            return response
+
+        return mock.patch("grocery_shopping.meal_planing.http_client.post", side_effect=post)
+
+    def test_iter_shopping_list_follows_every_page(self):
+        # arrange
+        pages = [
+            {"results": [ingredient("Mleko"), ingredient("Jajka")], "has_more": True, "next_cursor": "page-2"},
+            {"results": [ingredient("Chleb")], "has_more": False, "next_cursor": None},
+        ]
+
+        # act
+        with self.query(pages):
+            shopping_list = self.meal_plan.get_shopping_list()
+
+        # assert
+        self.assertEqual([item.name for item in shopping_list], ["Mleko", "Jajka", "Chleb"])
+        self.assertEqual([query.get("start_cursor") for query in self.queries], [None, "page-2"])
+
+    def test_incremental_query_filters_on_the_last_run(self):
+        # arrange
+        with self.query([{"results": [], "has_more": False}]):
+            list(self.meal_plan.iter_shopping_list(incremental=True))
+        self.meal_plan.save_checkpoint()
+        last_run = (self.meal_plan.query_started_at - timedelta(minutes=1)).isoformat(timespec="seconds")
+        self.queries = []
+
+        # act
+        with self.query([{"results": [ingredient("Mleko")], "has_more": False}]):
+            shopping_list = list(self.meal_plan.iter_shopping_list(incremental=True))
+
+        # assert
+        self.assertEqual([item.name for item in shopping_list], ["Mleko"])
+        self.assertIn(
+            {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": last_run}},
+            self.queries[0]["filter"]["and"],
+        )
+
+    def test_full_query_ignores_the_last_run(self):
+        # arrange
+        with self.query([{"results": [], "has_more": False}]):
+            list(self.meal_plan.iter_shopping_list())
+        self.meal_plan.save_checkpoint()
+        self.queries = []
+
+        # act
+        with self.query([{"results": [], "has_more": False}]):
+            list(self.meal_plan.iter_shopping_list())
+
+        # assert
+        self.assertNotIn("timestamp", json.dumps(self.queries[0]["filter"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import time
+import unittest
+
+from grocery_shopping.ai import Product
+from grocery_shopping.prices import DAY, PriceHistory
+from grocery_shopping.ranking import UNIT_PRICE_WEIGHT, CandidateRanker
+
+
+def product(id: str, name: str, grammage: float, price: float, price_after_promotion: float) -> Product:
+    return Product(id, name, 1, "Kilogram", grammage, price, price_after_promotion, (), "")
+
+
+class TestPriceHistory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.price_history = PriceHistory(os.path.join(self.directory.name, "prices.sqlite3"))
+
+    def tearDown(self):
+        self.price_history.close()
+        self.directory.cleanup()
+
+    def test_product_stats_cover_recent_weeks(self):
+        # arrange
+        today = int(time.time() // DAY)
+        self.price_history.connection.executemany(
+            "INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                ("mleko", "1", today - 100, 2.0, 2.0, 2.0, 0),
+                ("mleko", "1", today - 10, 3.0, 2.5, 2.5, 0),
+            ],
+        )
+        self.price_history.observe("Mleko", [product("2", "Mleko 2%", 0.5, 2.0, 1.5)])
+
+        # act
+        self.price_history.flush()
+
+        # assert
+        stats = self.price_history.product_stats("Mleko", ["1", "2"], weeks=4)
+        self.assertEqual((stats["1"].typical_price, stats["2"].typical_price), (2.5, 1.5))
+        self.assertEqual(self.price_history.product_stats("Mleko", ["1"], weeks=52)["1"].typical_price, 2.25)
+        self.assertEqual(self.price_history.product_stats("Jajka", ["1"]), {})
+        self.assertEqual(self.price_history.best_unit_price("mleko", weeks=4), 2.5)
+        self.assertEqual(self.price_history.best_unit_price("Mleko", weeks=52), 2.0)
+        self.assertIsNone(self.price_history.best_unit_price("Jajka"))
+
+    def test_ranker_prefers_products_chosen_before(self):
+        # arrange
+        products = [
+            product("1", "Mleko 2%", 1.0, 3.5, 3.5),
+            product("2", "Mleko 3,2%", 1.0, 3.5, 3.5),
+        ]
+        self.price_history.observe("Mleko", products)
+        self.price_history.observe_choice("Mleko", "2")
+        self.price_history.flush()
+        ranker = CandidateRanker(price_history=self.price_history)
+
+        # act
+        scored = ranker.score("Mleko", products)
+
+        # assert
+        self.assertEqual(scored[0].product.id, "2")
+
+    def test_ranker_scores_unit_price_against_the_cheapest_seen_recently(self):
+        # arrange
+        products = [product("1", "Mleko 2%", 1.0, 4.0, 4.0)]
+        without_history = CandidateRanker().score("Mleko", products)[0].score
+        self.price_history.observe("Mleko", [product("2", "Mleko 3,2%", 1.0, 2.0, 2.0)])
+        self.price_history.flush()
+        ranker = CandidateRanker(price_history=self.price_history)
+
+        # act
+        scored = ranker.score("Mleko", products)
+
+        # assert
+        self.assertAlmostEqual(without_history - scored[0].score, UNIT_PRICE_WEIGHT / 2)
+
+    def test_choice_observed_by_another_process_flags_the_stored_price(self):
+        # arrange
+        products = [product("1", "Mleko 2%", 1.0, 3.5, 3.5), product("2", "Mleko 3,2%", 1.0, 3.5, 3.5)]
+        self.price_history.observe("Mleko", products)
+        self.price_history.flush()
+        reducer = PriceHistory(self.price_history.path)
+
+        # act
+        reducer.observe_choice("Mleko", "2")
+        reducer.flush()
+        reducer.close()
+
+        # assert
+        stats = self.price_history.product_stats("Mleko", ["1", "2"])
+        self.assertEqual((stats["1"].times_chosen, stats["2"].times_chosen), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+from grocery_shopping.ai import Product
+from grocery_shopping.ranking import CandidateRanker
+
+
+def product(id: str, name: str, grammage: float, price: float, price_after_promotion: float) -> Product:
+    return Product(id, name, 1, "Kilogram", grammage, price, price_after_promotion, (), "")
+
+
+class TestCandidateRanker(unittest.TestCase):
+    def test_rank_keeps_top_k_candidates(self):
+        # arrange
+        ranker = CandidateRanker(top_k=2)
+        products = [
+            product("1", "Marchew myta", 1.0, 3.0, 3.0),
+            product("2", "Sok marchwiowy", 1.0, 6.0, 6.0),
+            product("3", "Marchewka mini", 0.5, 4.0, 3.0),
+            product("4", "Chleb żytni", 0.5, 5.0, 5.0),
+        ]
+
+        # act
+        ranking = ranker.rank("Marchewka", products)
+
+        # assert
+        self.assertEqual([candidate.id for candidate in ranking.candidates], ["1", "3"])
+        self.assertEqual(ranking.pruned, 2)
+        self.assertGreater(ranking.tokens_saved, 0)
+        self.assertIsNone(ranking.winner)
+
+    def test_rank_picks_clear_winner(self):
+        # arrange
+        ranker = CandidateRanker()
+        products = [
+            product("1", "Pietruszka korzeń", 0.2, 2.5, 2.5),
+            product("2", "Chleb żytni", 0.5, 5.0, 5.0),
+        ]
+
+        # act
+        ranking = ranker.rank("Pietruszka", products)
+
+        # assert
+        assert ranking.winner is not None
+        self.assertEqual(ranking.winner.id, "1")
+        self.assertEqual(ranker.llm_skipped, 1)
+
+    def test_rank_leaves_close_candidates_to_llm(self):
+        # arrange
+        ranker = CandidateRanker()
+        products = [
+            product("1", "Mleko 2%", 1.0, 3.5, 3.5),
+            product("2", "Mleko 3,2%", 1.0, 3.7, 3.7),
+        ]
+
+        # act
+        ranking = ranker.rank("Mleko", products)
+
+        # assert
+        self.assertIsNone(ranking.winner)
+        self.assertEqual(len(ranking.candidates), 2)
+
+    def test_rank_leaves_single_partial_match_to_llm(self):
+        # arrange
+        ranker = CandidateRanker()
+
+        # act
+        ranking = ranker.rank("Mleko owsiane", [product("1", "Mleko krowie UHT 3,2% 1l", 1.0, 3.5, 3.5)])
+
+        # assert
+        self.assertIsNone(ranking.winner)
+        self.assertEqual(ranker.llm_skipped, 0)
+
+    def test_rank_picks_single_candidate_naming_every_query_word(self):
+        # arrange
+        ranker = CandidateRanker()
+
+        # act
+        ranking = ranker.rank("Mleko owsiane", [product("1", "Napój owsiany Mleko owsiane 1l", 1.0, 8.0, 8.0)])
+
+        # assert
+        assert ranking.winner is not None
+        self.assertEqual(ranking.winner.id, "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,23 @@
+import threading
 import unittest
-from datetime import datetime
-from grocery_shopping.shopping import Store
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
+
+import requests
+
+from grocery_shopping.shopping import CartBuilder, Delivery, SearchCache, ShoppingCart, ShoppingRun, Store, User
 from grocery_shopping.groceries import GroceryItem
 from grocery_shopping.config import ConfigProvider
+from grocery_shopping.throttling import DEFAULT_RATE_LIMITS
 
 
 class TestStoreIntegration(unittest.TestCase):
-    def setUp(self):
-        self.config_provider = ConfigProvider()
-        self.store = Store(self.config_provider)
-        self.user = self.store.log_in()
+    @classmethod
+    def setUpClass(cls):
+        cls.config_provider = ConfigProvider()
+        cls.store = Store(cls.config_provider)
+        cls.user = cls.store.log_in()
 
     def test_shop_integration(self):
         # arrange
@@ -27,5 +35,247 @@ class TestStoreIntegration(unittest.TestCase):
         # assert
         self.assertGreater(len(bought_grocery_items), 0)
 
+
+class TestShoppingCart(unittest.TestCase):
+    def test_commit_sends_only_changed_products(self):
+        # arrange
+        shopping_cart = ShoppingCart(User("1", "Bearer", "token"))
+        cart_builder = CartBuilder()
+        cart_builder.add("mleko", 1)
+        cart_builder.add("jajka", 1)
+        cart_builder.add("mleko", 2)
+
+        # act
+        with mock.patch.object(shopping_cart, "get", return_value={"jajka": 1, "chleb": 1}), \
+                mock.patch.object(shopping_cart, "update") as update:
+            failed = shopping_cart.commit(cart_builder.quantities)
+
+        # assert
+        update.assert_called_once_with({"mleko": 3, "chleb": 0})
+        self.assertEqual(failed, {})
+
+    def test_commit_splits_changes_into_batches_and_skips_an_unchanged_cart(self):
+        # arrange
+        shopping_cart = ShoppingCart(User("1", "Bearer", "token"))
+        quantities = {"mleko": 1, "jajka": 2, "chleb": 1}
+
+        # act
+        with mock.patch.object(shopping_cart, "get", return_value={}), \
+                mock.patch.object(shopping_cart, "update") as update:
+            shopping_cart.commit(quantities, batch_size=2)
+        with mock.patch.object(shopping_cart, "get", return_value=quantities), \
+                mock.patch.object(shopping_cart, "update") as unchanged_update:
+            failed = shopping_cart.commit(quantities, batch_size=2)
+
+        # assert
+        self.assertEqual(
+            [call.args[0] for call in update.call_args_list], [{"mleko": 1, "jajka": 2}, {"chleb": 1}]
+        )
+        unchanged_update.assert_not_called()
+        self.assertEqual(failed, {})
+
+    def test_commit_reports_products_that_fail_individually(self):
+        # arrange
+        shopping_cart = ShoppingCart(User("1", "Bearer", "token"))
+
+        def update(quantities: dict):
+            if "zepsute" in quantities:
+                raise Exception("400 Bad Request")
+
+        # act
+        with mock.patch.object(shopping_cart, "get", return_value={}), \
+                mock.patch.object(shopping_cart, "update", side_effect=update):
+            failed = shopping_cart.commit({"mleko": 1, "zepsute": 1})
+
+        # assert
+        self.assertEqual(list(failed), ["zepsute"])
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_concurrent_searches_for_the_same_key_fetch_once(self):
+        # arrange
+        search_cache = SearchCache()
+        fetching = threading.Event()
+        answer = threading.Event()
+        calls = []
+
+        def fetch() -> list:
+            calls.append("mleko")
+            fetching.set()
+            answer.wait(5)
+            return ["mleko"]
+
+        # act
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(search_cache.get_or_fetch, "mleko", fetch)
+            fetching.wait(5)
+            second = executor.submit(search_cache.get_or_fetch, "mleko", fetch)
+            while search_cache.coalesced == 0:
+                threading.Event().wait(0.01)
+            answer.set()
+            results = [first.result(), second.result()]
+        cached = search_cache.get_or_fetch("mleko", fetch)
+
+        # assert
+        self.assertEqual(calls, ["mleko"])
+        self.assertEqual(results, [["mleko"], ["mleko"]])
+        self.assertEqual(cached, ["mleko"])
+        self.assertEqual((search_cache.misses, search_cache.coalesced, search_cache.hits), (1, 1, 1))
+
+    def test_oldest_searches_are_evicted(self):
+        # arrange
+        search_cache = SearchCache(max_entries=2)
+        for key in ["mleko", "jajka", "chleb"]:
+            search_cache.get_or_fetch(key, lambda: [key])
+        fetch = mock.Mock(return_value=["mleko"])
+
+        # act
+        search_cache.get_or_fetch("mleko", fetch)
+        search_cache.get_or_fetch("chleb", fetch)
+
+        # assert
+        fetch.assert_called_once()
+        self.assertEqual(list(search_cache.results), ["chleb", "mleko"])
+
+    def test_failed_search_is_not_cached(self):
+        # arrange
+        search_cache = SearchCache()
+        fetch = mock.Mock(side_effect=[Exception("503 Service Unavailable"), ["mleko"]])
+
+        # act
+        with self.assertRaises(Exception):
+            search_cache.get_or_fetch("mleko", fetch)
+        result = search_cache.get_or_fetch("mleko", fetch)
+
+        # assert
+        self.assertEqual(result, ["mleko"])
+        self.assertEqual(fetch.call_count, 2)
+
+
+class TestStoreShop(unittest.TestCase):
+    def test_shop_keeps_list_order_and_isolates_failures(self):
+        # arrange
+        grocery_list = [GroceryItem("Mleko", 2, "1"), GroceryItem("Jajka", 1, "2"), GroceryItem("Chleb", 1, "3")]
+        first_item_released = threading.Event()
+
+        def shop_item(store: Store, run: ShoppingRun, grocery_item: GroceryItem):
+            if grocery_item.task_id == "1":
+                # the first item finishes last, after the others have already been shopped
+                first_item_released.wait(5)
+            elif grocery_item.task_id == "2":
+                raise Exception("500 Internal Server Error")
+            else:
+                first_item_released.set()
+            run.cart_builder.add(grocery_item.name, grocery_item.quantity)
+            return grocery_item.name
+
+        # act
+        with mock.patch("grocery_shopping.shopping.logging.Logger"), \
+                mock.patch("grocery_shopping.shopping.feed.ProductsFeed"), \
+                mock.patch("grocery_shopping.shopping.ai.LLM"), \
+                mock.patch.object(Store, "_shop_item", autospec=True, side_effect=shop_item), \
+                mock.patch.object(ShoppingCart, "commit", return_value={}) as commit:
+            bought_grocery_items = Store(mock.Mock(), max_workers=3).shop(User("1", "Bearer", "token"), grocery_list)
+
+        # assert
+        self.assertEqual(bought_grocery_items, [grocery_list[0], grocery_list[2]])
+        commit.assert_called_once_with({"Chleb": 1, "Mleko": 2})
+
+
+class TestStoreRateLimits(unittest.TestCase):
+    def test_partial_rate_limits_keep_the_defaults_for_other_services(self):
+        # act
+        store = Store(mock.Mock(), rate_limits={"frisco": 10.0})
+
+        # assert
+        self.assertEqual(store.rate_limiters["frisco"].interval, 0.1)
+        self.assertEqual(store.rate_limiters["openai"].interval, 1 / DEFAULT_RATE_LIMITS["openai"])
+
+
+class TestStoreSchedule(unittest.TestCase):
+    def test_schedule_reserves_next_option_when_slot_is_taken(self):
+        # arrange
+        store = Store(mock.Mock())
+        tomorrow = (datetime.now() + timedelta(days=1)).date()
+        reserved = []
+
+        def get_delivery_windows(delivery: Delivery, shipping_address: dict) -> list:
+            hours = [9] if delivery.date.date() == tomorrow else [8, 9]
+            return [
+                {"canReserve": True, "deliveryWindow": {"startsAt": delivery.date.replace(hour=hour, minute=0, second=0, microsecond=0).isoformat()}}
+                for hour in hours
+            ]
+
+        def reserve_delivery(delivery: Delivery, shipping_address: dict, delivery_window: dict):
+            reserved.append(datetime.fromisoformat(delivery_window["startsAt"]))
+            if len(reserved) == 1:
+                response = requests.Response()
+                response.status_code = 409
+                raise requests.HTTPError("409 Conflict", response=response)
+
+        # act
+        with mock.patch.object(Delivery, "get_shipping_address", return_value={}), \
+                mock.patch.object(Delivery, "get_delivery_windows", autospec=True, side_effect=get_delivery_windows), \
+                mock.patch.object(Delivery, "reserve_delivery", autospec=True, side_effect=reserve_delivery):
+            delivery_window = store.schedule(User("1", "Bearer", "token"), ["8:00", "9:00"], days=2)
+
+        # assert
+        self.assertEqual([(date.date(), date.hour) for date in reserved], [(tomorrow, 9), (tomorrow + timedelta(days=1), 8)])
+        self.assertEqual(datetime.fromisoformat(delivery_window["startsAt"]), reserved[1])
+
+    def test_schedule_reserves_the_first_free_window_after_many_taken_ones(self):
+        # arrange
+        store = Store(mock.Mock())
+        reserved = []
+
+        def get_delivery_windows(delivery: Delivery, shipping_address: dict) -> list:
+            return [
+                {"canReserve": True, "deliveryWindow": {"startsAt": delivery.date.replace(hour=hour, minute=0, second=0, microsecond=0).isoformat()}}
+                for hour in [8, 9, 10]
+            ]
+
+        def reserve_delivery(delivery: Delivery, shipping_address: dict, delivery_window: dict):
+            reserved.append(delivery_window)
+            if len(reserved) <= 4:
+                response = requests.Response()
+                response.status_code = 409
+                raise requests.HTTPError("409 Conflict", response=response)
+
+        # act
+        with mock.patch.object(Delivery, "get_shipping_address", return_value={}), \
+                mock.patch.object(Delivery, "get_delivery_windows", autospec=True, side_effect=get_delivery_windows), \
+                mock.patch.object(Delivery, "reserve_delivery", autospec=True, side_effect=reserve_delivery):
+            delivery_window = store.schedule(User("1", "Bearer", "token"), ["8:00", "9:00", "10:00"], days=2)
+
+        # assert
+        self.assertEqual(len(reserved), 5)
+        self.assertEqual(delivery_window, reserved[4])
+
+    def test_schedule_raises_when_reservation_is_rejected(self):
+        # arrange
+        store = Store(mock.Mock())
+        reserved = []
+
+        def get_delivery_windows(delivery: Delivery, shipping_address: dict) -> list:
+            starts_at = delivery.date.replace(hour=8, minute=0, second=0, microsecond=0).isoformat()
+            return [{"canReserve": True, "deliveryWindow": {"startsAt": starts_at}}]
+
+        def reserve_delivery(delivery: Delivery, shipping_address: dict, delivery_window: dict):
+            reserved.append(delivery_window)
+            response = requests.Response()
+            response.status_code = 400
+            raise requests.HTTPError("400 Bad Request", response=response)
+
+        # act
+        with mock.patch.object(Delivery, "get_shipping_address", return_value={}), \
+                mock.patch.object(Delivery, "get_delivery_windows", autospec=True, side_effect=get_delivery_windows), \
+                mock.patch.object(Delivery, "reserve_delivery", autospec=True, side_effect=reserve_delivery), \
+                self.assertRaises(requests.HTTPError):
+            store.schedule(User("1", "Bearer", "token"), ["8:00"], days=2)
+
+        # assert
+        self.assertEqual(len(reserved), 1)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,36 @@
+import contextlib
+import io
+import json
+import unittest
+
+from grocery_shopping.tracing import Tracer
+
+
+class TestTracer(unittest.TestCase):
+    def test_nested_item_spans_are_counted_once(self):
+        # arrange
+        tracer = Tracer()
+        tracer.reset("shop")
+
+        # act
+        with tracer.span("item", "Mleko"):
+            with tracer.span("search", "Mleko"):
+                pass
+        tracer.count("search_cache.hits", 2)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tracer.emit()
+
+        # assert
+        self.assertEqual(list(tracer.items), ["Mleko"])
+        self.assertEqual(tracer.items["Mleko"], tracer.spans["item"].total)
+        record = json.loads(output.getvalue())
+        self.assertEqual(record["Function"], "shop")
+        self.assertEqual(record["search.count"], 1)
+        self.assertEqual(record["search_cache.hits"], 2)
+        metric_names = [metric["Name"] for metric in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+        self.assertIn("item.duration", metric_names)
+
+
+if __name__ == "__main__":
+    unittest.main()